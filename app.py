@@ -1,11 +1,15 @@
 import sys
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
 from frontend.video_display import YOLOApp  # Import the GUI application
+from backend.preload import preload_in_background
 
 def main():
     app = QApplication(sys.argv)
     window = YOLOApp()
     window.show()
+    # Warm torch/ultralytics/pandas once the event loop is running
+    QTimer.singleShot(0, preload_in_background)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+import numpy as np
+from backend.logger import get_logger
+from backend.paths import data_dir, video_slug
+
+log = get_logger("checkpoint")
+
+CHECKPOINT_VERSION = 4
+
+
+def checkpoint_path(video_path):
+    return os.path.join(data_dir("checkpoints"), video_slug(video_path) + ".ckpt.npz")
+
+
+def _video_key(video_path):
+    try:
+        stat = os.stat(video_path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    except OSError:
+        return np.zeros(2, dtype=np.int64)
+
+
+def _line_array(line_manager):
+    """Line geometry as a (segments, 5) array: line id, x1, y1, x2, y2 in normalized coordinates"""
+    geometry = line_manager.geometry
+    return np.column_stack([geometry.segment_ids.astype(np.float64), geometry.normalized])
+
+
+def _zone_array(line_manager):
+    """Zone geometry as a (vertices, 3) array: zone id, x, y in normalized coordinates"""
+    geometry = line_manager.zone_geometry
+    rows = [np.column_stack([np.full(len(geometry.points[z]), z), geometry.points[z]]) for z in geometry.ids]
+    return np.concatenate(rows).astype(np.float64) if rows else np.empty((0, 3), dtype=np.float64)
+
+
+def _ragged(lists, dtype):
+    """Flatten a list of lists into (values, offsets)"""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in lists])
+    values = np.fromiter((v for x in lists for v in x), dtype=dtype, count=int(offsets[-1]))
+    return values, offsets
+
+
+def save_checkpoint(video_path, line_manager, frame_index):
+    """Write counting state and frame position atomically as a compressed .npz"""
+    route_keys = list(line_manager.route_counts.keys())
+    routes = [line_manager.route_counts[k] for k in route_keys]
+    times, time_offsets = _ragged([r.get("times", []) for r in routes], np.float64)
+    classes, _ = _ragged([r.get("classes", []) for r in routes], np.int8)
+
+    track_ids = list(line_manager.track_history.keys())
+    tracks = [line_manager.track_history[t] for t in track_ids]
+    crossed, crossed_offsets = _ragged([t['crossed_lines'] for t in tracks], np.int32)
+    last_positions = np.array(
+        [t['last_position'] if t['last_position'] is not None else [np.nan] * 4 for t in tracks],
+        dtype=np.float32
+    ).reshape(-1, 4)
+
+    zones = [line_manager.zones[z] for z in line_manager.zone_geometry.ids]
+    dwell, dwell_offsets = _ragged([z['dwell_times'] for z in zones], np.float64)
+
+    state = {
+        "version": np.int32(CHECKPOINT_VERSION),
+        "video_key": _video_key(video_path),
+        "frame_index": np.int64(frame_index),
+        "fps": np.float64(line_manager.fps),
+        "lines": _line_array(line_manager),
+        "route_keys": np.array(route_keys, dtype=np.int32).reshape(-1, 2),
+        "counts": np.array([[r["counts"][c] for c in range(7)] for r in routes], dtype=np.int64).reshape(-1, 7),
+        "times": times,
+        "time_offsets": time_offsets,
+        "classes": classes,
+        "track_ids": np.array(track_ids, dtype=np.float64),
+        "counted": np.array([t['counted'] for t in tracks], dtype=bool),
+        "last_positions": last_positions,
+        "crossed": crossed,
+        "crossed_offsets": crossed_offsets,
+        "zones": _zone_array(line_manager),
+        "zone_entries": np.array([[z['entries'][c] for c in range(7)] for z in zones],
+                                 dtype=np.int64).reshape(-1, 7),
+        "zone_peak": np.array([z['peak'] for z in zones], dtype=np.int64),
+        "dwell": dwell,
+        "dwell_offsets": dwell_offsets,
+    }
+
+    path = checkpoint_path(video_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **state)
+    os.replace(tmp_path, path)
+    log.debug("Checkpoint at frame %d written to %s", frame_index, path)
+
+
+def checkpoint_frame(video_path):
+    """Frame index of this video's checkpoint, or None when there is none for this file as it is now"""
+    path = checkpoint_path(video_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if (int(data["version"]) != CHECKPOINT_VERSION
+                    or not np.array_equal(data["video_key"], _video_key(video_path))):
+                return None
+            return int(data["frame_index"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_checkpoint(video_path, line_manager):
+    """Restore state saved by save_checkpoint and return the frame index to seek to.
+
+    Returns None (leaving line_manager untouched) when there is no checkpoint or
+    it was taken for a different file, line layout or route set.
+    """
+    path = checkpoint_path(video_path)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            state = {k: data[k] for k in data.files}
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+        return None
+
+    route_keys = [tuple(int(v) for v in k) for k in state["route_keys"]]
+    if (int(state["version"]) != CHECKPOINT_VERSION
+            or not np.array_equal(state["video_key"], _video_key(video_path))
+            or not np.array_equal(state["lines"], _line_array(line_manager))
+            or not np.array_equal(state["zones"], _zone_array(line_manager))
+            or route_keys != list(line_manager.route_counts.keys())):
+        log.info("Checkpoint %s does not match the current video/lines/zones/routes; starting over", path)
+        return None
+
+    times, time_offsets, classes = state["times"], state["time_offsets"], state["classes"]
+    for i, key in enumerate(route_keys):
+        entry = line_manager.route_counts[key]
+        entry["counts"] = {c: int(state["counts"][i, c]) for c in range(7)}
+        lo, hi = time_offsets[i], time_offsets[i + 1]
+        if hi > lo:
+            entry["times"] = times[lo:hi].tolist()
+            entry["classes"] = classes[lo:hi].tolist()
+
+    crossed, crossed_offsets = state["crossed"], state["crossed_offsets"]
+    track_history = {}
+    for i, track_id in enumerate(state["track_ids"].tolist()):
+        position = state["last_positions"][i]
+        track_history[track_id] = {
+            'crossed_lines': crossed[crossed_offsets[i]:crossed_offsets[i + 1]].tolist(),
+            'last_position': None if np.isnan(position).any() else position.tolist(),
+            'counted': bool(state["counted"][i])
+        }
+
+    # Zone occupancy restarts empty: the tracks inside are re-found on the next frame
+    dwell, dwell_offsets = state["dwell"], state["dwell_offsets"]
+    for i, zone_id in enumerate(line_manager.zone_geometry.ids):
+        zone = line_manager.zones[zone_id]
+        zone['entries'] = {c: int(state["zone_entries"][i, c]) for c in range(7)}
+        zone['peak'] = int(state["zone_peak"][i])
+        zone['dwell_times'] = dwell[dwell_offsets[i]:dwell_offsets[i + 1]].tolist()
+
+    frame_index = int(state["frame_index"])
+    line_manager.rebuild_bins()
+    line_manager.restore_tracks(track_history)
+    line_manager.frame_count = frame_index
+    line_manager.fps = float(state["fps"])
+    log.info("Resuming %s from checkpoint at frame %d", video_path, frame_index)
+    return frame_index
+
+
+def clear_checkpoint(video_path):
+    path = checkpoint_path(video_path)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,304 @@
+"""Per-video (and per-camera) counting configuration: line geometry and routes.
+
+routes.json, version 2::
+
+    {
+        "version": 2,
+        "cameras": {"G23-north": {"lines": [...], "routes": [...]}},
+        "videos": {
+            "/data/G23/2024-05-01/13.mp4": {
+                "camera": "G23-north",
+                "lines": [{"id": 0, "start": [0.12, 0.50], "end": [0.48, 0.52]},
+                          {"id": 1, "start": [0.60, 0.20], "end": [0.70, 0.60],
+                           "points": [[0.60, 0.20], [0.66, 0.35], [0.70, 0.60]]}],
+                "zones": [{"id": 0, "name": "Queue N",
+                           "points": [[0.40, 0.10], [0.55, 0.10], [0.55, 0.40], [0.40, 0.40]]}],
+                "routes": [{"origin": 0, "destination": 1, "direction": "S - E",
+                            "start_time": "07:00:00 AM"}]
+            }
+        }
+    }
+
+Points are normalized to [0, 1] of the frame size, so one layout works at
+any resolution. An optional ``"inference": {"imgsz": 960, "target_fps": 15}``
+sets the model input size (an int, or ``"auto"`` to pick one from measured
+latency against ``target_fps``), usually once per camera; the same block
+takes the detection filter settings of backend.detection_filter. A line with ``points`` is a multi-segment gate (``start`` and
+``end`` are then its first and last point); zones are closed polygons. A
+video without its own lines, zones or routes inherits them from its camera.
+Videos are keyed by absolute path, so same-named files from different
+cameras or days keep separate entries. A bare file name key (all of
+version 1, ``{"13.mp4": [routes...]}``, and older version 2 files) still
+applies to every file of that name without an entry of its own; saving
+such a video copies the shared entry to its full path and leaves the
+shared one in place for the others. Version 1 files are read transparently
+and upgraded on the next save. Writes go to a temporary file that replaces
+the original atomically; parsed contents are cached in memory, shared by
+every ConfigStore of the same file and keyed by its mtime and size, so
+repeated and batch lookups skip JSON parsing and validation.
+"""
+import json
+import os
+import tempfile
+import threading
+from backend.detection_filter import class_id
+from backend.line_manager import parse_start_time
+from backend.logger import get_logger
+
+log = get_logger("config_store")
+
+CONFIG_VERSION = 2
+_parsed = {}  # Absolute path -> ((mtime_ns, size), normalized config), for every ConfigStore in the process
+
+
+class ConfigError(ValueError):
+    """Raised when routes.json content does not match the expected schema"""
+
+
+def _validate_points(points, minimum, what, where):
+    try:
+        ok = len(points) >= minimum and all(
+            len(p) == 2 and all(0.0 <= float(v) <= 1.0 for v in p) for p in points
+        )
+    except TypeError:
+        ok = False
+    if not ok:
+        raise ConfigError(f"{where}: {what} needs at least {minimum} normalized [x, y] points")
+
+
+def _validate_lines(lines, where):
+    ids = set()
+    for line in lines:
+        try:
+            line_id = int(line["id"])
+            points = line.get("points") or [line["start"], line["end"]]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ConfigError(f"{where}: malformed line {line!r}") from e
+        _validate_points(points, 2, f"line {line_id}", where)
+        if line_id in ids:
+            raise ConfigError(f"{where}: duplicate line id {line_id}")
+        ids.add(line_id)
+
+
+def _validate_zones(zones, where):
+    ids = set()
+    for zone in zones:
+        try:
+            zone_id = int(zone["id"])
+            points = zone["points"]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"{where}: malformed zone {zone!r}") from e
+        _validate_points(points, 3, f"zone {zone_id}", where)
+        if zone_id in ids:
+            raise ConfigError(f"{where}: duplicate zone id {zone_id}")
+        ids.add(zone_id)
+
+
+def _validate_inference(inference, where):
+    if not isinstance(inference, dict):
+        raise ConfigError(f"{where}: inference must be an object")
+    imgsz = inference.get("imgsz")
+    if imgsz not in (None, "auto") and not (isinstance(imgsz, int) and 32 <= imgsz <= 4096):
+        raise ConfigError(f"{where}: inference imgsz must be \"auto\" or a size in pixels, got {imgsz!r}")
+    target_fps = inference.get("target_fps")
+    if target_fps is not None and not (isinstance(target_fps, (int, float)) and target_fps > 0):
+        raise ConfigError(f"{where}: inference target_fps must be positive, got {target_fps!r}")
+    class_conf = inference.get("class_conf", {})
+    if not isinstance(class_conf, dict):
+        raise ConfigError(f"{where}: inference class_conf must map class names to confidences")
+    for name in class_conf:
+        try:
+            class_id(name)
+        except ValueError as e:
+            raise ConfigError(f"{where}: inference class_conf: {e}") from None
+    for name, floor in [("conf", inference.get("conf", 0.25))] + list(class_conf.items()):
+        if not (isinstance(floor, (int, float)) and 0 < floor <= 1):
+            raise ConfigError(f"{where}: inference confidence for {name} must be in (0, 1], got {floor!r}")
+    for key, low, high in (("min_area", 0, 1), ("iou", 0, 1)):
+        value = inference.get(key)
+        if value is not None and not (isinstance(value, (int, float)) and low <= value <= high):
+            raise ConfigError(f"{where}: inference {key} must be in [{low}, {high}], got {value!r}")
+    if not isinstance(inference.get("agnostic_nms", False), bool):
+        raise ConfigError(f"{where}: inference agnostic_nms must be true or false")
+    max_det = inference.get("max_det")
+    if max_det is not None and not (isinstance(max_det, int) and max_det > 0):
+        raise ConfigError(f"{where}: inference max_det must be a positive integer, got {max_det!r}")
+
+
+def _validate_routes(routes, where):
+    for route in routes:
+        try:
+            int(route["origin"]), int(route["destination"])
+            direction = route["direction"]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"{where}: malformed route {route!r}") from e
+        if not isinstance(direction, str) or not direction:
+            raise ConfigError(f"{where}: route {route!r} needs a direction")
+        start_time = route.get("start_time")
+        if start_time and parse_start_time(start_time) == 0 and not start_time.startswith("12:00:00 AM"):
+            raise ConfigError(f"{where}: start_time {start_time!r} is not HH:MM:SS AM/PM")
+
+
+def validate_entry(entry, where):
+    """Raise ConfigError unless a video or camera entry's lines, zones, routes and inference are well formed"""
+    _validate_lines(entry.get("lines", []), where)
+    _validate_zones(entry.get("zones", []), where)
+    _validate_routes(entry.get("routes", []), where)
+    _validate_inference(entry.get("inference", {}), where)
+
+
+def _normalize(data):
+    """Parse and validate raw JSON into {"cameras": {...}, "videos": {...}}"""
+    if not isinstance(data, dict):
+        raise ConfigError("routes.json must contain an object")
+
+    if "version" not in data:
+        # Version 1: basename -> list of routes, no geometry
+        data = {"version": CONFIG_VERSION, "cameras": {},
+                "videos": {name: {"routes": routes, "lines": []} for name, routes in data.items()}}
+    elif data["version"] != CONFIG_VERSION:
+        raise ConfigError(f"Unsupported routes.json version {data['version']}")
+
+    config = {"cameras": {}, "videos": {}}
+    for section in ("cameras", "videos"):
+        for name, entry in data.get(section, {}).items():
+            where = f"{section}/{name}"
+            entry = {"lines": entry.get("lines", []), "zones": entry.get("zones", []),
+                     "routes": entry.get("routes", []),
+                     **{k: v for k, v in entry.items() if k not in ("lines", "zones", "routes")}}
+            validate_entry(entry, where)
+            config[section][name] = entry
+    return config
+
+
+def video_key(video):
+    """routes.json key of a video: its absolute path"""
+    return os.path.abspath(video)
+
+
+def _video_entry(config, video):
+    """A video's own entry, else the entry shared by every file of its name (older files), else None"""
+    videos = config["videos"]
+    entry = videos.get(video_key(video))
+    return entry if entry is not None else videos.get(os.path.basename(video))
+
+
+class ConfigStore:
+    def __init__(self, path="routes.json"):
+        self.path = path
+        self._lock = threading.RLock()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """Return the parsed configuration, re-reading only when the file changed"""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp is None:
+                return {"cameras": {}, "videos": {}}
+            path = os.path.abspath(self.path)
+            cached = _parsed.get(path)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+
+            with open(self.path, "r") as f:
+                config = _normalize(json.load(f))
+            _parsed[path] = (stamp, config)
+            return config
+
+    def get(self, video):
+        """Effective entry for a video (camera defaults applied), or None"""
+        config = self.load()
+        entry = _video_entry(config, video)
+        if entry is None:
+            return None
+        camera = config["cameras"].get(entry.get("camera"), {})
+        return {**entry,
+                "lines": entry["lines"] or camera.get("lines", []),
+                "zones": entry.get("zones") or camera.get("zones", []),
+                "routes": entry["routes"] or camera.get("routes", []),
+                "inference": entry.get("inference") or camera.get("inference", {})}
+
+    def lookup_many(self, videos):
+        """Entries for many videos at once: {video: entry or None}"""
+        return {video: self.get(video) for video in videos}
+
+    def save(self, video, routes=None, lines=None, camera=None, zones=None, inference=None):
+        """Update one video's entry; arguments left as None keep their stored value"""
+        name = video_key(video)
+        with self._lock:  # Held from read to write so concurrent saves don't drop each other's changes
+            config = self.load()
+            entry = dict(_video_entry(config, video) or {"lines": [], "zones": [], "routes": []})
+            entry.setdefault("zones", [])
+            if routes is not None:
+                entry["routes"] = routes
+            if lines is not None:
+                entry["lines"] = lines
+            if zones is not None:
+                entry["zones"] = zones
+            if camera is not None:
+                entry["camera"] = camera
+            if inference is not None:
+                entry["inference"] = dict(entry.get("inference", {}), **inference)  # Keys not given are kept
+            validate_entry(entry, f"videos/{name}")
+
+            videos = dict(config["videos"], **{name: entry})
+            self._write({"version": CONFIG_VERSION, "cameras": config["cameras"], "videos": videos})
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=".routes-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            _parsed.pop(os.path.abspath(self.path), None)  # Next load() re-reads it
+
+
+def lines_to_config(line_manager):
+    """LineManager lines -> config entries (already normalized)"""
+    entries = []
+    for line_id, d in sorted(line_manager.lines.items()):
+        points = [[round(float(v), 6) for v in p] for p in d['points']]
+        entry = {"id": line_id, "start": points[0], "end": points[-1]}
+        if len(points) > 2:
+            entry["points"] = points
+        entries.append(entry)
+    return entries
+
+
+def apply_lines(line_manager, lines):
+    """Add normalized config lines to a LineManager; returns the added line dicts"""
+    added = []
+    for line in sorted(lines, key=lambda entry: entry["id"]):
+        line_manager.next_id = int(line["id"])
+        added.append(line_manager.add_normalized_polyline(line.get("points") or [line["start"], line["end"]]))
+    return added
+
+
+def zones_to_config(line_manager):
+    return [
+        {"id": zone_id, "name": z['name'], "points": [[round(float(v), 6) for v in p] for p in z['points']]}
+        for zone_id, z in sorted(line_manager.zones.items())
+    ]
+
+
+def apply_zones(line_manager, zones):
+    """Add normalized config zones to a LineManager; returns the added zone dicts"""
+    added = []
+    for zone in sorted(zones, key=lambda z: z["id"]):
+        line_manager.next_zone_id = int(zone["id"])
+        added.append(line_manager.add_normalized_zone(zone["points"], zone.get("name")))
+    return added
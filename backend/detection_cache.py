@@ -0,0 +1,185 @@
+"""Per-frame tracks cached on disk, so new lines or routes can be counted without inference.
+
+A finished run from the first frame writes every track the model and
+tracker produced to ``~/.abacus/detections/<video>-<model>-<tracker>.npz``:
+the video part is a hash of the file's content, the model part a hash of the
+weights, so renaming or moving either still hits the cache and re-encoding
+or retraining misses it. Columns are stored flat, one row per track box,
+with ``offsets`` into them per frame (CSR layout, as in
+backend.spatial_index). ``DetectionCache.replay`` feeds them back through
+``LineManager.count_tracks`` exactly as the run did, at thousands of
+frames per second.
+"""
+import hashlib
+import os
+import time
+import numpy as np
+from backend.logger import get_logger
+from backend.paths import data_dir, video_slug
+from backend.tracker import TRACK_ID, CONF, CLS
+
+log = get_logger("detection_cache")
+
+CACHE_VERSION = 1
+STOP_CHECK = 1000  # Frames between polls of a replay's stop callback
+_SAMPLE_BYTES = 1 << 20
+_model_hashes = {}  # (path, mtime, size) -> digest
+
+
+def video_fingerprint(video_path):
+    """Hash of the file size and 1 MiB from its start, middle and end (a full hash of hours of video is too slow)"""
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    with open(video_path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - _SAMPLE_BYTES // 2), max(0, size - _SAMPLE_BYTES)}):
+            f.seek(offset)
+            digest.update(f.read(_SAMPLE_BYTES))
+    return digest.hexdigest()[:16]
+
+
+def model_fingerprint(model_path):
+    """Hash of the weights file, computed once per process"""
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _model_hashes:
+        digest = hashlib.sha1()
+        with open(model_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 22), b""):
+                digest.update(block)
+        _model_hashes[key] = digest.hexdigest()[:12]
+    return _model_hashes[key]
+
+
+def cache_path(video_path, model_path, tracker):
+    name = f"{video_fingerprint(video_path)}-{model_fingerprint(model_path)}-{tracker}.npz"
+    return os.path.join(data_dir("detections"), name)
+
+
+class DetectionCache:
+    """Tracks of the inferred frames of one run, column by column"""
+    def __init__(self, frames, offsets, ids, cls, xyxy, conf, width, height, fps):
+        self.frames = frames    # (F,) int64 1-based frame indices, ascending
+        self.offsets = offsets  # (F + 1,) rows of frame i are offsets[i]:offsets[i + 1]
+        self.ids = ids          # (N,) int32 track IDs, -1 where the tracker gave none
+        self.cls = cls          # (N,) int8
+        self.xyxy = xyxy        # (N, 4) float32 pixels in the source frame
+        self.conf = conf        # (N,) float32
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.frames)
+
+    @classmethod
+    def load(cls, path):
+        """The cache at ``path``, or None when it is missing, unreadable or from another version"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != CACHE_VERSION:
+                    return None
+                return cls(data["frames"], data["offsets"], data["ids"], data["cls"], data["xyxy"],
+                           data["conf"], int(data["width"]), int(data["height"]), float(data["fps"]))
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Ignoring unreadable detection cache %s: %s", path, e)
+            return None
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=np.int32(CACHE_VERSION), frames=self.frames, offsets=self.offsets,
+                     ids=self.ids, cls=self.cls, xyxy=self.xyxy, conf=self.conf,
+                     width=np.int32(self.width), height=np.int32(self.height), fps=np.float64(self.fps))
+        os.replace(tmp_path, path)
+        log.info("Cached %d frames / %d tracks in %s", len(self.frames), len(self.ids), path)
+
+    def tracks(self, i):
+        """(N, 7) track array of the i-th cached frame, in backend.tracker's column layout"""
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        out = np.empty((hi - lo, 7), dtype=np.float32)
+        out[:, :4] = self.xyxy[lo:hi]
+        out[:, TRACK_ID] = self.ids[lo:hi]
+        out[:, CONF] = self.conf[lo:hi]
+        out[:, CLS] = self.cls[lo:hi]
+        return out
+
+    def replay(self, line_manager, stop=None):
+        """Count the cached run again with line_manager's current lines, zones and routes.
+
+        ``stop()``, if given, is polled every STOP_CHECK frames; once it returns
+        True the replay ends early, leaving partial counts. Returns the frames replayed.
+        """
+        line_manager.reset_counts()
+        line_manager.set_video_info(self.fps, int(self.frames[-1]) if len(self.frames) else 0)
+        shape = (self.height, self.width, 3)
+        row_frames = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        tracked = np.bincount(row_frames[self.ids >= 0], minlength=len(self))  # Tracked boxes per frame
+        for i, frame_index in enumerate(self.frames.tolist()):
+            if stop is not None and i % STOP_CHECK == 0 and stop():
+                return i
+            if tracked[i] or line_manager.zones:
+                line_manager.count_tracks(self.tracks(i), shape, frame_index)
+        line_manager.publish()
+        return len(self.frames)
+
+
+class DetectionRecorder:
+    """Collects the tracks of a run frame by frame and builds a DetectionCache from them"""
+    def __init__(self):
+        self.frames = []
+        self.tracks = []
+        self.width = self.height = 0
+
+    def append(self, frame_index, tracks, frame_shape):
+        self.height, self.width = frame_shape[:2]
+        self.frames.append(frame_index)
+        self.tracks.append(tracks)
+
+    def build(self, fps):
+        tracks = np.concatenate(self.tracks) if self.tracks else np.empty((0, 7), dtype=np.float32)
+        offsets = np.zeros(len(self.tracks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(t) for t in self.tracks])
+        return DetectionCache(
+            np.array(self.frames, dtype=np.int64), offsets,
+            tracks[:, TRACK_ID].astype(np.int32), tracks[:, CLS].astype(np.int8),
+            np.ascontiguousarray(tracks[:, :4], dtype=np.float32), tracks[:, CONF].astype(np.float32),
+            self.width, self.height, fps
+        )
+
+
+def find_cache(video_path, model_path, tracker):
+    """The DetectionCache for this video, weights and tracker, or None"""
+    try:
+        return DetectionCache.load(cache_path(video_path, model_path, tracker))
+    except OSError:
+        return None  # Stream, or video/weights not readable
+
+
+def recount(video_path, line_manager, model_path, tracker, event_store=None, cache=None, stop=None):
+    """Count a video again from its cache, recording events like a live run; returns False on a cache miss.
+
+    ``cache`` skips loading it again; ``stop`` is passed to DetectionCache.replay.
+    """
+    from backend.event_store import EventRecorder
+
+    cache = cache or find_cache(video_path, model_path, tracker)
+    if cache is None:
+        return False
+    recorder = None
+    if event_store is not None:
+        event_store.clear_video(video_slug(video_path))
+        recorder = EventRecorder(event_store, video_path, line_manager)
+        line_manager.event_listeners.append(recorder)
+    try:
+        started = time.perf_counter()
+        cache.replay(line_manager, stop)
+        elapsed = time.perf_counter() - started
+        log.info("Recounted %d cached frames of %s in %.2fs (%.0f fps)", len(cache),
+                 os.path.basename(video_path), elapsed, len(cache) / max(elapsed, 1e-9))
+    finally:
+        if recorder is not None:
+            recorder.flush()
+            line_manager.event_listeners.remove(recorder)
+    return True
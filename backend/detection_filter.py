@@ -0,0 +1,89 @@
+"""Detector output filtering: per-class confidence floors, a minimum box size and NMS settings.
+
+``DetectionFilter.options()`` goes to ultralytics' predict/track call (NMS
+IoU, class-agnostic NMS, maximum detections, and the lowest confidence floor
+as the model's own cut-off). ``keep()`` then drops boxes below their class's
+floor or smaller than ``min_area`` with a few operations on the result
+tensors, on the model's device, before anything is copied to the host.
+Dropped boxes never reach a tracker, so they cannot start ghost tracks:
+``model.track`` would only see the lowest floor, so a filter with
+``filters_boxes`` set swaps the default "ultralytics" tracker for the same
+BoT-SORT fed from predict (backend.tracker.create_tracker).
+
+Configured in routes.json next to the input size, usually per camera::
+
+    "inference": {"conf": 0.25, "class_conf": {"Motorbike": 0.4, "Bus": 0.5},
+                  "min_area": 0.0002, "iou": 0.6, "agnostic_nms": true, "max_det": 100}
+
+``min_area`` is a fraction of the frame area, so the setting holds at any
+resolution and input size.
+"""
+import numpy as np
+from backend.line_manager import CLASS_NAMES
+
+FILTER_KEYS = ("conf", "class_conf", "min_area", "iou", "agnostic_nms", "max_det")
+MAX_CLASSES = 256  # Floors are looked up by class ID; classes the table does not name get ``conf``
+
+
+def class_id(name):
+    """Class ID from a name in LineManager.class_names (or an ID, as int or string)"""
+    for cls, class_name in CLASS_NAMES.items():
+        if name == class_name:
+            return cls
+    try:
+        cls = int(name)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown vehicle class {name!r}, expected one of {list(CLASS_NAMES.values())}") from None
+    if not 0 <= cls < MAX_CLASSES:
+        raise ValueError(f"Class ID {cls} out of range")
+    return cls
+
+
+class DetectionFilter:
+    def __init__(self, conf=0.25, class_conf=None, min_area=0.0, iou=0.7, agnostic_nms=False, max_det=300):
+        self.floors = np.full(MAX_CLASSES, conf, dtype=np.float32)
+        for name, floor in (class_conf or {}).items():
+            self.floors[class_id(name)] = floor
+        self.conf = min([conf, *(class_conf or {}).values()])  # What the model itself cuts at
+        self.min_area = min_area
+        self.iou = iou
+        self.agnostic_nms = agnostic_nms
+        self.max_det = max_det
+        self._device_floors = {}  # The floors as a tensor, per device
+
+    @property
+    def filters_boxes(self):
+        """True if ``keep`` drops anything the model's own ``conf`` cut-off lets through"""
+        return bool(self.min_area) or bool((self.floors > self.conf).any())
+
+    @classmethod
+    def from_config(cls, inference):
+        """Filter for a routes.json "inference" block, or None if it sets none of FILTER_KEYS"""
+        settings = {key: inference[key] for key in FILTER_KEYS if key in (inference or {})}
+        return cls(**settings) if settings else None
+
+    def options(self):
+        """Keyword arguments for ultralytics' predict/track"""
+        return {"conf": self.conf, "iou": self.iou, "agnostic_nms": self.agnostic_nms,
+                "max_det": self.max_det}
+
+    def keep(self, xyxy, conf, cls, frame_area):
+        """Mask of the detections to keep, as a tensor on the detections' device (or a NumPy array).
+
+        ``frame_area`` is the area the boxes' frame covers in their own pixels
+        (for a letterboxed input, the scaled frame without its padding).
+        """
+        if hasattr(conf, "new_tensor"):
+            floors = self._device_floors.get(conf.device)
+            if floors is None:
+                floors = self._device_floors[conf.device] = conf.new_tensor(self.floors)
+            index = cls.long()
+        else:
+            floors, index = self.floors, np.asarray(cls).astype(np.int64)
+        mask = conf >= floors[index]
+        if self.min_area:
+            mask &= (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]) >= self.min_area * frame_area
+        return mask
+
+    def __getstate__(self):
+        return dict(self.__dict__, _device_floors={})  # Sent to the inference process before any use
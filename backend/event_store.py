@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from datetime import date
+from backend.logger import get_logger
+from backend.paths import data_dir, video_slug
+
+log = get_logger("event_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    video TEXT NOT NULL,         -- backend.paths.video_slug, so same-named files in other folders stay apart
+    day TEXT NOT NULL,           -- ISO date the footage was recorded (file mtime by default)
+    origin INTEGER NOT NULL,
+    destination INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    cls INTEGER NOT NULL,
+    t REAL NOT NULL,             -- Seconds from the start of the video
+    clock REAL NOT NULL,         -- Seconds since midnight: route start_time + t
+    frame INTEGER NOT NULL
+);
+-- Trailing columns make both indexes covering for interval_counts()
+CREATE INDEX IF NOT EXISTS idx_events_video_route_cls_clock
+    ON events (video, origin, destination, cls, clock, day, direction);
+CREATE INDEX IF NOT EXISTS idx_events_day_clock ON events (day, clock, direction, cls);
+"""
+
+
+def default_store_path():
+    return os.path.join(data_dir(), "events.sqlite3")
+
+
+class EventStore:
+    """SQLite log of every counted vehicle, indexed for interval queries.
+
+    One connection is shared between the processing thread (writes) and the
+    GUI (reads); WAL mode keeps readers from blocking the writer and a lock
+    serializes use of the connection itself.
+    """
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_events(self, rows):
+        """Insert (video, day, origin, destination, direction, cls, t, clock, frame) tuples"""
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO events (video, day, origin, destination, direction, cls, t, clock, frame) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def clear_video(self, video, after=None):
+        """Delete a video's events (only those later than ``after`` seconds, if given); ``video`` is its slug"""
+        query, params = "DELETE FROM events WHERE video = ?", [video]
+        if after is not None:
+            query += " AND t > ?"
+            params.append(after)
+        with self._lock, self._conn:
+            self._conn.execute(query, params)
+
+    def interval_counts(self, bin_seconds=900, video=None, day_from=None, day_to=None,
+                        clock_from=None, clock_to=None):
+        """Counts per (day, bin start, direction, class), ordered by time.
+
+        Bins are aligned to wall-clock time (``clock``), so 900 gives standard
+        15-minute turning-movement intervals.
+        """
+        conditions, params = [], [bin_seconds, bin_seconds]
+        for column, op, value in (("video", "=", video), ("day", ">=", day_from), ("day", "<=", day_to),
+                                  ("clock", ">=", clock_from), ("clock", "<", clock_to)):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = (
+            "SELECT day, CAST(clock / ? AS INTEGER) * ? AS bin_start, direction, cls, COUNT(*) "
+            f"FROM events {where} GROUP BY day, bin_start, direction, cls ORDER BY day, bin_start"
+        )
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def histogram(self, bin_seconds=900, video=None):
+        """Total vehicles per wall-clock bin as {bin_start_seconds: count}"""
+        totals = {}
+        for _, bin_start, _, _, count in self.interval_counts(bin_seconds, video=video):
+            totals[bin_start] = totals.get(bin_start, 0) + count
+        return totals
+
+
+class EventRecorder:
+    """LineManager event listener that buffers counted vehicles and writes them in batches"""
+    def __init__(self, store, video_path, line_manager, batch_size=200, flush_interval=10, day=None):
+        self.store = store
+        self.video = video_slug(video_path)
+        self.line_manager = line_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Video seconds; keeps GUI queries current on quiet scenes
+        self._last_flush = 0
+        if day is None:
+            try:
+                day = date.fromtimestamp(os.path.getmtime(video_path)).isoformat()
+            except OSError:
+                day = date.today().isoformat()
+        self.day = day
+        self._rows = []
+
+    def __call__(self, route_key, cls, time_sec, frame):
+        origin, destination = route_key
+        clock = self.line_manager.start_times.get(route_key, 0) + time_sec
+        direction = self.line_manager.route_counts[route_key]["direction"]
+        self._rows.append((self.video, self.day, origin, destination, direction, cls, time_sec, clock, frame))
+        if len(self._rows) >= self.batch_size or time_sec - self._last_flush >= self.flush_interval:
+            self._last_flush = time_sec
+            self.flush()
+
+    def flush(self):
+        rows, self._rows = self._rows, []
+        if not rows:
+            return
+        try:
+            self.store.add_events(rows)
+        except sqlite3.Error as e:
+            log.error("Could not write %d events: %s", len(rows), e)
@@ -0,0 +1,201 @@
+"""Shared-memory frame transport between the decoder and an inference process.
+
+``FrameRing`` is a fixed set of preallocated frame slots in one
+``multiprocessing.shared_memory`` block plus a queue of free slot indices.
+The decoder copies a frame into a free slot and sends only ``(slot, index)``
+to the consumer, which reads the slot in place and hands it back when done.
+A 1080p frame therefore costs one memcpy instead of a pickle, a pipe write
+and an unpickle.
+
+``InferenceWorker`` runs detection and tracking in a spawned child process
+fed through a ring. Frames are submitted as soon as they are decoded, so
+inference overlaps decoding and counting; results come back in order.
+"""
+import multiprocessing
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from backend.logger import get_logger
+
+log = get_logger("frame_ring")
+
+POLL_INTERVAL = 0.5  # Seconds between liveness checks while waiting on the inference process
+
+
+class FrameRing:
+    def __init__(self, slots, shape, dtype=np.uint8, context=None, _attach=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if _attach is None:
+            context = context or multiprocessing.get_context("spawn")
+            self.shm = shared_memory.SharedMemory(create=True, size=slot_bytes * slots)
+            self.free = context.Queue()
+            for slot in range(slots):
+                self.free.put(slot)
+            self.owner = True
+        else:
+            name, self.free = _attach
+            # Child processes share the creator's resource tracker, so attaching registers nothing new;
+            # only the creator unlinks
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.frames = np.ndarray((slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf)
+
+    def spec(self):
+        """Picklable description for ``FrameRing.attach`` in another process"""
+        return (self.shm.name, self.slots, self.shape, self.dtype.str, self.free)
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, shape, dtype, free = spec
+        return cls(slots, shape, dtype, _attach=(name, free))
+
+    def write(self, frame, timeout=None, alive=None):
+        """Copy a frame into a free slot (waiting for one if all are in use); returns the slot.
+
+        Frames smaller than a slot (e.g. letterboxed model inputs) occupy its
+        first bytes; read them back with ``view(slot, frame.shape)``. While
+        waiting, ``alive()`` is polled; once it returns False (the consumer
+        died holding the slots) the write raises RuntimeError.
+        """
+        if frame.dtype != self.dtype or frame.size > self.frames[0].size:
+            raise ValueError(f"Frame {frame.shape} {frame.dtype} does not fit the ring's {self.shape} slots")
+        if alive is None:
+            slot = self.free.get(timeout=timeout)
+        else:
+            slot = _get_while(self.free, alive, timeout)
+        np.copyto(self.view(slot, frame.shape), frame)
+        return slot
+
+    def view(self, slot, shape=None):
+        """Zero-copy, contiguous array for a slot; valid until the slot is released"""
+        if shape is None or tuple(shape) == self.shape:
+            return self.frames[slot]
+        return self.frames[slot].reshape(-1)[:int(np.prod(shape))].reshape(shape)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _get_while(source, alive, timeout=None):
+    """``source.get()``, polling ``alive()``; RuntimeError once it is False and nothing is left to get"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+        try:
+            return source.get(timeout=max(wait, 0))
+        except queue.Empty:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+            if not alive():
+                try:
+                    return source.get_nowait()  # Put just before it exited
+                except queue.Empty:
+                    raise RuntimeError("Inference process exited unexpectedly") from None
+
+
+def _inference_main(ring_spec, model_path, device, tracker_name, fps, requests, responses, verbose,
+                    detection_filter=None):
+    """Child process: (slot, index, shape, letterbox, probe) requests in, (index, tracks or error, seconds) out.
+
+    A probe only times detection (backend.tracker.detect_latency) and returns no tracks.
+    """
+    from backend.tracker import create_tracker, detect_latency, track_frame
+
+    ring = FrameRing.attach(ring_spec)
+    try:
+        from ultralytics import YOLO
+
+        model = YOLO(model_path).to(device)
+        tracker = create_tracker(tracker_name, frame_rate=fps, detection_filter=detection_filter)
+    except Exception:
+        responses.put((None, traceback.format_exc(), 0.0))
+        ring.close()
+        return
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        slot, index, shape, letterbox, probe = request
+        try:
+            if probe:
+                responses.put((index, None, detect_latency(model, ring.view(slot, shape), device, letterbox,
+                                                           detection_filter)))
+                continue
+            started = time.perf_counter()
+            tracks = track_frame(model, tracker, ring.view(slot, shape), device, verbose, letterbox,
+                                 detection_filter)
+            responses.put((index, tracks, time.perf_counter() - started))
+        except Exception:
+            responses.put((index, traceback.format_exc(), 0.0))
+        finally:
+            ring.release(slot)
+    ring.close()
+
+
+class InferenceWorker:
+    """Detection + tracking in a child process; ``submit`` frames, then collect ``result`` in order"""
+    def __init__(self, shape, model_path, device, tracker="ultralytics", fps=30, slots=8, verbose=False,
+                 detection_filter=None):
+        context = multiprocessing.get_context("spawn")  # No CUDA/Qt state inherited
+        self.ring = FrameRing(slots, shape, context=context)
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.process = context.Process(
+            target=_inference_main, name="inference",
+            args=(self.ring.spec(), model_path, device, tracker, fps, self.requests, self.responses, verbose,
+                  detection_filter),
+            daemon=True
+        )
+        self.process.start()
+
+    def submit(self, index, frame, letterbox=None):
+        """Queue a frame; ``letterbox`` (backend.letterbox.LetterboxParams) marks a letterboxed model input"""
+        self.requests.put((self.ring.write(frame, alive=self.process.is_alive), index, frame.shape, letterbox,
+                           False))
+
+    def probe(self, frame, letterbox=None):
+        """Seconds the child takes to detect (not track) ``frame``; call before any frame is submitted"""
+        self.requests.put((self.ring.write(frame, alive=self.process.is_alive), -1, frame.shape, letterbox, True))
+        return self.result(-1)[1]
+
+    def result(self, index):
+        """(tracks, inference seconds) for frame ``index``, collected in the order frames were submitted.
+
+        Raises RuntimeError if the child fails or dies (OOM, crash) instead of waiting forever.
+        """
+        try:
+            got, tracks, seconds = _get_while(self.responses, self.process.is_alive)
+        except RuntimeError:
+            raise RuntimeError(f"Inference process exited unexpectedly (exit code {self.process.exitcode}) "
+                               f"before frame {index}") from None
+        if isinstance(tracks, str):
+            raise RuntimeError(f"Inference process failed on frame {got}:\n{tracks}")
+        if got != index:
+            raise RuntimeError(f"Inference results out of order: expected frame {index}, got {got}")
+        return tracks, seconds
+
+    def close(self, timeout=10):
+        """Stop the child after the frames already submitted; their results are discarded"""
+        self.requests.put(None)
+        deadline = time.monotonic() + timeout
+        while self.process.is_alive() and time.monotonic() < deadline:
+            try:
+                self.responses.get(timeout=0.1)  # The child can't exit while its results are unread
+            except queue.Empty:
+                pass
+        if self.process.is_alive():
+            log.warning("Inference process did not exit, terminating it")
+            self.process.terminate()
+        self.ring.close()
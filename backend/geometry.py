@@ -0,0 +1,148 @@
+import numpy as np
+
+
+def _as_points(points):
+    return np.clip(np.asarray(points, dtype=np.float64).reshape(-1, 2), 0.0, 1.0)
+
+
+class LineGeometry:
+    """Counting gates in normalized [0, 1] frame coordinates.
+
+    This is the single place where gate coordinates change scale. A gate is
+    a polyline (a straight line is the two-point case) and is stored as its
+    segments: ``normalized`` is (S, 4) x1, y1, x2, y2 and ``segment_ids``
+    names the gate each row belongs to. ``pixels(width, height)`` returns
+    the segments for a given frame size, computed on first use and cached
+    until the gates change, so display, inference and recording can each
+    run at their own resolution against the same geometry.
+    """
+    def __init__(self):
+        self.ids = []
+        self.points = {}
+        self.normalized = np.empty((0, 4), dtype=np.float64)
+        self.segment_ids = np.empty(0, dtype=np.int64)
+        self.version = 0
+        self._pixel_cache = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, line_id, points):
+        """Add a gate from two or more normalized (x, y) points"""
+        points = _as_points(points)
+        if len(points) < 2:
+            raise ValueError("A line needs at least two points")
+        self.ids.append(line_id)
+        self.points[line_id] = points
+        self.normalized = np.concatenate([self.normalized, np.hstack([points[:-1], points[1:]])])
+        self.segment_ids = np.concatenate([self.segment_ids, np.full(len(points) - 1, line_id)])
+        self._changed()
+
+    def clear(self):
+        self.ids = []
+        self.points = {}
+        self.normalized = np.empty((0, 4), dtype=np.float64)
+        self.segment_ids = np.empty(0, dtype=np.int64)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._pixel_cache.clear()
+
+    def pixels(self, width, height):
+        """(S, 4) segment x1, y1, x2, y2 in pixels of a width x height frame (cached, do not modify)"""
+        key = (int(width), int(height))
+        cached = self._pixel_cache.get(key)
+        if cached is None:
+            cached = self.normalized * np.array([width, height, width, height], dtype=np.float64)
+            cached.setflags(write=False)
+            self._pixel_cache[key] = cached
+        return cached
+
+
+class ZoneGeometry:
+    """Polygon zones in normalized coordinates, with per-resolution edge arrays.
+
+    Edges of all zones are stored back to back (zone ``i`` owns rows
+    ``offsets[i]:offsets[i + 1]``) so one vectorized pass tests every point
+    against every zone; see ``contains``.
+    """
+    def __init__(self):
+        self.ids = []
+        self.points = {}
+        self.edges = np.empty((0, 4), dtype=np.float64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.bboxes = np.empty((0, 4), dtype=np.float64)
+        self.version = 0
+        self._pixel_cache = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, zone_id, points):
+        """Add a zone from three or more normalized (x, y) vertices (closed implicitly)"""
+        points = _as_points(points)
+        if len(points) < 3:
+            raise ValueError("A zone needs at least three points")
+        self.ids.append(zone_id)
+        self.points[zone_id] = points
+        self.edges = np.concatenate([self.edges, np.hstack([points, np.roll(points, -1, axis=0)])])
+        self.offsets = np.append(self.offsets, len(self.edges))
+        bbox = np.concatenate([points.min(axis=0), points.max(axis=0)])[None]
+        self.bboxes = np.concatenate([self.bboxes, bbox])
+        self._changed()
+
+    def clear(self):
+        self.ids = []
+        self.points = {}
+        self.edges = np.empty((0, 4), dtype=np.float64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.bboxes = np.empty((0, 4), dtype=np.float64)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._pixel_cache.clear()
+
+    def pixels(self, width, height):
+        """(edges, bboxes) in pixels of a width x height frame (cached, do not modify)"""
+        key = (int(width), int(height))
+        cached = self._pixel_cache.get(key)
+        if cached is None:
+            scale = np.array([width, height, width, height], dtype=np.float64)
+            cached = (self.edges * scale, self.bboxes * scale)
+            for array in cached:
+                array.setflags(write=False)
+            self._pixel_cache[key] = cached
+        return cached
+
+    def contains(self, points, width, height):
+        """(P, Z) bool: whether each (x, y) pixel point lies inside each zone"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        inside = np.zeros((len(points), len(self.ids)), dtype=bool)
+        if not len(points) or not self.ids:
+            return inside
+
+        edges, bboxes = self.pixels(width, height)
+        x, y = points[:, 0:1], points[:, 1:2]
+        in_box = (x >= bboxes[:, 0]) & (x <= bboxes[:, 2]) & (y >= bboxes[:, 1]) & (y <= bboxes[:, 3])
+        candidates = np.flatnonzero(in_box.any(axis=1))
+        if not candidates.size:
+            return inside
+
+        # Even-odd rule: count edges crossed by a ray from each point towards +x
+        x, y = x[candidates], y[candidates]
+        x1, y1, x2, y2 = edges.T
+        dy = y2 - y1
+        straddles = (y1 > y) != (y2 > y)
+        x_at_y = x1 + (x2 - x1) * (y - y1) / np.where(dy == 0, 1.0, dy)
+        crossings = (straddles & (x < x_at_y)).astype(np.int32)
+        parity = np.add.reduceat(crossings, self.offsets[:-1], axis=1) & 1
+        inside[candidates] = parity.astype(bool) & in_box[candidates]
+        return inside
+
+
+def normalize_point(point, width, height):
+    """QPoint or (x, y) in pixels of a width x height frame -> normalized (x, y)"""
+    x, y = (point.x(), point.y()) if hasattr(point, "x") and callable(point.x) else point
+    return x / width, y / height
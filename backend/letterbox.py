@@ -0,0 +1,209 @@
+"""Model input sizing: letterbox frames once, in the decoder stage, into reused buffers.
+
+Ultralytics letterboxes every frame inside ``predict``/``track``. Doing it
+here instead means the decoder thread resizes each frame straight into a
+preallocated, stride-aligned canvas (``cv2.resize`` with ``dst``), so the
+inference call gets an input it does not need to resize. Boxes come back in
+canvas pixels and ``unletterbox`` maps them to the source frame, where
+``LineManager`` scales its normalized lines to meet them.
+
+``ModelInput`` holds either a fixed size or, with ``imgsz="auto"``, a
+``SizeLadder`` that settles on the largest size that keeps up with a target
+frame rate. The ladder is timed on the first frame with detection only,
+before anything is tracked or counted: trackers work in model-input pixels,
+so a size change mid-run would move every box under them. The size it
+settles on is remembered per video resolution, device and target frame rate
+in ``~/.abacus/input_sizes.json``, so later runs skip the timing (delete
+the file to time again, e.g. after a hardware change).
+"""
+import json
+import math
+import os
+import tempfile
+from collections import namedtuple
+import cv2
+import numpy as np
+from backend.logger import get_logger
+from backend.paths import APP_DIR
+
+log = get_logger("letterbox")
+
+STRIDE = 32
+PAD_VALUE = 114  # Ultralytics' letterbox grey
+IMGSZ_LADDER = (1280, 960, 640, 480, 320)
+SIZES_FILE = "input_sizes.json"
+
+# Picklable letterbox geometry: offset of the scaled frame in the canvas, scale, source frame size
+LetterboxParams = namedtuple("LetterboxParams", "left top scale width height")
+
+
+def unletterbox(xyxy, params):
+    """Canvas-pixel boxes -> source-frame pixels, clipped to the frame (returns a new array)"""
+    out = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4) - [params.left, params.top, params.left, params.top]
+    out /= params.scale
+    np.clip(out[:, 0::2], 0, params.width, out=out[:, 0::2])
+    np.clip(out[:, 1::2], 0, params.height, out=out[:, 1::2])
+    return out
+
+
+class Letterbox:
+    """Scales frames of one size into a ring of reused canvases, keeping the aspect ratio"""
+    def __init__(self, imgsz, width, height, buffers=12, stride=STRIDE):
+        scale = imgsz / max(width, height)
+        new_w, new_h = round(width * scale), round(height * scale)
+        canvas_w = math.ceil(new_w / stride) * stride  # Minimal padding, as ultralytics' rect inference
+        canvas_h = math.ceil(new_h / stride) * stride
+        left, top = (canvas_w - new_w) // 2, (canvas_h - new_h) // 2
+        self.imgsz = imgsz
+        self.shape = (canvas_h, canvas_w)
+        self.params = LetterboxParams(left, top, scale, width, height)
+        self._size = (new_w, new_h)
+        self._roi = (slice(top, top + new_h), slice(left, left + new_w))
+        # Frames in flight (decoder queue + stage + the one being written) must stay below ``buffers``
+        self._buffers = np.full((buffers, canvas_h, canvas_w, 3), PAD_VALUE, dtype=np.uint8)
+        self._next = 0
+
+    def apply(self, frame):
+        """Letterboxed copy of ``frame`` in the next canvas; the padding is never rewritten"""
+        canvas = self._buffers[self._next]
+        self._next = (self._next + 1) % len(self._buffers)
+        roi = canvas[self._roi]
+        out = cv2.resize(frame, self._size, dst=roi, interpolation=cv2.INTER_LINEAR)
+        if out is not roi:
+            roi[:] = out
+        return canvas
+
+
+class SizeLadder:
+    """Steps down a ladder of input sizes until inference keeps up with ``target_fps``.
+
+    Each rung is timed over ``window`` inferences (after ``warmup`` ones,
+    which include one-off kernel selection). The first rung whose mean
+    latency fits the frame budget is kept for the rest of the run.
+    """
+    def __init__(self, target_fps, sizes=IMGSZ_LADDER, window=5, warmup=2):
+        self.budget = 1.0 / target_fps
+        self.sizes = sorted(sizes, reverse=True)
+        self.window = window
+        self.warmup = warmup
+        self.rung = 0
+        self.settled = len(self.sizes) == 1
+        self._samples = []
+
+    @property
+    def imgsz(self):
+        return self.sizes[self.rung]
+
+    def settle_at(self, imgsz):
+        """Skip the timing and use ``imgsz``; returns False if it is not on the ladder"""
+        if imgsz not in self.sizes:
+            return False
+        self.rung = self.sizes.index(imgsz)
+        self.settled = True
+        self._samples = []
+        return True
+
+    def record(self, seconds):
+        """Add one inference latency; returns True when the size changes"""
+        if self.settled:
+            return False
+        self._samples.append(seconds)
+        if len(self._samples) < self.warmup + self.window:
+            return False
+        latency = float(np.mean(self._samples[self.warmup:]))
+        self._samples = []
+        if latency <= self.budget or self.rung == len(self.sizes) - 1:
+            self.settled = True
+            log.info("Inference size %d settled: %.1f ms per frame against a %.1f ms budget",
+                     self.imgsz, latency * 1000, self.budget * 1000)
+            return False
+        self.rung += 1
+        log.info("Inference at %.1f ms exceeds the %.1f ms budget; trying size %d",
+                 latency * 1000, self.budget * 1000, self.imgsz)
+        return True
+
+
+def _sizes_path():
+    return os.path.join(APP_DIR, SIZES_FILE)
+
+
+def _load_sizes():
+    try:
+        with open(_sizes_path()) as f:
+            sizes = json.load(f)
+        return sizes if isinstance(sizes, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def remembered_size(key):
+    """Input size an earlier "auto" run settled on for ``key``, or None"""
+    return _load_sizes().get(key)
+
+
+def remember_size(key, imgsz):
+    sizes = _load_sizes()
+    sizes[key] = imgsz
+    os.makedirs(APP_DIR, exist_ok=True)
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".input-sizes-", suffix=".json", dir=APP_DIR)
+        with os.fdopen(fd, "w") as f:
+            json.dump(sizes, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, _sizes_path())
+    except OSError as e:
+        log.warning("Could not remember input size %s for %s: %s", imgsz, key, e)
+
+
+class ModelInput:
+    """Prepares frames for the model at a fixed size, an auto-tuned size, or untouched (``imgsz=None``)"""
+    def __init__(self, imgsz=None, target_fps=None, buffers=12, device=None):
+        self.ladder = None
+        if imgsz == "auto":
+            self.ladder = SizeLadder(target_fps or 15)
+            imgsz = self.ladder.imgsz
+        self.imgsz = imgsz
+        self.buffers = buffers
+        self.device = device  # Part of the key an "auto" size is remembered under; None: always time
+        self._letterbox = None
+
+    def size_key(self, width, height):
+        """Key of a settled "auto" size in SIZES_FILE"""
+        return f"{width}x{height}@{self.device}@{1 / self.ladder.budget:g}fps"
+
+    def max_shape(self, width, height):
+        """Largest (h, w, 3) array ``prepare`` can return for frames of this size"""
+        sizes = self.ladder.sizes if self.ladder is not None else [self.imgsz]
+        if sizes == [None]:
+            return (height, width, 3)
+        return max((Letterbox(s, width, height, buffers=1).shape + (3,) for s in sizes),
+                   key=lambda shape: shape[0] * shape[1])
+
+    def prepare(self, frame):
+        """Decoder thread: (model input, LetterboxParams or None) for one frame"""
+        if self.imgsz is None:
+            return frame, None
+        height, width = frame.shape[:2]
+        letterbox = self._letterbox
+        if letterbox is None or letterbox.imgsz != self.imgsz or letterbox.params[3:] != (width, height):
+            letterbox = self._letterbox = Letterbox(self.imgsz, width, height, self.buffers)
+        return letterbox.apply(frame), letterbox.params
+
+    def calibrate(self, frame, infer):
+        """Settle an "auto" size before the run tracks anything.
+
+        ``infer(model input, LetterboxParams)`` detects without tracking and
+        returns its latency; it is called on ``frame`` at each rung until the
+        ladder settles. Returns at once for a fixed size or a settled ladder.
+        """
+        if self.ladder is None or self.ladder.settled:
+            return
+        key = self.size_key(frame.shape[1], frame.shape[0]) if self.device is not None else None
+        if key is not None and self.ladder.settle_at(remembered_size(key)):
+            self.imgsz = self.ladder.imgsz
+            log.info("Inference size %d remembered for %s", self.imgsz, key)
+            return
+        while not self.ladder.settled:
+            self.ladder.record(infer(*self.prepare(frame)))
+            self.imgsz = self.ladder.imgsz
+        if key is not None:
+            remember_size(key, self.imgsz)
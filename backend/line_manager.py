@@ -1,148 +1,455 @@
-import pandas as pd
+import logging
+import math
+import threading
+from collections import deque, namedtuple
+from datetime import datetime
+import numpy as np
+from backend.geometry import LineGeometry, ZoneGeometry, normalize_point
+from backend.logger import get_logger
+from backend.spatial_index import SegmentGrid
+from backend.tracker import TRACK_ID, CONF, CLS
+
+log = get_logger("line_manager")
+
+CROSSING_DISTANCE = 15  # Pixels between a track center and a line for it to count as crossing
+
+CLASS_NAMES = {
+    0: "Passenger Car", 1: "Motorbike", 2: "Van",
+    3: "Truck", 4: "Large Truck", 5: "Bus", 6: "Minibus"
+}
+
+# Published copy of the counting state; never mutated once published, so any thread may read it.
+# routes: {route_key: {"direction", "counts"}}, zones: {zone_id: {"name", "occupancy", "peak", "entries"}}
+CountSnapshot = namedtuple("CountSnapshot", "version frame routes zones")
+
+
+def parse_start_time(text):
+    """Seconds since midnight for a routes.json start time ("HH:MM:SS AM/PM"); 0 if missing or invalid"""
+    try:
+        parsed = datetime.strptime((text or "").strip(), "%I:%M:%S %p")
+    except ValueError:
+        return 0
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def _iou(a, b):
+    """Intersection over union of two x1, y1, x2, y2 boxes"""
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
 class LineManager:
+    """Lines, zones and routes, and the counts of vehicles moving between them.
+
+    One thread writes the counting state: the counting stage during a run,
+    whoever holds the manager otherwise. Other threads read
+    ``snapshot``, which the writer replaces (never modifies) with
+    ``publish()``, and change lines, zones or routes through ``edit()``,
+    which defers the change to the next frame boundary while a run is on.
+    """
     def __init__(self):
         self.lines = {}
+        self.geometry = LineGeometry()  # Normalized line segments + per-resolution pixel arrays
         self.next_id = 0
+        self.zones = {}  # Polygon zones: occupancy (queue length), entries and dwell times
+        self.zone_geometry = ZoneGeometry()
+        self.next_zone_id = 0
+        self._grid = None
+        self._grid_key = None
         self.counts = {i: 0 for i in range(7)}
-        self.reference_width = 256 
+        # Size of the pixel space add_line() receives points in (the original video)
+        self.reference_width = 256
         self.reference_height = 416
         self.track_history = {}
+        self.orphan_tracks = {}  # Restored from a checkpoint, waiting for new track IDs
         self.routes = []
         self.route_counts = {}
-        self.class_names = {
-            0: "Passenger Car", 1: "Motorbike", 2: "Van",
-            3: "Truck", 4: "Large Truck", 5: "Bus", 6: "Minibus"
-        }
+        self.class_names = dict(CLASS_NAMES)
         
         #######################################################
         self.frame_count = 0
         self.fps = 30  # Will be updated when video is loaded
         self.start_times = {}  # Track start times for each route
+        self.event_listeners = []  # Called as listener(route_key, cls, time_sec, frame) per counted vehicle
+
+        # Online interval aggregates: bin_counts[route row, class, bin] where bin
+        # = wall-clock seconds since midnight // bin_seconds (may pass one day)
+        self.bin_seconds = 900
+        self.route_index = {}
+        self.bin_counts = np.zeros((0, 7, 0), dtype=np.int32)
+
+        self.snapshot = CountSnapshot(0, 0, {}, {})
+        self._changed = True  # Counting state differs from the snapshot
+        self._edits = deque()
+        self._edit_lock = threading.Lock()
+        self._running = False
         
     def set_video_info(self, fps, total_frames):
         self.fps = fps
         self.total_frames = total_frames
         
     #############################################################    
+    @property
+    def version(self):
+        """Changes on every line or zone edit so cached overlays and masks know to rebuild"""
+        return self.geometry.version + self.zone_geometry.version
+
+    def begin_run(self):
+        """From now on the calling thread is the only writer; edit() queues changes for it"""
+        with self._edit_lock:
+            self._running = True
+
+    def end_run(self):
+        """Apply any edits still queued and publish; edit() applies changes at once again"""
+        with self._edit_lock:
+            self._running = False
+            self._apply_edits()
+        return self.publish()
+
+    def edit(self, fn, *args):
+        """Call ``fn(*args)`` (e.g. ``self.add_line``) now, or at the next frame boundary during a run.
+
+        Returns ``fn``'s result, or None when the edit was queued.
+        """
+        with self._edit_lock:
+            if self._running:
+                self._edits.append((fn, args))
+                return None
+            result = fn(*args)
+            self.publish()
+        return result
+
+    def apply_edits(self):
+        """Writer, between frames: apply the queued edits; True if there were any"""
+        if not self._edits:  # No lock on the common path
+            return False
+        with self._edit_lock:
+            return self._apply_edits()
+
+    def _apply_edits(self):
+        applied = bool(self._edits)
+        while self._edits:
+            fn, args = self._edits.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                log.exception("Edit %s failed", getattr(fn, "__name__", fn))
+        self._changed = self._changed or applied
+        return applied
+
+    def publish(self, force=False):
+        """Writer: replace ``snapshot`` with a copy of the current counts if they changed"""
+        if not (self._changed or force):
+            return self.snapshot
+        routes = {key: {"direction": data["direction"], "counts": dict(data["counts"])}
+                  for key, data in self.route_counts.items()}
+        zones = {zone_id: {"name": zone["name"], "occupancy": zone["occupancy"], "peak": zone["peak"],
+                           "entries": dict(zone["entries"])}
+                 for zone_id, zone in self.zones.items()}
+        self._changed = False
+        self.snapshot = CountSnapshot(self.snapshot.version + 1, self.frame_count, routes, zones)
+        return self.snapshot
+
     def set_reference_size(self, width, height):
         self.reference_width = width
         self.reference_height = height
 
+    def _normalize(self, points):
+        return [normalize_point(p, self.reference_width, self.reference_height) for p in points]
+
     def add_line(self, start, end):
+        """Add a line from QPoints or (x, y) in reference (original video) pixels"""
+        return self.add_normalized_polyline(self._normalize([start, end]))
+
+    def add_polyline(self, points):
+        """Add a multi-segment gate; crossing any of its segments crosses the gate"""
+        return self.add_normalized_polyline(self._normalize(points))
+
+    def add_normalized_line(self, start, end):
+        """Add a line from (x, y) points in [0, 1] frame coordinates"""
+        return self.add_normalized_polyline([start, end])
+
+    def add_normalized_polyline(self, points):
         line_id = self.next_id
+        self.geometry.add(line_id, points)
+        points = [tuple(p) for p in self.geometry.points[line_id].tolist()]
         self.lines[line_id] = {
             'id': line_id,
-            'start': start,
-            'end': end,
+            'start': points[0],
+            'end': points[-1],
+            'points': points,
             'counted_objects': set()
         }
         self.next_id += 1
+        self._changed = True
         return self.lines[line_id]
+
+    def add_zone(self, points, name=None):
+        """Add a polygon zone from QPoints or (x, y) in reference pixels"""
+        return self.add_normalized_zone(self._normalize(points), name)
+
+    def add_normalized_zone(self, points, name=None):
+        zone_id = self.next_zone_id
+        self.zone_geometry.add(zone_id, points)
+        self.zones[zone_id] = {
+            'id': zone_id,
+            'name': name or f"Zone {zone_id}",
+            'points': [tuple(p) for p in self.zone_geometry.points[zone_id].tolist()],
+            'occupancy': 0,                          # Tracks inside right now (queue length)
+            'peak': 0,
+            'entries': {cls: 0 for cls in range(7)},
+            'dwell_times': [],                       # Seconds spent inside, per track that left
+            'inside': {}                             # track_id -> time it entered
+        }
+        self.next_zone_id += 1
+        self._changed = True
+        return self.zones[zone_id]
+
+    def line_pixels(self, width, height):
+        """(segments, 4) x1, y1, x2, y2 at a frame size; ``geometry.segment_ids`` names their lines"""
+        return self.geometry.pixels(width, height)
     
     def load_routes(self, routes):
-        """Initialize counts for each class in each direction"""
-        self.routes = routes
+        """Initialize counts for each class in each direction (keeps its own copy of the list)"""
+        self.routes = list(routes)
         self.route_counts = {
             (r["origin"], r["destination"]): {
                 "direction": r["direction"],
                 "counts": {cls: 0 for cls in range(7)}  # Counts per class
             } for r in routes
         }
+        self.start_times = {
+            (r["origin"], r["destination"]): parse_start_time(r.get("start_time")) for r in routes
+        }
+        self.route_index = {key: row for row, key in enumerate(self.route_counts)}
+        self.bin_counts = np.zeros((len(self.route_index), 7, math.ceil(86400 / self.bin_seconds)),
+                                   dtype=np.int32)
+        self._changed = True
+
+    def configure_bins(self, bin_seconds):
+        """Change the aggregation interval, re-binning any events already counted"""
+        self.bin_seconds = bin_seconds
+        self.rebuild_bins()
+
+    def rebuild_bins(self):
+        """Recompute bin_counts from the per-route event times (after a restore or merge)"""
+        self.route_index = {key: row for row, key in enumerate(self.route_counts)}
+        self.bin_counts = np.zeros((len(self.route_index), 7, math.ceil(86400 / self.bin_seconds)),
+                                   dtype=np.int32)
+        for key, data in self.route_counts.items():
+            for time_sec, cls in zip(data.get("times", []), data.get("classes", [])):
+                self._add_to_bin(key, cls, time_sec)
+        self._changed = True
+
+    def _add_to_bin(self, route_key, cls, time_sec):
+        column = int((self.start_times.get(route_key, 0) + time_sec) // self.bin_seconds)
+        if column >= self.bin_counts.shape[2]:
+            grown = np.zeros(self.bin_counts.shape[:2] + (max(column + 1, 2 * self.bin_counts.shape[2]),),
+                             dtype=self.bin_counts.dtype)
+            grown[:, :, :self.bin_counts.shape[2]] = self.bin_counts
+            self.bin_counts = grown
+        self.bin_counts[self.route_index[route_key], int(cls), column] += 1
+
+    def interval_table(self):
+        """Non-empty bins as (bin_start_seconds, route_key, direction, per-class counts), in time order"""
+        keys = list(self.route_index)
+        rows, columns = np.nonzero(self.bin_counts.sum(axis=1))
+        order = np.lexsort((rows, columns))
+        return [
+            (int(columns[i]) * self.bin_seconds, keys[rows[i]],
+             self.route_counts[keys[rows[i]]]["direction"], self.bin_counts[rows[i], :, columns[i]].tolist())
+            for i in order
+        ]
         
     def reset(self):
         """Reset all state for new video"""
         self.lines.clear()
+        self.geometry.clear()
         self.next_id = 0
+        self.zones.clear()
+        self.zone_geometry.clear()
+        self.next_zone_id = 0
         self.route_counts.clear()
         self.track_history.clear()
+        self.orphan_tracks.clear()
         self.routes.clear()
+        self.start_times.clear()
+        self.route_index.clear()
+        self.bin_counts = np.zeros((0, 7, 0), dtype=np.int32)
+        self.frame_count = 0
         self.reference_width = 256
         self.reference_height = 416
+        self._changed = True
 
-    
-    def check_line_crossing(self, detections, frame_shape):
-        self.frame_count += 1
-        
-        # Clear previous tracking data for new detections
-        current_ids = {det['id'] for det in detections if det['id'] is not None}
-        self.track_history = {k: v for k, v in self.track_history.items() if k in current_ids}
-
-        # First pass: Update tracking history
-        for det in detections:
-            track_id = det['id']
-            if track_id is None:
+    def reset_counts(self):
+        """Zero counts, tracks and zone statistics, keeping lines, zones and routes (to count a video again)"""
+        self.load_routes(self.routes)
+        self.track_history.clear()
+        self.orphan_tracks.clear()
+        self.frame_count = 0
+        for zone in self.zones.values():
+            zone.update(occupancy=0, peak=0, entries={cls: 0 for cls in range(7)}, dwell_times=[], inside={})
+
+    def restore_tracks(self, track_history):
+        """Load track state from a checkpoint.
+
+        The tracker restarts with fresh IDs after a resume, so the saved tracks
+        are matched to the new IDs by box overlap on the next counted frame.
+        """
+        self.track_history = {}
+        self.orphan_tracks = dict(track_history)
+
+    def _adopt_orphan_tracks(self, ids, boxes, min_iou=0.3):
+        orphans, self.orphan_tracks = self.orphan_tracks, {}
+        pairs = sorted(
+            ((_iou(history['last_position'], box), old_id, new_id)
+             for old_id, history in orphans.items() if history['last_position'] is not None
+             for new_id, box in zip(ids, boxes)),
+            key=lambda p: p[0], reverse=True
+        )
+        used_old, used_new = set(), set()
+        for overlap, old_id, new_id in pairs:
+            if overlap < min_iou:
+                break
+            if old_id in used_old or new_id in used_new:
                 continue
-                
-            if track_id not in self.track_history:
-                self.track_history[track_id] = {
+            self.track_history[new_id] = orphans[old_id]
+            used_old.add(old_id)
+            used_new.add(new_id)
+
+    def check_line_crossing(self, detections, frame_shape, frame_index=None):
+        """``count_tracks`` for a list of {'id', 'cls', 'box'} dicts; an 'id' of None is untracked"""
+        tracks = np.empty((len(detections), 7), dtype=np.float64)
+        for row, det in zip(tracks, detections):
+            row[:4] = det['box']
+            row[TRACK_ID] = -1 if det['id'] is None else det['id']
+            row[CONF] = det.get('conf', 1.0)
+            row[CLS] = det['cls']
+        self.count_tracks(tracks, frame_shape, frame_index)
+
+    def count_tracks(self, tracks, frame_shape, frame_index=None):
+        """Update tracks, zones and route counts for one frame.
+
+        ``tracks`` is an (N, 7) array in backend.tracker's column layout, as
+        track_frame returns it; rows with a track ID of -1 are ignored.
+        ``frame_index`` is the 1-based position of the frame in the video; event
+        times are derived from it. Without it, calls are assumed to be consecutive.
+        """
+        self.frame_count = frame_index if frame_index is not None else self.frame_count + 1
+        tracks = np.asarray(tracks).reshape(-1, 7)
+        tracks = tracks[tracks[:, TRACK_ID] >= 0]
+        ids = tracks[:, TRACK_ID].astype(np.int64).tolist()
+        boxes = tracks[:, :4].astype(np.float64)
+        box_list = boxes.tolist()
+        if self.orphan_tracks:
+            self._adopt_orphan_tracks(ids, box_list)
+
+        # Tracks missing from this frame are dropped; the rest move to their new box
+        current = set(ids)
+        history = self.track_history = {k: v for k, v in self.track_history.items() if k in current}
+        for track_id, box in zip(ids, box_list):
+            entry = history.get(track_id)
+            if entry is None:
+                entry = history[track_id] = {
                     'crossed_lines': [],
                     'last_position': None,
-                    'counted': False  # NEW: Flag to prevent double-counting
+                    'counted': False  # Set once the track is counted on a route, so it counts once
                 }
-            
-            # Update position history
-            self.track_history[track_id]['last_position'] = det['box']
-
-        # Second pass: Check line crossings
-        for line_id, line_data in self.lines.items():
-            start = line_data['start']
-            end = line_data['end']
-            
-            scale_x = frame_shape[1] / self.reference_width
-            scale_y = frame_shape[0] / self.reference_height
-            scaled_start = (start.x() * scale_x, start.y() * scale_y)
-            scaled_end = (end.x() * scale_x, end.y() * scale_y)
-
-            for det in detections:
-                track_id = det['id']
-                if track_id is None or self.track_history[track_id]['counted']:
-                    continue
-
-                if self._is_crossing_line(track_id, det['box'], scaled_start, scaled_end):
-                    if line_id not in self.track_history[track_id]['crossed_lines']:
-                        self.track_history[track_id]['crossed_lines'].append(line_id)
-
-        # Third pass: Validate routes and update counts
-        for track_id, history in self.track_history.items():
-            print(f"Track ID: {track_id}, Crossed Lines: {history['crossed_lines']}")
-
-            if history['counted']:
+            entry['last_position'] = box
+
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        if self.zones:
+            self._update_zones(ids, tracks[:, CLS], centers, frame_shape)
+
+        # Line crossings of the tracks not counted yet, against lines at this frame's resolution
+        pending = np.flatnonzero([not history[track_id]['counted'] for track_id in ids])
+        segment_ids = self.geometry.segment_ids
+        for row, segment in self._crossings(centers[pending], frame_shape[1], frame_shape[0]):
+            crossed_lines = history[ids[pending[row]]]['crossed_lines']
+            line_id = int(segment_ids[segment])
+            if line_id not in crossed_lines:
+                crossed_lines.append(line_id)
+
+        # Validate routes and update counts
+        debug = log.isEnabledFor(logging.DEBUG)
+        classes = None
+        for track_id, entry in history.items():
+            if debug:
+                log.debug("Track ID: %s, Crossed Lines: %s", track_id, entry['crossed_lines'])
+
+            crossed = entry['crossed_lines']
+            if entry['counted'] or len(crossed) < 2:
                 continue
+            route_key = (crossed[0], crossed[1])
+            if route_key not in self.route_counts:
+                continue
+            if classes is None:
+                # Class of each track's first row
+                classes = dict(zip(reversed(ids), reversed(tracks[:, CLS].astype(np.int64).tolist())))
+            vehicle_cls = classes[track_id]
+            current_time_sec = self.frame_count / self.fps
+            self.route_counts[route_key]["counts"][vehicle_cls] += 1
+            self.route_counts[route_key].setdefault("times", []).append(current_time_sec)
+            self.route_counts[route_key].setdefault("classes", []).append(vehicle_cls)
+            entry['counted'] = True
+            self._changed = True
+            self._add_to_bin(route_key, vehicle_cls, current_time_sec)
+            for listener in self.event_listeners:
+                listener(route_key, vehicle_cls, current_time_sec, self.frame_count)
 
-            crossed = history['crossed_lines']
-            vehicle_cls = next((d['cls'] for d in detections if d['id'] == track_id), None)
-
-            if vehicle_cls is not None and len(crossed) >= 2:
-                route_key = (crossed[0], crossed[1])
-                
-                if route_key in self.route_counts:
-                    current_time_sec = self.frame_count / self.fps
-                    self.route_counts[route_key]["counts"][vehicle_cls] += 1
-                    self.route_counts[route_key]["times"] = self.route_counts[route_key].get("times", [])
-                    self.route_counts[route_key]["times"].append(current_time_sec)
-                    history['counted'] = True
-                    
-    def _is_crossing_line(self, track_id, box, line_start, line_end):
-        """Improved line crossing detection with direction checking"""
-        x1, y1, x2, y2 = box
-        center = ((x1 + x2) / 2, (y1 + y2) / 2)
-        
-        # Get previous position if exists
-        prev_pos = self.track_history[track_id]['last_position']
-        if prev_pos is None:
-            return False
-            
-        (x1_line, y1_line), (x2_line, y2_line) = line_start, line_end
-        
-        # Check if center is near the line
-        if (min(x1_line, x2_line) <= center[0] <= max(x1_line, x2_line)) and \
-           (min(y1_line, y2_line) <= center[1] <= max(y1_line, y2_line)):
-            numerator = abs((y2_line - y1_line)*center[0] - (x2_line - x1_line)*center[1] + x2_line*y1_line - y2_line*x1_line)
-            denominator = ((y2_line - y1_line)**2 + (x2_line - x1_line)**2)**0.5
-            return numerator/denominator < 15
-        
-        return False
+    def _update_zones(self, ids, classes, centers, frame_shape):
+        """Zone occupancy, entries and dwell times from the track centers of this frame"""
+        inside = self.zone_geometry.contains(centers, frame_shape[1], frame_shape[0])
+        classes = classes.astype(np.int64).tolist()
+        now = self.frame_count / self.fps
 
-    def set_reference_size(self, width, height):
-        self.reference_width = width
-        self.reference_height = height
+        for column, zone_id in enumerate(self.zone_geometry.ids):
+            zone = self.zones[zone_id]
+            present = {ids[i]: classes[i] for i in np.flatnonzero(inside[:, column]).tolist()}
+            for track_id in zone['inside'].keys() - present.keys():
+                zone['dwell_times'].append(now - zone['inside'].pop(track_id))
+            for track_id, cls in present.items():
+                if track_id not in zone['inside']:
+                    zone['inside'][track_id] = now
+                    zone['entries'][cls] += 1
+            zone['occupancy'] = len(present)
+            zone['peak'] = max(zone['peak'], zone['occupancy'])
+        self._changed = True
+
+    def _segment_grid(self, width, height):
+        """Spatial index of the line segments at a frame size, rebuilt only when lines or size change"""
+        key = (self.geometry.version, int(width), int(height))
+        if key != self._grid_key:
+            self._grid = SegmentGrid(self.geometry.pixels(width, height), width, height,
+                                     margin=CROSSING_DISTANCE)
+            self._grid_key = key
+        return self._grid
+
+    def _crossings(self, centers, width, height):
+        """(row, segment) pairs of centers on a line segment, by row then segment.
+
+        A center is on a segment when it lies within the segment's bounding box
+        and less than CROSSING_DISTANCE pixels from its line. Only the segments
+        registered in each center's grid cell are tested.
+        """
+        grid = self._segment_grid(width, height)
+        cells = grid.cells(centers)
+        starts = grid.cell_offsets[cells]
+        counts = grid.cell_offsets[cells + 1] - starts
+        rows = np.repeat(np.arange(len(centers)), counts)
+        slots = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        segments = grid.cell_segments[slots]
+
+        x1, y1, x2, y2 = self.geometry.pixels(width, height)[segments].T
+        cx, cy = centers[rows].T
+        inside = ((np.minimum(x1, x2) <= cx) & (cx <= np.maximum(x1, x2))
+                  & (np.minimum(y1, y2) <= cy) & (cy <= np.maximum(y1, y2)))
+        numerator = np.abs((y2 - y1) * cx - (x2 - x1) * cy + x2 * y1 - y2 * x1)
+        denominator = ((y2 - y1) ** 2 + (x2 - x1) ** 2) ** 0.5
+        distance = np.divide(numerator, denominator, out=np.full_like(numerator, np.inf), where=denominator > 0)
+        hit = np.flatnonzero(inside & (distance < CROSSING_DISTANCE))
+        return zip(rows[hit].tolist(), segments[hit].tolist())
@@ -0,0 +1,117 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+DEFAULT_RATE_LIMIT = 1.0  # Seconds between repeats of the same message
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of the same DEBUG message template within a time window.
+
+    The key is the unformatted message (``record.msg``), so per-frame calls such
+    as ``log.debug("Track %s", tid)`` collapse to one line per window no matter
+    how many tracks are in view. INFO and above always pass unless the call opts
+    in with ``extra={"rate_limit": seconds}``; ``0`` disables limiting for a
+    DEBUG call.
+    """
+    max_keys = 1024  # Templates remembered; the least recently emitted is forgotten first
+
+    def __init__(self, interval=DEFAULT_RATE_LIMIT):
+        super().__init__()
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        default = self.interval if record.levelno < logging.INFO else 0
+        interval = getattr(record, "rate_limit", default)
+        if not interval:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_emit.get(key)
+            if last is not None and now - last < interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last_emit.pop(key, None)  # Re-inserted, so the dict stays in emit order
+            if len(self._last_emit) >= self.max_keys:
+                oldest = next(iter(self._last_emit))
+                del self._last_emit[oldest]
+                self._suppressed.pop(oldest, None)
+            self._last_emit[key] = now
+            record.suppressed = self._suppressed.pop(key, 0)
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """Append ``extra={"fields": {...}}`` as key=value pairs and suppression counts"""
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" (+{suppressed} similar suppressed)"
+        return message
+
+
+def setup_logging(level=None, rate_limit=DEFAULT_RATE_LIMIT, stream=None):
+    """Route the ``abacus`` logger tree through a background writer thread.
+
+    Records are filtered (level, rate limit) on the calling thread and then
+    handed to a queue; formatting and the actual console write happen on the
+    listener thread so the processing loop never blocks on stdout.
+    Safe to call more than once - later calls only adjust the level.
+    """
+    global _listener
+    root = logging.getLogger("abacus")
+    with _setup_lock:
+        if level is not None:
+            root.setLevel(level)
+        if _listener is not None:
+            return root
+        if level is None:
+            root.setLevel(os.environ.get("ABACUS_LOG_LEVEL", "INFO"))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+        console = logging.StreamHandler(stream or sys.stderr)
+        console.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Flush pending records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name):
+    """Return a child of the ``abacus`` logger, configuring logging on first use"""
+    setup_logging()
+    return logging.getLogger(f"abacus.{name}")
@@ -0,0 +1,91 @@
+import os
+from collections import OrderedDict, namedtuple
+import cv2
+from backend.logger import get_logger
+
+log = get_logger("media_probe")
+
+MediaInfo = namedtuple("MediaInfo", ["path", "fps", "frame_count", "width", "height", "preview"])
+
+
+def _cache_key(path):
+    """Path + mtime + size, so an overwritten file is probed again. Streams/URLs key by path only"""
+    path = os.path.abspath(path) if os.path.exists(path) else path
+    try:
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (path, None, None)
+
+
+class MediaProbe:
+    """Metadata and preview cache for loaded videos.
+
+    ``probe`` decodes the first frame once, keeps a downscaled copy for line
+    drawing, and leaves the capture open. ``take_capture`` hands that handle and
+    the full-resolution first frame to the processor, so a video is opened and
+    its first frame decoded exactly once per run. Re-loading a cached video
+    returns immediately; the processor then opens its own capture.
+    """
+    def __init__(self, max_entries=16, preview_width=960):
+        self.max_entries = max_entries
+        self.preview_width = preview_width
+        self._cache = OrderedDict()  # cache key -> MediaInfo
+        self._open = None  # (cache key, capture, first frame) for the last probed video
+
+    def probe(self, path):
+        key = _cache_key(path)
+        info = self._cache.get(key)
+        if info is not None:
+            self._cache.move_to_end(key)
+            if self._open is not None and self._open[0] != key:
+                self.release()  # The open capture is of another video; this one's processor opens its own
+            return info
+
+        self.release()
+        cap = cv2.VideoCapture(path)
+        ret, frame = cap.read()
+        if not ret:
+            cap.release()
+            log.error("Could not decode first frame of %s", path)
+            return None
+
+        height, width = frame.shape[:2]
+        info = MediaInfo(
+            path=path,
+            fps=cap.get(cv2.CAP_PROP_FPS) or 30,
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            width=width,
+            height=height,
+            preview=self._downscale(frame)
+        )
+        self._cache[key] = info
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+        self._open = (key, cap, frame)
+        return info
+
+    def take_capture(self, path):
+        """Return ``(capture, first_frame)``; first_frame is None if a fresh capture was opened"""
+        if self._open is not None and self._open[0] == _cache_key(path):
+            _, cap, frame = self._open
+            self._open = None
+            if cap.isOpened():
+                return cap, frame
+            cap.release()
+        return cv2.VideoCapture(path), None
+
+    def release(self):
+        """Close the capture kept open by the last probe"""
+        if self._open is not None:
+            self._open[1].release()
+            self._open = None
+
+    def _downscale(self, frame):
+        height, width = frame.shape[:2]
+        if width <= self.preview_width:
+            return frame.copy()
+        scale = self.preview_width / width
+        return cv2.resize(frame, (self.preview_width, int(height * scale)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Decide per frame whether detection is worth running.
+
+    Each frame is downscaled to ``width`` pixels, converted to grey and blurred,
+    then differenced against the previous one. Only pixels inside zones and
+    in a band around the counting lines (``margin`` as a fraction of the frame
+    width) are considered; with neither the whole frame is. Inference runs when more
+    than ``min_changed`` of that region changed, for ``hold_frames`` frames
+    after any motion so new tracks can settle, and at least every
+    ``keyframe_interval`` frames as a safety net.
+    """
+    def __init__(self, width=320, diff_threshold=20, min_changed=0.002, margin=0.08,
+                 hold_frames=15, keyframe_interval=150):
+        self.width = width
+        self.diff_threshold = diff_threshold
+        self.min_changed = min_changed
+        self.margin = margin
+        self.hold_frames = hold_frames
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        self._previous = None
+        self._roi = None
+        self._roi_key = None
+        self._roi_pixels = 0
+        self._hold = 0
+        self._since_inference = 0
+        self.skipped = 0
+
+    def needs_inference(self, frame, line_manager=None):
+        h, w = frame.shape[:2]
+        small_size = (self.width, max(1, int(h * self.width / w)))
+        small = cv2.resize(frame, small_size, interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        previous, self._previous = self._previous, small
+        if previous is None:
+            return self._run()
+
+        roi = self._region(small_size, line_manager)
+        changed = cv2.absdiff(previous, small)
+        _, changed = cv2.threshold(changed, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        if roi is not None:
+            changed = cv2.bitwise_and(changed, roi)
+
+        if cv2.countNonZero(changed) >= self.min_changed * self._roi_pixels:
+            self._hold = self.hold_frames
+            return self._run()
+        if self._hold > 0:
+            self._hold -= 1
+            return self._run()
+        if self._since_inference >= self.keyframe_interval:
+            return self._run()
+
+        self._since_inference += 1
+        self.skipped += 1
+        return False
+
+    def _run(self):
+        self._since_inference = 0
+        return True
+
+    def _region(self, size, line_manager):
+        """Mask of the area near the lines and zones at the downscaled size, rebuilt only on edits"""
+        if line_manager is None or not (line_manager.lines or line_manager.zones):
+            self._roi_pixels = size[0] * size[1]
+            return None
+
+        key = (size, line_manager.version)
+        if key != self._roi_key:
+            roi = np.zeros((size[1], size[0]), dtype=np.uint8)
+            thickness = max(1, int(self.margin * size[0] * 2))
+            for x1, y1, x2, y2 in line_manager.line_pixels(*size).astype(np.int32).tolist():
+                cv2.line(roi, (x1, y1), (x2, y2), 255, thickness)
+            scale = np.array(size, dtype=np.float64)
+            # With an inference process this runs on the decoder thread while edits land on the stage
+            # thread: the key above was taken first, so a half-applied edit is redrawn next frame
+            for points in list(line_manager.zone_geometry.points.values()):
+                points = (points * scale).astype(np.int32)
+                cv2.fillPoly(roi, [points], 255)
+                cv2.polylines(roi, [points], True, 255, thickness)
+            self._roi = roi
+            self._roi_key = key
+            self._roi_pixels = max(1, cv2.countNonZero(roi))
+        return self._roi
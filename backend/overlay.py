@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+LINE_COLOR = (0, 255, 0)
+ZONE_COLOR = (255, 128, 0)
+LABEL_COLOR = (0, 255, 255)
+
+# One BGR colour per vehicle class (LineManager.class_names order)
+CLASS_COLORS = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255),
+    (49, 210, 207), (10, 249, 72), (23, 204, 146)
+]
+
+
+class LineOverlay:
+    """Counting lines, zones and labels rasterized once, then blended into every frame.
+
+    The layer is rebuilt only when the frame size or the line/zone set
+    (``LineManager.version``) changes. Blending is a
+    single masked copy over the bounding box of the drawn pixels, so the
+    per-frame cost does not depend on how many lines are configured.
+    """
+    def __init__(self):
+        self._key = None
+        self._layer = None
+        self._mask = None
+        self._roi = None
+
+    def apply(self, frame, line_manager):
+        h, w = frame.shape[:2]
+        key = (w, h, line_manager.version)
+        if key != self._key:
+            self._rasterize(w, h, line_manager)
+            self._key = key
+
+        if self._roi is None:
+            return frame
+
+        y0, y1, x0, x1 = self._roi
+        np.copyto(frame[y0:y1, x0:x1], self._layer, where=self._mask)
+        return frame
+
+    def invalidate(self):
+        self._key = None
+
+    def _rasterize(self, w, h, line_manager):
+        layer = np.zeros((h, w, 3), dtype=np.uint8)
+        scale = np.array([w, h], dtype=np.float64)
+        for line_id in line_manager.geometry.ids:
+            points = (line_manager.geometry.points[line_id] * scale).astype(np.int32)
+            cv2.polylines(layer, [points], False, LINE_COLOR, 2)
+            # Label the middle of the gate (the midpoint for a straight line)
+            mid_x, mid_y = ((points[(len(points) - 1) // 2] + points[len(points) // 2]) // 2).tolist()
+            cv2.putText(layer, f"Line {line_id}", (mid_x - 20, mid_y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, LABEL_COLOR, 2)
+
+        for zone_id in line_manager.zone_geometry.ids:
+            points = (line_manager.zone_geometry.points[zone_id] * scale).astype(np.int32)
+            cv2.polylines(layer, [points], True, ZONE_COLOR, 2)
+            x, y = points.min(axis=0).tolist()
+            cv2.putText(layer, line_manager.zones[zone_id]['name'], (x + 4, y + 16),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, ZONE_COLOR, 2)
+
+        drawn = layer.any(axis=2)
+        rows = np.flatnonzero(drawn.any(axis=1))
+        cols = np.flatnonzero(drawn.any(axis=0))
+        if rows.size == 0:
+            self._layer = self._mask = self._roi = None
+            return
+
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        self._roi = (y0, y1, x0, x1)
+        self._layer = np.ascontiguousarray(layer[y0:y1, x0:x1])
+        self._mask = drawn[y0:y1, x0:x1, None]
+
+
+def draw_boxes(frame, xyxy, cls, track_ids=None, class_names=None):
+    """Draw detection boxes in place - a minimal replacement for ``Results.plot()``"""
+    if len(xyxy) == 0:
+        return frame
+
+    boxes = np.asarray(xyxy).astype(np.int32, copy=False)
+    classes = np.asarray(cls).astype(np.int32, copy=False)
+    ids = None if track_ids is None else np.asarray(track_ids).astype(np.int64, copy=False)
+
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        cls_id = int(classes[i])
+        color = CLASS_COLORS[cls_id % len(CLASS_COLORS)]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+        label = class_names.get(cls_id, str(cls_id)) if class_names else str(cls_id)
+        if ids is not None and ids[i] >= 0:
+            label = f"{label} #{ids[i]}"
+        cv2.putText(frame, label, (x1, max(y1 - 5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return frame
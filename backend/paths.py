@@ -0,0 +1,19 @@
+import hashlib
+import os
+
+# Per-user working data (checkpoints, caches); override with ABACUS_HOME
+APP_DIR = os.environ.get("ABACUS_HOME", os.path.join(os.path.expanduser("~"), ".abacus"))
+
+
+def data_dir(*parts):
+    """Return a directory under APP_DIR, creating it if needed"""
+    path = os.path.join(APP_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def video_slug(video_path):
+    """Stable, filesystem-safe name for a video: basename plus a short hash of its full path"""
+    full = os.path.abspath(video_path)
+    digest = hashlib.sha1(full.encode("utf-8")).hexdigest()[:10]
+    return f"{os.path.basename(full)}-{digest}"
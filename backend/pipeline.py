@@ -0,0 +1,502 @@
+"""Asyncio orchestration of a counting run: source -> counting stage -> sinks.
+
+A ``Pipeline`` wires three kinds of parts together with bounded queues:
+
+* a source (``VideoSource``; ``StreamSource`` adds reconnects for RTSP/HTTP
+  cameras) decoded on its own thread,
+* a ``CountingStage`` - inference, tracking and ``LineManager`` updates - run
+  on a single-thread executor, which makes it the only writer of counting
+  state. Line, zone and route edits queued with ``LineManager.edit`` are
+  applied between frames; readers use the published ``LineManager.snapshot``
+  or, for anything beyond it, ``call_in_stage``.
+  With a ``detector`` (backend.frame_ring.InferenceWorker) inference runs in
+  another process instead: the decoder thread hands each frame over through
+  shared memory as soon as it is read, and the stage collects the tracks.
+  With a ``model_input`` (backend.letterbox.ModelInput) the decoder thread
+  also letterboxes each frame to the inference size, which an "auto" input
+  settles on the first frame before any frame is tracked,
+* any number of sinks, each fed by its own queue so a slow consumer only
+  holds itself up. Display-type sinks set ``coalesce`` and keep just the
+  newest result; the rest apply backpressure.
+
+``cancel``, ``pause`` and ``resume`` may be called from any thread and
+return at once. On cancellation or end of input every stage is stopped, the
+sinks are closed in order and the source is released.
+"""
+import asyncio
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from backend.logger import get_logger
+
+log = get_logger("pipeline")
+
+# counts: routes of the LineManager snapshot this frame published (else None); shared, do not modify
+FrameResult = namedtuple("FrameResult", "index frame tracks inferred counts")
+
+_END = object()
+
+
+class VideoSource:
+    """Frames from anything cv2.VideoCapture opens, read on the decoder thread"""
+    def __init__(self, uri, capture=None, first_frame=None):
+        self.uri = uri
+        self.cap = capture
+        self.first_frame = first_frame  # Already decoded (e.g. by MediaProbe); returned first
+        self.fps = 30
+        self.total_frames = 0
+        self.width = self.height = 0
+        self.position = 0
+
+    def open(self):
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.uri)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open {self.uri}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.first_frame is not None:
+            self.height, self.width = self.first_frame.shape[:2]
+        else:
+            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return self
+
+    def seek(self, frame_index):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self.first_frame = None
+        self.position = frame_index
+
+    def read(self):
+        """Next frame, or None at the end of input"""
+        if self.first_frame is not None:
+            frame, self.first_frame = self.first_frame, None
+        else:
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+        self.position += 1
+        return frame
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class StreamSource(VideoSource):
+    """Live camera stream: a failed read reopens the stream before giving up"""
+    def __init__(self, uri, reconnect_attempts=5, reconnect_delay=2.0):
+        super().__init__(uri)
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+
+    def read(self):
+        frame = super().read()
+        attempts = 0
+        while frame is None and attempts < self.reconnect_attempts:
+            attempts += 1
+            log.warning("Stream %s dropped, reconnecting (%d/%d)", self.uri, attempts, self.reconnect_attempts)
+            self.cap.release()
+            time.sleep(self.reconnect_delay)
+            self.cap = cv2.VideoCapture(self.uri)
+            frame = super().read() if self.cap.isOpened() else None
+        return frame
+
+
+class CountingStage:
+    """Inference, tracking and counting for one frame; optionally draws the annotated frame"""
+    def __init__(self, model, device, line_manager, tracker=None, motion_gate=None,
+                 overlay=None, verbose=False, detector=None, model_input=None, detection_filter=None):
+        self.model = model
+        self.device = device
+        self.line_manager = line_manager
+        self.tracker = tracker  # backend.tracker instance, or None for model.track()
+        self.motion_gate = motion_gate
+        self.overlay = overlay  # LineOverlay to annotate frames for display sinks; None skips drawing
+        self.verbose = verbose
+        self.detector = detector  # Out-of-process inference fed by prefetch(); model/tracker unused then
+        self.model_input = model_input  # Letterboxes frames on the decoder thread; None passes them as they are
+        self.detection_filter = detection_filter  # backend.detection_filter.DetectionFilter, or None
+        self.position = 0  # Index of the last frame processed; counting state is current up to here
+        self.inferred_frames = 0
+        self.inference_time = 0.0
+        self._tracks = None
+        self._prefetched = deque()  # Gate decisions of frames handed to the detector, oldest first
+        self._primed = False
+        self._published = None  # Snapshot version last handed to sinks
+
+    def prepare(self, frame):
+        """Decoder thread: (model input, LetterboxParams or None)"""
+        if self.model_input is None:
+            return frame, None
+        self.model_input.calibrate(frame, self._probe)  # First frame only; nothing is in flight yet
+        return self.model_input.prepare(frame)
+
+    def _probe(self, model_frame, letterbox):
+        """Seconds to detect (not track) one model input, for sizing it"""
+        from backend.tracker import detect_latency
+
+        if self.detector is not None:
+            return self.detector.probe(model_frame, letterbox)
+        return detect_latency(self.model, model_frame, self.device, letterbox, self.detection_filter)
+
+    def prefetch(self, index, frame, prepared):
+        """Decoder thread, with a detector: gate the frame and start its inference ahead of process()"""
+        inferred = (not self._primed or self.motion_gate is None
+                    or self.motion_gate.needs_inference(frame, self.line_manager))
+        self._primed = True  # The first frame always needs tracks
+        if inferred:
+            self.detector.submit(index, *prepared)
+        self._prefetched.append(inferred)
+
+    def process(self, index, frame, prepared=None):
+        from backend.overlay import draw_boxes
+        from backend.tracker import track_frame, TRACK_ID, CLS
+
+        line_manager = self.line_manager
+        self.position = index
+        line_manager.apply_edits()  # Frame boundary: edits from other threads land here
+        if self.detector is not None:
+            inferred = self._prefetched.popleft()
+        else:
+            inferred = (self._tracks is None or self.motion_gate is None
+                        or self.motion_gate.needs_inference(frame, line_manager))
+        if inferred:
+            model_frame, letterbox = prepared or (frame, None)
+            if self.detector is not None:
+                self._tracks, seconds = self.detector.result(index)
+            else:
+                started = time.perf_counter()
+                self._tracks = track_frame(self.model, self.tracker, model_frame, self.device, self.verbose,
+                                           letterbox, self.detection_filter)
+                seconds = time.perf_counter() - started
+            self.inference_time += seconds
+            self.inferred_frames += 1
+        tracks = self._tracks
+
+        # An empty frame still matters to zones: whoever was inside has left
+        if inferred and (line_manager.zones or (tracks[:, TRACK_ID] >= 0).any()):
+            line_manager.count_tracks(tracks, frame.shape, index)
+        snapshot = line_manager.publish()
+        counts = snapshot.routes if snapshot.version != self._published else None
+        self._published = snapshot.version
+
+        if self.overlay is not None:
+            draw_boxes(frame, tracks[:, :4], tracks[:, CLS], tracks[:, TRACK_ID], line_manager.class_names)
+            self.overlay.apply(frame, line_manager)
+        return FrameResult(index, frame, tracks, inferred, counts)
+
+    def metrics(self):
+        return {"inferred_frames": self.inferred_frames,
+                "inference_ms": round(1000 * self.inference_time / max(self.inferred_frames, 1), 2),
+                "skipped_frames": self.motion_gate.skipped if self.motion_gate else 0,
+                "imgsz": self.model_input.imgsz if self.model_input else None}
+
+
+class Sink:
+    """Base sink; subclasses override what they need"""
+    coalesce = False  # True: only the newest result matters (display, live updates)
+    wants_frames = True  # False: start/close only, no per-frame results
+
+    async def start(self, pipeline):
+        pass
+
+    async def handle(self, result):
+        pass
+
+    async def close(self, finished):
+        pass
+
+
+class CallbackSink(Sink):
+    """Calls ``callback(result)`` on the loop thread - e.g. to emit Qt signals"""
+    coalesce = True
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    async def handle(self, result):
+        self.callback(result)
+
+
+class RecorderSink(Sink):
+    """Writes frames to a video file while ``enabled``"""
+    def __init__(self, path="output.avi", fps=20.0, fourcc="XVID"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.enabled = False
+        self._writer = None
+
+    async def handle(self, result):
+        if not self.enabled:
+            return
+        if self._writer is None:
+            h, w = result.frame.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, (w, h))
+        await asyncio.to_thread(self._writer.write, result.frame)
+
+    async def close(self, finished):
+        if self._writer is not None:
+            self._writer.release()
+
+
+class EventStoreSink(Sink):
+    """Records every counted vehicle in an EventStore for the duration of the run"""
+    wants_frames = False
+
+    def __init__(self, store, video_path, line_manager, after=None):
+        from backend.event_store import EventRecorder
+
+        self.store = store
+        self.video_path = video_path
+        self.line_manager = line_manager
+        self.after = after  # Keep events up to this many seconds (a resumed run recounts the rest)
+        self.recorder = EventRecorder(store, video_path, line_manager)
+
+    async def start(self, pipeline):
+        from backend.paths import video_slug
+
+        await pipeline.call_in_stage(self.store.clear_video, video_slug(self.video_path), self.after)
+        await pipeline.call_in_stage(self.line_manager.event_listeners.append, self.recorder)
+
+    async def close(self, finished):
+        self.recorder.flush()
+        self.line_manager.event_listeners.remove(self.recorder)
+
+
+class CheckpointSink(Sink):
+    """Saves a checkpoint of the counting state every ``interval`` frames"""
+    def __init__(self, video_path, line_manager, interval=900):
+        self.video_path = video_path
+        self.line_manager = line_manager
+        self.interval = interval
+        self._pipeline = None
+
+    async def start(self, pipeline):
+        self._pipeline = pipeline
+
+    async def handle(self, result):
+        from backend.checkpoint import save_checkpoint
+
+        if self.interval and result.index % self.interval == 0:
+            # Runs on the stage thread between frames; the stage may be ahead of this result,
+            # so the checkpoint takes its position from the stage
+            stage = self._pipeline.stage
+            await self._pipeline.call_in_stage(
+                lambda: save_checkpoint(self.video_path, self.line_manager, stage.position))
+
+
+class DetectionCacheSink(Sink):
+    """Records the tracks of every inferred frame and writes them as a DetectionCache when a full run ends"""
+    def __init__(self, path, fps):
+        from backend.detection_cache import DetectionRecorder
+
+        self.path = path
+        self.fps = fps
+        self.recorder = DetectionRecorder()
+        self._complete = False
+
+    async def start(self, pipeline):
+        self._complete = pipeline.stage.position == 0  # A resumed run only sees part of the video
+
+    async def handle(self, result):
+        if result.inferred:
+            self.recorder.append(result.index, result.tracks, result.frame.shape)
+
+    async def close(self, finished):
+        if finished and self._complete:
+            await asyncio.to_thread(lambda: self.recorder.build(self.fps).save(self.path))
+
+
+class TrajectorySink(Sink):
+    """Archives every track's trajectory (backend.trajectories) over a run from the first frame"""
+    def __init__(self, path, fps, video_path=None):
+        self.path = path
+        self.fps = fps
+        self.video_path = video_path
+        self._writer = None
+        self._shape = (0, 0)
+
+    async def start(self, pipeline):
+        from backend.trajectories import TrajectoryWriter
+
+        if pipeline.stage.position == 0:  # Track IDs restart on resume and would collide
+            self._writer = await asyncio.to_thread(TrajectoryWriter, self.path)
+
+    async def handle(self, result):
+        if self._writer is not None and result.inferred:
+            self._shape = result.frame.shape[:2]
+            self._writer.append(result.index, result.tracks)
+
+    async def close(self, finished):
+        if self._writer is not None:
+            height, width = self._shape
+            await asyncio.to_thread(self._writer.close, self.fps, width, height, self.video_path)
+
+
+class SnapshotSink(Sink):
+    """Publishes ``build()`` at most every ``interval`` seconds and at the end.
+
+    ``build`` runs on the loop thread, so it should read published state
+    (``LineManager.snapshot``) rather than the live counting state.
+    """
+    coalesce = True
+
+    def __init__(self, build, publish, interval=0.25):
+        self.build = build
+        self.publish = publish
+        self.interval = interval
+        self._last = 0.0
+
+    async def handle(self, result):
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.publish(self.build())
+
+    async def close(self, finished):
+        self.publish(self.build())
+
+
+class Pipeline:
+    def __init__(self, source, stage, sinks=(), queue_size=8, frame_interval=0.0):
+        self.source = source
+        self.stage = stage
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.frame_interval = frame_interval  # Minimum seconds between frames (display pacing)
+        self.frames_read = 0
+        self.started = None
+        self._loop = None
+        self._task = None
+        self._running = None
+        self._cancel_requested = False
+        self._paused = False
+        self._decoder = ThreadPoolExecutor(1, thread_name_prefix="decoder")
+        self._stage_executor = ThreadPoolExecutor(1, thread_name_prefix="counting-stage")
+
+    async def call_in_stage(self, fn, *args):
+        """Run ``fn`` on the counting-stage thread, serialized with frame processing"""
+        return await self._loop.run_in_executor(self._stage_executor, fn, *args)
+
+    # Thread-safe controls; requests made before run() starts are applied when it does
+    def cancel(self):
+        self._cancel_requested = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def pause(self):
+        self._paused = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._running.clear)
+
+    def resume(self):
+        self._paused = False
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._running.set)
+
+    def metrics(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return {"frame": self.stage.position, "total_frames": self.source.total_frames,
+                "fps": round(self.frames_read / elapsed, 2) if elapsed else 0, **self.stage.metrics()}
+
+    async def run(self):
+        """Process the source to the end; returns True if it was exhausted, False after cancel()"""
+        self._task = asyncio.current_task()
+        self._running = asyncio.Event()
+        if not self._paused:
+            self._running.set()
+        self._loop = asyncio.get_running_loop()
+        if self._cancel_requested:
+            self._task.cancel()
+        self.started = time.perf_counter()
+
+        frames = asyncio.Queue(self.queue_size)
+        outputs = [(sink, asyncio.Queue(1 if sink.coalesce else self.queue_size))
+                   for sink in self.sinks if sink.wants_frames]
+        tasks = []
+        finished = False
+        try:
+            for sink in self.sinks:
+                await sink.start(self)
+            workers = [asyncio.create_task(self._sink_worker(sink, queue)) for sink, queue in outputs]
+            tasks = workers + [asyncio.create_task(self._read(frames))]
+            await self._process(frames, outputs)
+            await tasks[-1]
+            for sink, queue in outputs:
+                await self._put(sink, queue, _END)
+            await asyncio.gather(*workers)
+            finished = True
+        except asyncio.CancelledError:
+            log.info("Pipeline for %s cancelled at frame %d", self.source.uri, self.stage.position)
+            if not self._cancel_requested:
+                raise  # Cancelled from outside (e.g. the owning task): propagate after cleanup
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Let an in-flight frame finish before sinks read the final state
+            await self._loop.run_in_executor(self._stage_executor, lambda: None)
+            for sink in self.sinks:
+                try:
+                    await sink.close(finished)
+                except Exception:
+                    log.exception("Closing sink %s failed", type(sink).__name__)
+            await self._loop.run_in_executor(self._decoder, self.source.close)
+            self._decoder.shutdown(wait=False)
+            self._stage_executor.shutdown(wait=False)
+        return finished
+
+    async def _read(self, frames):
+        next_due = time.perf_counter()
+        while True:
+            await self._running.wait()
+            item = await self._loop.run_in_executor(self._decoder, self._next_frame)
+            if item is None:
+                await frames.put(_END)
+                return
+            self.frames_read += 1
+            await frames.put(item)
+            if self.frame_interval:
+                next_due += self.frame_interval
+                await asyncio.sleep(max(0.0, next_due - time.perf_counter()))
+
+    def _next_frame(self):
+        """Decoder thread: (index, frame, prepared model input), or None at the end"""
+        frame = self.source.read()
+        if frame is None:
+            return None
+        index, prepared = self.source.position, self.stage.prepare(frame)
+        if self.stage.detector is not None:
+            self.stage.prefetch(index, frame, prepared)
+        return index, frame, prepared
+
+    async def _process(self, frames, outputs):
+        while True:
+            item = await frames.get()
+            if item is _END:
+                return
+            result = await self._loop.run_in_executor(self._stage_executor, self.stage.process, *item)
+            for sink, queue in outputs:
+                await self._put(sink, queue, result)
+
+    @staticmethod
+    async def _put(sink, queue, item):
+        if item is not _END and sink.coalesce and queue.full():
+            # Replace the stale result, keeping its count update if the new one has none
+            stale = queue.get_nowait()
+            if item.counts is None:
+                item = item._replace(counts=stale.counts)
+        await queue.put(item)
+
+    async def _sink_worker(self, sink, queue):
+        while True:
+            result = await queue.get()
+            if result is _END:
+                return
+            try:
+                await sink.handle(result)
+            except Exception:
+                log.exception("Sink %s failed on frame %d", type(sink).__name__, result.index)
@@ -0,0 +1,42 @@
+import importlib
+import threading
+import time
+from backend.logger import get_logger
+
+log = get_logger("preload")
+
+# Imported on first use by the processing thread and the Excel export
+HEAVY_MODULES = ("torch", "ultralytics", "xlsxwriter")
+
+_thread = None
+
+
+def _import_all(modules):
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            log.warning("Preload of %s failed: %s", name, e)
+            continue
+        log.debug("Preloaded %s in %.2fs", name, time.perf_counter() - started)
+
+
+def preload_in_background(modules=HEAVY_MODULES):
+    """Import heavy modules on a daemon thread while the user picks a video.
+
+    The GUI never waits on this: whichever thread touches a module first simply
+    blocks on Python's import lock until the background import has finished.
+    """
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_import_all, args=(tuple(modules),),
+                                   name="module-preload", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def wait_for_preload(timeout=None):
+    """Block until the background preload (if any) is done"""
+    if _thread is not None:
+        _thread.join(timeout)
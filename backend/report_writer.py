@@ -0,0 +1,152 @@
+"""Streaming export of counting results to Excel, CSV and Parquet.
+
+Rows are generated straight from LineManager state and written as they are
+produced: XlsxWriter runs in constant-memory mode (one row buffered at a
+time), CSV goes through the csv module, and only Parquet - a columnar
+format - collects columns before writing. Nothing builds a DataFrame.
+"""
+import csv
+import os
+from backend.logger import get_logger
+
+log = get_logger("report_writer")
+
+EVENT_COLUMNS = [
+    "Origin Line", "Destination Line", "Direction",
+    "Vehicle Type", "Detection Time", "Frame Number"
+]
+FORMATS = ("xlsx", "csv", "parquet")
+
+
+def format_clock(seconds, with_seconds=False):
+    """Seconds since midnight -> "h:MM[:SS] AM/PM", wrapping past midnight"""
+    seconds = int(seconds) % 86400
+    hour, rest = divmod(seconds, 3600)
+    minute, second = divmod(rest, 60)
+    suffix = "AM" if hour < 12 else "PM"
+    hour = hour % 12 or 12
+    if with_seconds:
+        return f"{hour}:{minute:02d}:{second:02d} {suffix}"
+    return f"{hour}:{minute:02d} {suffix}"
+
+
+def iter_event_rows(line_manager):
+    """One row per counted vehicle, per route in the order they were counted"""
+    class_names = line_manager.class_names
+    fps = line_manager.fps
+    for (origin, destination), data in line_manager.route_counts.items():
+        start = line_manager.start_times.get((origin, destination), 0)
+        direction = data["direction"]
+        for sec, cls_id in zip(data.get("times", []), data.get("classes", [])):
+            yield (origin, destination, direction, class_names.get(cls_id, f"Class_{cls_id}"),
+                   format_clock(start + sec, with_seconds=True), int(round(sec * fps)))
+
+
+def summary_rows(line_manager):
+    """Totals per direction x vehicle class (plus a row total)"""
+    rows = []
+    for (origin, destination), data in line_manager.route_counts.items():
+        counts = [data["counts"].get(c, 0) for c in range(7)]
+        rows.append((origin, destination, data["direction"], *counts, sum(counts)))
+    return rows
+
+
+def summary_columns(line_manager):
+    return ["Origin Line", "Destination Line", "Direction",
+            *[line_manager.class_names[c] for c in range(7)], "Total"]
+
+
+def interval_rows(line_manager):
+    """The online interval bins as flat rows"""
+    for start, (origin, destination), direction, counts in line_manager.interval_table():
+        yield (format_clock(start), format_clock(start + line_manager.bin_seconds),
+               origin, destination, direction, *counts, sum(counts))
+
+
+def interval_columns(line_manager):
+    return ["Interval Start", "Interval End", *summary_columns(line_manager)]
+
+
+def zone_rows(line_manager):
+    """Per-zone entries by class, peak occupancy (queue length) and dwell statistics"""
+    for zone_id, zone in sorted(line_manager.zones.items()):
+        entries = [zone['entries'].get(c, 0) for c in range(7)]
+        dwell = zone['dwell_times']
+        yield (zone_id, zone['name'], *entries, sum(entries), zone['peak'],
+               round(sum(dwell) / len(dwell), 2) if dwell else 0, round(max(dwell), 2) if dwell else 0)
+
+
+def zone_columns(line_manager):
+    return ["Zone", "Name", *[line_manager.class_names[c] for c in range(7)], "Total Entries",
+            "Peak Occupancy", "Mean Dwell (s)", "Max Dwell (s)"]
+
+
+def write_xlsx(path, line_manager):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    bold = workbook.add_format({"bold": True})
+    sheets = (
+        ("Events", EVENT_COLUMNS, iter_event_rows(line_manager)),
+        ("Summary", summary_columns(line_manager), summary_rows(line_manager)),
+        ("Intervals", interval_columns(line_manager), interval_rows(line_manager)),
+    )
+    if line_manager.zones:
+        sheets += (("Zones", zone_columns(line_manager), zone_rows(line_manager)),)
+    for name, columns, rows in sheets:
+        sheet = workbook.add_worksheet(name)
+        sheet.write_row(0, 0, columns, bold)
+        for row_number, row in enumerate(rows, start=1):
+            sheet.write_row(row_number, 0, row)
+    workbook.close()
+
+
+def write_csv(path, line_manager):
+    """Events to ``path``; summary, intervals and zones to ``<stem>_summary.csv`` etc."""
+    stem = os.path.splitext(path)[0]
+    outputs = (
+        (path, EVENT_COLUMNS, iter_event_rows(line_manager)),
+        (f"{stem}_summary.csv", summary_columns(line_manager), summary_rows(line_manager)),
+        (f"{stem}_intervals.csv", interval_columns(line_manager), interval_rows(line_manager)),
+    )
+    if line_manager.zones:
+        outputs += ((f"{stem}_zones.csv", zone_columns(line_manager), zone_rows(line_manager)),)
+    for file_path, columns, rows in outputs:
+        with open(file_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+
+def write_parquet(path, line_manager):
+    """Events as a Parquet table (needs pyarrow, which is not pinned)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from e
+
+    columns = list(zip(*iter_event_rows(line_manager))) or [()] * len(EVENT_COLUMNS)
+    table = pa.table({name: list(values) for name, values in zip(EVENT_COLUMNS, columns)})
+    pq.write_table(table, path)
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "parquet": write_parquet}
+
+
+def save_report(line_manager, file_path=None, formats=("xlsx",)):
+    """Write results in each requested format next to ``file_path``; returns the written paths"""
+    if file_path is None:
+        downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
+        file_path = os.path.join(downloads_path, "vehicle_results.xlsx")
+    stem = os.path.splitext(file_path)[0]
+
+    written = []
+    for fmt in formats:
+        if fmt not in WRITERS:
+            raise ValueError(f"Unknown report format '{fmt}', expected one of {FORMATS}")
+        path = f"{stem}.{fmt}"
+        WRITERS[fmt](path, line_manager)
+        written.append(path)
+        log.info("Results saved to %s", path)
+    return written
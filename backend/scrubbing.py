@@ -0,0 +1,158 @@
+"""Random access into a video for the GUI's seek bar.
+
+``KeyframeIndex`` lists the frames a decoder can start from. For MP4/MOV it
+is read straight from the container's sync-sample table (``stss``), without
+decoding anything. While the operator drags the seek bar, ``FrameSeeker``
+snaps to these keyframes, so each preview costs one decoded frame. When the
+bar is released it decodes the exact frame, reading forward from the
+nearest keyframe.
+
+``CountTimeline`` answers "counts up to frame N" from the event times of a
+counted run. For a video with cached detections, that run is a replay
+(backend.detection_cache), so no inference is involved.
+"""
+import os
+import struct
+import cv2
+import numpy as np
+from backend.logger import get_logger
+
+log = get_logger("scrubbing")
+
+FORWARD_READ_LIMIT = 30  # Without an index, read forward rather than seek for gaps up to this many frames
+
+
+def _boxes(f, start, end):
+    """(type, payload start, end) of the ISO-BMFF boxes in [start, end)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", f.read(8))[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _child(f, start, end, kind):
+    return next(((lo, hi) for k, lo, hi in _boxes(f, start, end) if k == kind), None)
+
+
+def _path(f, start, end, *kinds):
+    span = (start, end)
+    for kind in kinds:
+        span = _child(f, *span, kind)
+        if span is None:
+            return None
+    return span
+
+
+def mp4_keyframes(path):
+    """1-based frame numbers of the first video track's sync samples, or None if unknown"""
+    with open(path, "rb") as f:
+        moov = _path(f, 0, os.fstat(f.fileno()).st_size, b"moov")
+        if moov is None:
+            return None
+        for kind, lo, hi in _boxes(f, *moov):
+            if kind != b"trak":
+                continue
+            hdlr = _path(f, lo, hi, b"mdia", b"hdlr")
+            if hdlr is None:
+                continue
+            f.seek(hdlr[0] + 8)  # version/flags, pre_defined
+            if f.read(4) != b"vide":
+                continue
+            stbl = _path(f, lo, hi, b"mdia", b"minf", b"stbl")
+            stsz = stbl and _child(f, *stbl, b"stsz")
+            if stsz is None:
+                return None
+            f.seek(stsz[0] + 8)  # version/flags, sample_size
+            samples = struct.unpack(">I", f.read(4))[0]
+            if samples == 0:
+                return None  # Fragmented MP4: samples live in the fragments
+            stss = _child(f, *stbl, b"stss")
+            if stss is None:
+                return np.arange(1, samples + 1)  # No table: every sample is a sync sample
+            f.seek(stss[0] + 4)
+            count = struct.unpack(">I", f.read(4))[0]
+            return np.frombuffer(f.read(4 * count), dtype=">u4").astype(np.int64)
+    return None
+
+
+class KeyframeIndex:
+    def __init__(self, keyframes):
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)  # 1-based, ascending
+
+    @classmethod
+    def from_video(cls, path):
+        """Index from the container, or None when the format has none we can read"""
+        try:
+            keyframes = mp4_keyframes(path)
+        except (OSError, struct.error) as e:
+            log.debug("No keyframe index for %s: %s", path, e)
+            return None
+        return cls(keyframes) if keyframes is not None and len(keyframes) else None
+
+    def before(self, frame_index):
+        """Last keyframe at or before ``frame_index``"""
+        i = np.searchsorted(self.keyframes, frame_index, side="right") - 1
+        return int(self.keyframes[max(i, 0)])
+
+
+class FrameSeeker:
+    """Decodes arbitrary frames of one video; frame indices are 1-based, as the pipeline counts them"""
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.index = KeyframeIndex.from_video(path)
+        self.next_frame = 1  # What a plain read() returns
+
+    def snap(self, frame_index):
+        """Nearest cheap frame to show while scrubbing: the keyframe at or before ``frame_index``"""
+        return self.index.before(frame_index) if self.index is not None else frame_index
+
+    def frame(self, frame_index):
+        """Decoded frame ``frame_index`` (BGR), or None past the end"""
+        gap = frame_index - self.next_frame
+        if self.index is not None:
+            # Reading forward beats seeking unless a keyframe lies between here and the target
+            forward = gap >= 0 and self.index.before(frame_index) <= self.next_frame
+        else:
+            forward = 0 <= gap <= FORWARD_READ_LIMIT
+        if not forward:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index - 1)
+            gap = 0
+        for _ in range(gap):
+            self.cap.grab()
+        ret, frame = self.cap.read()
+        self.next_frame = frame_index + 1
+        return frame if ret else None
+
+    def close(self):
+        self.cap.release()
+
+
+class CountTimeline:
+    """Counts-to-date at any frame, from the event times a counted LineManager kept per route"""
+    def __init__(self, line_manager):
+        self.fps = line_manager.fps
+        self.routes = {
+            key: (data["direction"], np.asarray(data.get("times", []), dtype=np.float64),
+                  np.asarray(data.get("classes", []), dtype=np.int64))
+            for key, data in line_manager.route_counts.items()
+        }
+
+    def counts_at(self, frame_index):
+        """route_counts-shaped {route: {"direction", "counts"}} for events up to ``frame_index``"""
+        t = frame_index / self.fps
+        counts = {}
+        for key, (direction, times, classes) in self.routes.items():
+            n = np.searchsorted(times, t, side="right")
+            per_class = np.bincount(classes[:n], minlength=7)
+            counts[key] = {"direction": direction, "counts": {c: int(per_class[c]) for c in range(7)}}
+        return counts
@@ -0,0 +1,406 @@
+"""Local HTTP/WebSocket service for headless counting jobs.
+
+    python -m backend.service --port 8000 --workers 2
+
+    POST   /jobs                 {"video": "/data/13.mp4"}  -> 202 {"id": ..., "status": "queued"}
+    GET    /jobs                 all jobs with status and progress
+    GET    /jobs/{id}            one job, including per-route and per-zone counts
+    DELETE /jobs/{id}            cancel a queued or running job
+    WS     /jobs/{id}/live       live counts and pipeline metrics
+    GET    /health               queue and worker occupancy
+
+Lines, zones and routes come from the request or, when omitted, from the
+service's routes.json (``--config``) via ConfigStore; a job without routes,
+or with routes between lines it does not have, is rejected with 422. Reports
+are written under ~/.abacus/reports only. A video already counted with the same weights
+and tracker is re-counted from its cached detections (backend.detection_cache)
+without running the model. Jobs wait in a bounded queue (full -> 429) and
+``workers`` of them run at once, each as a backend.pipeline Pipeline on the
+service's event loop with its own model. Live updates are coalesced twice:
+a snapshot sink publishes at most every ``publish_interval`` seconds, and
+each WebSocket sends only the latest snapshot at its own pace, so slow
+clients never queue stale frames.
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Union
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+from backend.config_store import ConfigStore, apply_lines, apply_zones, validate_entry
+from backend.detection_cache import cache_path, recount
+from backend.event_store import EventStore
+from backend.line_manager import LineManager
+from backend.detection_filter import DetectionFilter
+from backend.letterbox import ModelInput
+from backend.logger import get_logger
+from backend.motion_gate import MotionGate
+from backend.paths import data_dir, video_slug
+from backend.pipeline import (CountingStage, DetectionCacheSink, EventStoreSink, Pipeline, SnapshotSink,
+                              TrajectorySink, VideoSource)
+from backend.report_writer import FORMATS, save_report
+from backend.tracker import create_tracker
+from backend.trajectories import archive_path
+
+log = get_logger("service")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobRequest(BaseModel):
+    video: str
+    routes: Optional[List[dict]] = None   # routes.json route entries; default: from the config store
+    lines: Optional[List[dict]] = None    # Normalized config lines; default: from the config store
+    zones: Optional[List[dict]] = None
+    tracker: str = "ultralytics"
+    motion_gating: bool = False
+    imgsz: Optional[Union[int, Literal["auto"]]] = None  # Model input size; default: the camera's config
+    target_fps: Optional[float] = None                    # For imgsz "auto"; default: the video's fps
+    formats: List[str] = ["xlsx"]
+    output: Optional[str] = None          # Report file name in ~/.abacus/reports; default <video slug>.xlsx
+
+
+class Job:
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.status = QUEUED
+        self.error = None
+        self.reports = []
+        self.created = time.time()
+        self.started = self.finished = None
+        self.cancel_event = threading.Event()
+        self.pipeline = None
+        # Replaced wholesale by the snapshot sink; readers never see a half-built snapshot
+        self.snapshot = {}
+        self.snapshot_version = 0
+
+    def publish(self, snapshot):
+        self.snapshot = snapshot
+        self.snapshot_version += 1
+
+    def summary(self):
+        return {"id": self.id, "video": self.request.video, "status": self.status, "error": self.error,
+                "created": self.created, "started": self.started, "finished": self.finished,
+                "reports": self.reports, **self.snapshot}
+
+
+def build_job_line_manager(request, config="routes.json"):
+    """LineManager with the job's lines, zones and routes (request first, then the config store).
+
+    Raises ValueError (ConfigError) for a layout that could not count anything.
+    """
+    entry = ConfigStore(config).get(request.video) or {}
+    layout = {key: getattr(request, key) if getattr(request, key) is not None else entry.get(key, [])
+              for key in ("lines", "zones", "routes")}
+    name = os.path.basename(request.video)
+    validate_entry(layout, f"job {name}")
+    if not layout["routes"]:
+        raise ValueError(f"No routes for {name} in the request or {config}")
+    line_ids = {int(line["id"]) for line in layout["lines"]}
+    missing = {int(route[end]) for route in layout["routes"] for end in ("origin", "destination")} - line_ids
+    if missing:
+        raise ValueError(f"Routes for {name} use lines {sorted(missing)}, which are not defined")
+
+    line_manager = LineManager()
+    apply_lines(line_manager, layout["lines"])
+    apply_zones(line_manager, layout["zones"])
+    line_manager.load_routes(layout["routes"])
+    return line_manager
+
+
+def report_path(request):
+    """Where a job's report goes: always inside the reports directory"""
+    reports = os.path.realpath(data_dir("reports"))
+    if request.output is None:
+        return os.path.join(reports, video_slug(request.video) + ".xlsx")
+    path = os.path.realpath(os.path.join(reports, request.output))
+    if os.path.dirname(path) != reports:
+        raise ValueError(f"Report output must be a file name inside {reports}, got {request.output!r}")
+    return path
+
+
+def count_snapshot(line_manager, **metrics):
+    """JSON-ready copy of the counting state last published (safe to call while the run goes on)"""
+    snapshot = line_manager.snapshot
+    return {
+        "routes": [
+            {"origin": origin, "destination": destination, "direction": data["direction"],
+             "counts": {line_manager.class_names[c]: n for c, n in data["counts"].items()},
+             "total": sum(data["counts"].values())}
+            for (origin, destination), data in snapshot.routes.items()
+        ],
+        "zones": [
+            {"id": zone_id, "name": zone["name"], "occupancy": zone["occupancy"], "peak": zone["peak"],
+             "entries": sum(zone["entries"].values())}
+            for zone_id, zone in snapshot.zones.items()
+        ],
+        "metrics": metrics,
+    }
+
+
+class JobManager:
+    """Bounded job queue drained by a fixed number of concurrent pipelines"""
+    def __init__(self, workers=1, max_queue=32, model_path=None, device=None,
+                 event_store=None, publish_interval=0.25, config="routes.json"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.model_path = model_path
+        self.device = device
+        self.event_store = event_store
+        self.publish_interval = publish_interval
+        self.config = config  # routes.json for jobs that leave out lines, zones or routes
+        self.jobs = {}
+        self.running = 0
+        self._queue = None
+        self._tasks = []
+        self._executor = None  # Model loading and report writing
+        self._models = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.max_queue)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job-worker")
+        self._tasks = [asyncio.create_task(self._consume(slot)) for slot in range(self.workers)]
+        log.info("Job manager started with %d workers", self.workers)
+
+    async def stop(self):
+        for job in self.jobs.values():
+            job.cancel_event.set()
+        # Cancelling a consumer cancels the pipeline it is awaiting, which shuts down gracefully
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def submit(self, request):
+        """Queue a job; raises asyncio.QueueFull when the queue is at its limit"""
+        # Reads routes.json: off the event loop, like everything else that touches files
+        await asyncio.to_thread(self._check, request)
+        job = Job(request)
+        self._queue.put_nowait(job)
+        self.jobs[job.id] = job
+        log.info("Queued job %s for %s", job.id, request.video)
+        return job
+
+    def _check(self, request):
+        """Raise ValueError for a job that cannot run, so it is rejected now rather than failing later"""
+        unknown = set(request.formats) - set(FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown report formats {sorted(unknown)}, expected some of {FORMATS}")
+        if not os.path.isfile(request.video):
+            raise ValueError(f"Video not found: {request.video}")
+        report_path(request)
+        build_job_line_manager(request, self.config)
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        job.cancel_event.set()
+        if job.status == QUEUED:
+            job.status = CANCELLED
+        elif job.pipeline is not None:
+            job.pipeline.cancel()
+        return job
+
+    def health(self):
+        return {"workers": self.workers, "running": self.running,
+                "queued": self._queue.qsize() if self._queue else 0, "max_queue": self.max_queue}
+
+    async def _consume(self, slot):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancel_event.is_set():
+                    continue
+                self.running += 1
+                try:
+                    await self._run(job, slot)
+                finally:
+                    self.running -= 1
+            finally:
+                self._queue.task_done()
+
+    async def _save_report(self, job, line_manager):
+        request = job.request
+        if request.formats:
+            job.reports = await asyncio.get_running_loop().run_in_executor(
+                self._executor, save_report, line_manager, report_path(request), request.formats)
+
+    def _model_path(self):
+        from backend.video_processor import MODEL_PATH
+
+        return self.model_path or MODEL_PATH
+
+    def _model(self, slot):
+        """One model per worker slot, loaded on its first job"""
+        if slot not in self._models:
+            import torch
+            from ultralytics import YOLO
+
+            device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+            self._models[slot] = (YOLO(self._model_path()).to(device), device)
+        return self._models[slot]
+
+    def _recount(self, job, line_manager):
+        """Replay the job's cached detections, if any; cancelling the job stops the replay"""
+        return recount(job.request.video, line_manager, self._model_path(), job.request.tracker,
+                       self.event_store, stop=job.cancel_event.is_set)
+
+    async def _run(self, job, slot):
+        loop = asyncio.get_running_loop()
+        job.status, job.started = RUNNING, time.time()
+        request = job.request
+        try:
+            if not request.motion_gating:
+                # Same video, weights and tracker counted before: replay its detections instead
+                line_manager = await asyncio.to_thread(build_job_line_manager, request, self.config)
+                if await loop.run_in_executor(self._executor, self._recount, job, line_manager):
+                    if job.cancel_event.is_set():
+                        job.status = CANCELLED
+                        return
+                    job.publish(count_snapshot(line_manager, recounted=True))
+                    await self._save_report(job, line_manager)
+                    job.status = DONE
+                    return
+            model, device = await loop.run_in_executor(self._executor, self._model, slot)
+            # Opens the video and reads routes.json
+            job.pipeline = await loop.run_in_executor(self._executor, self._build_pipeline, job, model, device)
+            if job.cancel_event.is_set():
+                job.pipeline.cancel()
+            finished = await job.pipeline.run()
+            if finished:
+                await self._save_report(job, job.pipeline.stage.line_manager)
+            job.status = DONE if finished else CANCELLED
+        except asyncio.CancelledError:
+            job.status = CANCELLED  # Service shutting down
+            raise
+        except Exception as e:
+            log.exception("Job %s failed", job.id)
+            job.status, job.error = FAILED, str(e)
+        finally:
+            job.finished = time.time()
+            log.info("Job %s %s", job.id, job.status)
+
+    def _build_pipeline(self, job, model, device):
+        request = job.request
+        line_manager = build_job_line_manager(request, self.config)
+        source = VideoSource(request.video).open()
+        line_manager.set_video_info(source.fps, source.total_frames)
+
+        inference = (ConfigStore(self.config).get(request.video) or {}).get("inference", {})
+        detection_filter = DetectionFilter.from_config(inference)
+        tracker = create_tracker(request.tracker, frame_rate=source.fps, detection_filter=detection_filter)
+        if tracker is None:
+            model.predictor = None  # model.track(persist=True) state belongs to the previous job
+        imgsz = request.imgsz if request.imgsz is not None else inference.get("imgsz")
+        model_input = None
+        if imgsz is not None:
+            model_input = ModelInput(imgsz, request.target_fps or inference.get("target_fps") or source.fps,
+                                     device=device)
+        stage = CountingStage(model, device, line_manager, tracker=tracker,
+                              motion_gate=MotionGate() if request.motion_gating else None,
+                              model_input=model_input, detection_filter=detection_filter)
+
+        pipeline = Pipeline(source, stage)
+        pipeline.sinks.append(SnapshotSink(lambda: count_snapshot(line_manager, **pipeline.metrics()),
+                                           job.publish, self.publish_interval))
+        if self.event_store is not None:
+            pipeline.sinks.append(EventStoreSink(self.event_store, request.video, line_manager))
+        if not request.motion_gating:
+            pipeline.sinks.append(DetectionCacheSink(
+                cache_path(request.video, self._model_path(), request.tracker), source.fps))
+        pipeline.sinks.append(TrajectorySink(archive_path(request.video), source.fps, request.video))
+        return pipeline
+
+
+def create_app(manager):
+    @asynccontextmanager
+    async def lifespan(app):
+        await manager.start()
+        yield
+        await manager.stop()
+
+    app = FastAPI(title="abacus counting service", lifespan=lifespan)
+
+    def get_job(job_id):
+        job = manager.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(404, f"No job {job_id}")
+        return job
+
+    @app.post("/jobs", status_code=202)
+    async def submit_job(request: JobRequest):
+        try:
+            job = await manager.submit(request)
+        except asyncio.QueueFull:
+            raise HTTPException(429, "Job queue is full, try again later")
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+        return {"id": job.id, "status": job.status}
+
+    @app.get("/jobs")
+    async def list_jobs():
+        return [job.summary() for job in manager.jobs.values()]
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return get_job(job_id).summary()
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        get_job(job_id)
+        return manager.cancel(job_id).summary()
+
+    @app.get("/health")
+    async def health():
+        return manager.health()
+
+    @app.websocket("/jobs/{job_id}/live")
+    async def live(websocket: WebSocket, job_id: str, interval: float = 0.5):
+        job = manager.jobs.get(job_id)
+        if job is None:
+            await websocket.close(code=4404)
+            return
+        await websocket.accept()
+        sent_version, sent_status = -1, None
+        try:
+            while True:
+                if job.snapshot_version != sent_version or job.status != sent_status:
+                    sent_version, sent_status = job.snapshot_version, job.status
+                    await websocket.send_json(job.summary())
+                if job.status in (DONE, FAILED, CANCELLED):
+                    break
+                await asyncio.sleep(max(interval, 0.05))
+            await websocket.close()
+        except WebSocketDisconnect:
+            pass
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless vehicle counting service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Jobs processed concurrently")
+    parser.add_argument("--max-queue", type=int, default=32, help="Queued jobs before 429")
+    parser.add_argument("--device", default=None, help="cuda/cpu (default: cuda if available)")
+    parser.add_argument("--no-event-store", action="store_true")
+    parser.add_argument("--config", default="routes.json", help="routes.json for jobs without their own layout")
+    args = parser.parse_args()
+
+    manager = JobManager(workers=args.workers, max_queue=args.max_queue, device=args.device,
+                         event_store=None if args.no_event_store else EventStore(), config=args.config)
+    uvicorn.run(create_app(manager), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
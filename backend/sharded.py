@@ -0,0 +1,227 @@
+"""Process one long video as overlapping time segments in parallel worker processes.
+
+Each segment ``[start, end)`` is preceded by a warm-up window of ``overlap``
+frames that belongs to the previous segment. The worker tracks and counts
+through the warm-up as usual, then drops the events it produced there: any
+vehicle counted during warm-up is already counted by the previous segment,
+and because its track is marked ``counted`` it is not counted again. Vehicles
+that crossed their origin line during warm-up and the destination line after
+``start`` are counted here, and were not counted by the previous segment.
+The overlap therefore has to be longer than the slowest origin-to-destination
+transit.
+
+The camera's routes.json "inference" settings (input size, detection
+filter) apply to every segment, as in the GUI and the service.
+
+Usage (lines and routes from routes.json, or lines given in video pixels):
+
+    python -m backend.sharded 13.mp4 --workers 4
+    python -m backend.sharded 13.mp4 --line 100,400,600,400 --line 700,50,700,600
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import cv2
+from backend.line_manager import LineManager
+from backend.logger import get_logger
+
+log = get_logger("sharded")
+
+_worker = {}  # Per-process model cache, filled by _init_worker
+
+
+def plan_segments(total_frames, workers, overlap_frames, min_segment_frames=0):
+    """Split [0, total_frames) into (warmup_start, start, end) frame ranges"""
+    count = max(1, min(workers, total_frames // max(min_segment_frames, 1) or 1))
+    size = math.ceil(total_frames / count)
+    segments = []
+    for start in range(0, total_frames, size):
+        end = min(start + size, total_frames)
+        segments.append((max(0, start - overlap_frames), start, end))
+    return segments
+
+
+def line_specs(line_manager):
+    """Picklable (id, [(x, y), ...]) pairs, normalized, for the lines of a LineManager"""
+    return [(line_id, line_manager.lines[line_id]['points']) for line_id in line_manager.geometry.ids]
+
+
+def build_line_manager(lines, routes):
+    line_manager = LineManager()
+    for line_id, points in lines:
+        line_manager.next_id = line_id
+        line_manager.add_normalized_polyline(points)
+    line_manager.load_routes(routes)
+    return line_manager
+
+
+def _init_worker(model_path, device):
+    from ultralytics import YOLO
+
+    _worker["model"] = YOLO(model_path).to(device)
+    _worker["device"] = device
+
+
+def _clear_events(route_counts):
+    for data in route_counts.values():
+        data["counts"] = {cls: 0 for cls in data["counts"]}
+        data.pop("times", None)
+        data.pop("classes", None)
+
+
+def _process_segment(video_path, lines, routes, segment, tracker_name="ultralytics", imgsz=None,
+                     target_fps=None, detection_filter=None):
+    """Worker entry point: track and count one segment, return its route_counts"""
+    from backend.letterbox import ModelInput
+    from backend.tracker import create_tracker, detect_latency, track_frame, TRACK_ID
+
+    warmup_start, start, end = segment
+    model, device = _worker["model"], _worker["device"]
+    line_manager = build_line_manager(lines, routes)
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    line_manager.set_video_info(fps, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    tracker = create_tracker(tracker_name, frame_rate=fps, detection_filter=detection_filter)
+    model_input = ModelInput(imgsz, target_fps or fps, buffers=2, device=device) if imgsz is not None else None
+    if tracker is None:
+        # model.track(persist=True) keeps its tracker on the model; start each segment fresh
+        model.predictor = None
+    if warmup_start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warmup_start)
+
+    position = warmup_start
+    while position < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if position == start and start > warmup_start:
+            _clear_events(line_manager.route_counts)
+
+        model_frame, letterbox = frame, None
+        if model_input is not None:
+            model_input.calibrate(frame, lambda f, lb: detect_latency(model, f, device, lb, detection_filter))
+            model_frame, letterbox = model_input.prepare(frame)
+        tracks = track_frame(model, tracker, model_frame, device, letterbox=letterbox,
+                             detection_filter=detection_filter)
+        if (tracks[:, TRACK_ID] >= 0).any():
+            line_manager.count_tracks(tracks, frame.shape, position + 1)
+        position += 1
+
+    cap.release()
+    return segment, line_manager.route_counts
+
+
+def merge_route_counts(line_manager, segment_counts):
+    """Sum per-segment route_counts into line_manager.route_counts, events in time order"""
+    for key, merged in line_manager.route_counts.items():
+        events = []
+        merged["counts"] = {cls: 0 for cls in merged["counts"]}
+        for route_counts in segment_counts:
+            data = route_counts.get(key)
+            if data is None:
+                continue
+            for cls, count in data["counts"].items():
+                merged["counts"][cls] = merged["counts"].get(cls, 0) + count
+            events.extend(zip(data.get("times", []), data.get("classes", [])))
+
+        events.sort()
+        merged["times"] = [t for t, _ in events]
+        merged["classes"] = [c for _, c in events]
+    line_manager.rebuild_bins()
+    return line_manager.route_counts
+
+
+def process_sharded(video_path, line_manager, workers=None, overlap_seconds=30,
+                    min_segment_seconds=120, model_path=None, device=None, tracker="ultralytics",
+                    imgsz=None, target_fps=None, detection_filter=None):
+    """Count a video with one tracker per segment; updates and returns line_manager.route_counts.
+
+    ``imgsz``, ``target_fps`` and ``detection_filter`` are applied in every
+    segment as in backend.pipeline.CountingStage.
+    """
+    from backend.video_processor import MODEL_PATH
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    line_manager.set_video_info(fps, total_frames)
+
+    workers = workers or os.cpu_count() or 1
+    segments = plan_segments(total_frames, workers, int(overlap_seconds * fps),
+                             int(min_segment_seconds * fps))
+    if device is None:
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    lines = line_specs(line_manager)
+    log.info("Processing %s in %d segments on %d workers", video_path, len(segments), workers)
+    started = time.perf_counter()
+
+    # spawn, not fork: CUDA and Qt state must not be inherited by the workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments)), mp_context=context,
+                             initializer=_init_worker, initargs=(model_path or MODEL_PATH, device)) as pool:
+        futures = [pool.submit(_process_segment, video_path, lines, line_manager.routes, segment, tracker,
+                               imgsz, target_fps, detection_filter)
+                   for segment in segments]
+        segment_counts = []
+        for future in futures:
+            segment, route_counts = future.result()
+            log.info("Segment %d-%d done", segment[1], segment[2])
+            segment_counts.append(route_counts)
+
+    merge_route_counts(line_manager, segment_counts)
+    line_manager.frame_count = total_frames
+    log.info("Sharded run finished in %.1fs", time.perf_counter() - started)
+    return line_manager.route_counts
+
+
+def main():
+    from backend.video_processor import save_results
+    from backend.tracker import TRACKERS
+    from backend.config_store import ConfigStore, apply_lines
+    from backend.detection_filter import DetectionFilter
+
+    parser = argparse.ArgumentParser(description="Parallel time-sharded vehicle counting")
+    parser.add_argument("video")
+    parser.add_argument("--line", action="append",
+                        help="x1,y1,x2,y2 in video pixels; line IDs follow argument order "
+                             "(default: the lines saved in routes.json)")
+    parser.add_argument("--routes", default="routes.json")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--overlap", type=float, default=30, help="Warm-up overlap in seconds")
+    parser.add_argument("--tracker", choices=TRACKERS, default="ultralytics")
+    parser.add_argument("--output", default=None, help="Excel file (default ~/Downloads/vehicle_results.xlsx)")
+    args = parser.parse_args()
+
+    entry = ConfigStore(args.routes).get(args.video)
+    if entry is None or not entry["routes"]:
+        parser.error(f"No routes for {os.path.basename(args.video)} in {args.routes}")
+
+    cap = cv2.VideoCapture(args.video)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    line_manager = LineManager()
+    line_manager.set_reference_size(width, height)
+    if args.line:
+        for spec in args.line:
+            x1, y1, x2, y2 = map(float, spec.split(","))
+            line_manager.add_line((x1, y1), (x2, y2))
+    else:
+        apply_lines(line_manager, entry["lines"])
+    line_manager.load_routes(entry["routes"])
+
+    inference = entry.get("inference", {})
+    process_sharded(args.video, line_manager, workers=args.workers, overlap_seconds=args.overlap,
+                    tracker=args.tracker, imgsz=inference.get("imgsz"), target_fps=inference.get("target_fps"),
+                    detection_filter=DetectionFilter.from_config(inference))
+    save_results(line_manager, args.output)
+
+
+if __name__ == "__main__":
+    main()
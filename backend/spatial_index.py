@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class SegmentGrid:
+    """Uniform grid over a frame mapping each cell to the line segments near it.
+
+    A segment is registered in every cell whose area comes within ``margin``
+    pixels of it, so any point closer than ``margin`` to a segment finds it
+    by looking up its own cell alone. Cell contents are stored CSR-style
+    (``cell_offsets`` into ``cell_segments``), in ascending segment order.
+    Build once per line set and resolution; queries are O(candidates).
+    """
+    def __init__(self, segments, width, height, cell_size=64, margin=15):
+        self.width = int(width)
+        self.height = int(height)
+        self.cell_size = cell_size
+        self.cols = max(1, -(-self.width // cell_size))
+        self.rows = max(1, -(-self.height // cell_size))
+
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        reach = margin + cell_size * np.sqrt(0.5)  # Margin plus half a cell diagonal
+        cells, owners = [], []
+        for index, (x1, y1, x2, y2) in enumerate(segments):
+            c0, c1 = self._cell_range(min(x1, x2) - reach, max(x1, x2) + reach, self.cols)
+            r0, r1 = self._cell_range(min(y1, y2) - reach, max(y1, y2) + reach, self.rows)
+            cx, cy = np.meshgrid(np.arange(c0, c1 + 1), np.arange(r0, r1 + 1))
+            centers = (np.column_stack([cx.ravel(), cy.ravel()]) + 0.5) * cell_size
+            near = _point_segment_distance(centers, x1, y1, x2, y2) <= reach
+            cells.append(cy.ravel()[near] * self.cols + cx.ravel()[near])
+            owners.append(np.full(int(near.sum()), index))
+
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int64)
+        order = np.lexsort((owners, cells))
+        self.cell_segments = owners[order]
+        self.cell_offsets = np.searchsorted(cells[order], np.arange(self.rows * self.cols + 1))
+
+    def _cell_range(self, low, high, count):
+        return (int(np.clip(low // self.cell_size, 0, count - 1)),
+                int(np.clip(high // self.cell_size, 0, count - 1)))
+
+    def cells(self, points):
+        """Flat cell index of each (x, y) point, clamped to the frame"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        col = np.clip((points[:, 0] // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        row = np.clip((points[:, 1] // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return row * self.cols + col
+
+    def candidates(self, cell):
+        """Segment indices registered in one cell"""
+        return self.cell_segments[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+
+
+def _point_segment_distance(points, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        t = np.zeros(len(points))
+    else:
+        t = np.clip(((points[:, 0] - x1) * dx + (points[:, 1] - y1) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(points[:, 0] - (x1 + t * dx), points[:, 1] - (y1 + t * dy))
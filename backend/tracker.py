@@ -0,0 +1,228 @@
+import time
+import numpy as np
+import lap
+
+# Column layout of the (N, 7) arrays returned by every tracker's update()
+X1, Y1, X2, Y2, TRACK_ID, CONF, CLS = range(7)
+
+TRACKERS = ("ultralytics", "iou", "bytetrack", "botsort")
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes"""
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class IoUTracker:
+    """Small IoU + centroid tracker with optimal assignment.
+
+    Track boxes are advanced by a constant-velocity estimate, then matched to
+    detections by solving the assignment problem (``lap.lapjv``) on a cost
+    matrix mixing ``1 - IoU`` and the centroid distance relative to the box
+    diagonal. Unmatched detections above ``new_track_conf`` start new tracks;
+    tracks unseen for more than ``max_age`` frames are dropped.
+    """
+    def __init__(self, max_age=30, match_cost=0.8, iou_weight=0.7, new_track_conf=0.3,
+                 velocity_smoothing=0.5):
+        self.max_age = max_age
+        self.match_cost = match_cost
+        self.iou_weight = iou_weight
+        self.new_track_conf = new_track_conf
+        self.velocity_smoothing = velocity_smoothing
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 2), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.age = np.empty(0, dtype=np.int32)  # Frames since last match
+        self.next_id = 1
+
+    def _cost(self, predicted, detections):
+        iou = iou_matrix(predicted, detections)
+        centers_t = (predicted[:, :2] + predicted[:, 2:]) / 2
+        centers_d = (detections[:, :2] + detections[:, 2:]) / 2
+        distance = np.linalg.norm(centers_t[:, None] - centers_d[None], axis=2)
+        diagonal = np.hypot(predicted[:, 2] - predicted[:, 0], predicted[:, 3] - predicted[:, 1])
+        centroid_cost = np.clip(distance / np.maximum(diagonal[:, None], 1.0), 0, 1)
+        return self.iou_weight * (1 - iou) + (1 - self.iou_weight) * centroid_cost
+
+    def update(self, xyxy, conf, cls, frame=None):
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        cls = np.asarray(cls, dtype=np.float32).reshape(-1)
+
+        shift = np.tile(self.velocity * (self.age[:, None] + 1), 2)
+        predicted = self.boxes + shift
+        matched_track = np.full(len(xyxy), -1, dtype=np.int64)
+
+        if len(predicted) and len(xyxy):
+            cost = self._cost(predicted, xyxy)
+            _, track_to_det, _ = lap.lapjv(cost, extend_cost=True, cost_limit=self.match_cost)
+            for t, d in enumerate(track_to_det):
+                if d >= 0:
+                    matched_track[d] = t
+
+        # Update matched tracks
+        det_idx = np.flatnonzero(matched_track >= 0)
+        trk_idx = matched_track[det_idx]
+        matched_ids = self.ids[trk_idx]
+        if len(det_idx):
+            old_centers = (self.boxes[trk_idx, :2] + self.boxes[trk_idx, 2:]) / 2
+            new_centers = (xyxy[det_idx, :2] + xyxy[det_idx, 2:]) / 2
+            step = (new_centers - old_centers) / (self.age[trk_idx, None] + 1)
+            a = self.velocity_smoothing
+            self.velocity[trk_idx] = a * self.velocity[trk_idx] + (1 - a) * step
+            self.boxes[trk_idx] = xyxy[det_idx]
+
+        self.age += 1
+        self.age[trk_idx] = 0
+
+        # Start new tracks
+        new_idx = np.flatnonzero((matched_track < 0) & (conf >= self.new_track_conf))
+        new_ids = np.arange(self.next_id, self.next_id + len(new_idx), dtype=np.int64)
+        self.next_id += len(new_idx)
+        self.boxes = np.concatenate([self.boxes, xyxy[new_idx]])
+        self.velocity = np.concatenate([self.velocity, np.zeros((len(new_idx), 2), dtype=np.float32)])
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.age = np.concatenate([self.age, np.zeros(len(new_idx), dtype=np.int32)])
+
+        # Drop stale tracks
+        alive = self.age <= self.max_age
+        if not alive.all():
+            self.boxes, self.velocity = self.boxes[alive], self.velocity[alive]
+            self.ids, self.age = self.ids[alive], self.age[alive]
+
+        out_idx = np.concatenate([det_idx, new_idx])
+        out = np.empty((len(out_idx), 7), dtype=np.float32)
+        out[:, :4] = xyxy[out_idx]
+        out[:, TRACK_ID] = np.concatenate([matched_ids, new_ids])
+        out[:, CONF] = conf[out_idx]
+        out[:, CLS] = cls[out_idx]
+        return out
+
+
+class _Detections:
+    """The slice of ultralytics' Boxes interface that BYTETracker/BOTSORT read"""
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    @property
+    def xywh(self):
+        xywh = self.xyxy.copy()
+        xywh[:, :2] = (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2
+        xywh[:, 2:] = self.xyxy[:, 2:] - self.xyxy[:, :2]
+        return xywh
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, index):
+        return _Detections(self.xyxy[index], self.conf[index], self.cls[index])
+
+
+class UltralyticsTracker:
+    """ByteTrack or BoT-SORT from ultralytics, fed with raw detections instead of via model.track()"""
+    def __init__(self, name="bytetrack", frame_rate=30):
+        from ultralytics.trackers.byte_tracker import BYTETracker
+        from ultralytics.trackers.bot_sort import BOTSORT
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        tracker_class = {"bytetrack": BYTETracker, "botsort": BOTSORT}[name]
+        config = IterableSimpleNamespace(**yaml_load(check_yaml(f"{name}.yaml")))
+        self.tracker = tracker_class(args=config, frame_rate=frame_rate)
+
+    def reset(self):
+        self.tracker.reset()
+
+    def update(self, xyxy, conf, cls, frame=None):
+        detections = _Detections(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4),
+                                 np.asarray(conf, dtype=np.float32).reshape(-1),
+                                 np.asarray(cls, dtype=np.float32).reshape(-1))
+        tracks = self.tracker.update(detections, frame)
+        if len(tracks) == 0:
+            return np.empty((0, 7), dtype=np.float32)
+        return np.asarray(tracks[:, :7], dtype=np.float32)
+
+
+def create_tracker(name, frame_rate=30, detection_filter=None):
+    """Return a tracker for ``name``, or None for "ultralytics" (use model.track).
+
+    model.track tracks before ``detection_filter`` can drop anything, so when
+    the filter drops boxes (per-class floors, a minimum area) "ultralytics"
+    becomes the BoT-SORT it uses by default, fed from predict after filtering.
+    """
+    if name not in TRACKERS:
+        raise ValueError(f"Unknown tracker '{name}', expected one of {TRACKERS}")
+    if name == "ultralytics":
+        if detection_filter is None or not detection_filter.filters_boxes:
+            return None
+        name = "botsort"
+    if name == "iou":
+        return IoUTracker(max_age=int(frame_rate))
+    return UltralyticsTracker(name, frame_rate=int(round(frame_rate)))
+
+
+def detect_latency(model, frame, device, letterbox=None, detection_filter=None):
+    """Seconds ``track_frame`` spends detecting ``frame``, without touching any tracker state"""
+    options = detection_filter.options() if detection_filter is not None else {}
+    if letterbox is not None:
+        options["imgsz"] = list(frame.shape[:2])
+    started = time.perf_counter()
+    model.predict(frame, device=device, verbose=False, **options)
+    return time.perf_counter() - started
+
+
+def track_frame(model, tracker, frame, device, verbose=False, letterbox=None, detection_filter=None):
+    """Detect and track one frame; returns an (N, 7) array, track ID -1 where untracked.
+
+    With ``letterbox`` (backend.letterbox.LetterboxParams), ``frame`` is an
+    already letterboxed model input. Tracking runs on it as it is (trackers
+    that look at the image need boxes in its pixels) and the tracks are
+    mapped back to the source frame at the end. ``detection_filter``
+    (backend.detection_filter.DetectionFilter) sets NMS options and drops
+    detections on the device, before tracking (create_tracker never pairs a
+    filter that drops boxes with model.track).
+    """
+    options = detection_filter.options() if detection_filter is not None else {}
+    if letterbox is not None:
+        options["imgsz"] = list(frame.shape[:2])
+    if tracker is None:
+        boxes = model.track(frame, persist=True, device=device, verbose=verbose, **options)[0].boxes
+    else:
+        boxes = model.predict(frame, device=device, verbose=verbose, **options)[0].boxes
+    if detection_filter is not None and detection_filter.filters_boxes and len(boxes):
+        if letterbox is not None:
+            frame_area = letterbox.width * letterbox.height * letterbox.scale ** 2
+        else:
+            frame_area = frame.shape[0] * frame.shape[1]
+        boxes = boxes[detection_filter.keep(boxes.xyxy, boxes.conf, boxes.cls, frame_area)]
+
+    # One device-to-host copy per frame: x1, y1, x2, y2, [track ID,] conf, cls
+    data = boxes.data.cpu().numpy()
+    if data.shape[1] == 7:  # Tracked by model.track: already this module's column layout
+        out = data.astype(np.float32, copy=False)
+    else:
+        out = np.empty((len(data), 7), dtype=np.float32)
+        out[:, :4] = data[:, :4]
+        out[:, TRACK_ID] = -1
+        out[:, CONF] = data[:, 4]
+        out[:, CLS] = data[:, 5]
+    if tracker is not None:
+        out = tracker.update(out[:, :4], out[:, CONF], out[:, CLS], frame)
+    if letterbox is not None:
+        from backend.letterbox import unletterbox
+
+        out[:, :4] = unletterbox(out[:, :4], letterbox)
+    return out
@@ -0,0 +1,246 @@
+"""Memory-mapped archive of every track's trajectory, for analysis after a run.
+
+A run appends track centers to raw column files as it goes (frame order).
+When it ends the columns are reordered by (track, frame) into ``.npy``
+files, so each track is one contiguous row range, and an index of track IDs
+with CSR ``offsets`` is written beside them:
+
+    ~/.abacus/trajectories/<video>/
+        track.npy frame.npy x.npy y.npy w.npy h.npy cls.npy
+        track_ids.npy offsets.npy meta.json
+
+``TrajectoryArchive`` maps the columns read-only and walks them in chunks,
+so origin-destination matrices, speeds and crossings of lines that were
+never drawn during the run work over millions of points without loading
+them:
+
+    python -m backend.trajectories 13.mp4                     # lines from routes.json
+    python -m backend.trajectories 13.mp4 --line 100,400,600,400 --line 700,50,700,600
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from backend.logger import get_logger
+from backend.paths import data_dir, video_slug
+from backend.tracker import TRACK_ID, CLS
+
+log = get_logger("trajectories")
+
+COLUMNS = (("track", np.int32), ("frame", np.int32), ("x", np.float32), ("y", np.float32),
+           ("w", np.float32), ("h", np.float32), ("cls", np.int8))
+CROSSING_DTYPE = [("track", np.int32), ("line", np.int32), ("frame", np.int32), ("side", np.int8)]
+CHUNK_ROWS = 1 << 16  # Crossing tests hold chunk x segments arrays
+
+
+def archive_path(video_path):
+    return os.path.join(data_dir("trajectories"), video_slug(video_path))
+
+
+class TrajectoryWriter:
+    """Appends the tracked boxes of each frame to raw columns; ``close`` turns them into an archive"""
+    def __init__(self, path):
+        self.path = path
+        shutil.rmtree(path, ignore_errors=True)  # A new run of the same video replaces its archive
+        os.makedirs(path)
+        self.rows = 0
+        self._files = {name: open(os.path.join(path, name + ".raw"), "wb") for name, _ in COLUMNS}
+
+    def append(self, frame_index, tracks):
+        tracks = tracks[tracks[:, TRACK_ID] >= 0]
+        if not len(tracks):
+            return
+        boxes = tracks[:, :4]
+        values = {
+            "track": tracks[:, TRACK_ID], "frame": np.full(len(tracks), frame_index),
+            "x": (boxes[:, 0] + boxes[:, 2]) / 2, "y": (boxes[:, 1] + boxes[:, 3]) / 2,
+            "w": boxes[:, 2] - boxes[:, 0], "h": boxes[:, 3] - boxes[:, 1], "cls": tracks[:, CLS],
+        }
+        for name, dtype in COLUMNS:
+            self._files[name].write(values[name].astype(dtype).tobytes())
+        self.rows += len(tracks)
+
+    def close(self, fps, width, height, video=None):
+        """Sort the columns by (track, frame), write the index and drop the raw files"""
+        for f in self._files.values():
+            f.close()
+        if self.rows:
+            self._sort()
+        else:
+            for name, dtype in COLUMNS:
+                np.save(os.path.join(self.path, name + ".npy"), np.empty(0, dtype=dtype))
+        for name, _ in COLUMNS:
+            os.remove(os.path.join(self.path, name + ".raw"))
+
+        track = np.load(os.path.join(self.path, "track.npy"))
+        starts = np.flatnonzero(np.diff(track, prepend=track[:1] - 1))
+        np.save(os.path.join(self.path, "track_ids.npy"), track[starts])
+        np.save(os.path.join(self.path, "offsets.npy"), np.append(starts, self.rows).astype(np.int64))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"fps": fps, "width": width, "height": height, "video": video, "rows": self.rows}, f)
+        log.info("Archived %d points of %d tracks in %s", self.rows, len(starts), self.path)
+
+    def _sort(self):
+        raw = {name: np.memmap(os.path.join(self.path, name + ".raw"), dtype=dtype, mode="r", shape=(self.rows,))
+               for name, dtype in COLUMNS}
+        # Only the two sort keys are read into memory; the other columns are gathered chunk by chunk
+        order = np.lexsort((np.asarray(raw["frame"]), np.asarray(raw["track"])))
+        for name, dtype in COLUMNS:
+            out = np.lib.format.open_memmap(os.path.join(self.path, name + ".npy"), mode="w+",
+                                            dtype=dtype, shape=(self.rows,))
+            for lo in range(0, self.rows, CHUNK_ROWS):
+                out[lo:lo + CHUNK_ROWS] = raw[name][order[lo:lo + CHUNK_ROWS]]
+            out.flush()
+            del out
+
+
+class TrajectoryArchive:
+    """Read-only, memory-mapped view of an archive written by TrajectoryWriter"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.fps = self.meta["fps"]
+        self.width, self.height = self.meta["width"], self.meta["height"]
+        for name, _ in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        self.track_ids = np.load(os.path.join(path, "track_ids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def rows(self, track_id):
+        """Row range ``(lo, hi)`` of one track, or None if it is not in the archive"""
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def points(self, track_id):
+        """(frames, (k, 2) centers) of one track"""
+        lo, hi = self.rows(track_id) or (0, 0)
+        return self.frame[lo:hi], np.column_stack([self.x[lo:hi], self.y[lo:hi]])
+
+    def _chunks(self, chunk_rows):
+        """Row ranges overlapping by one row, so every consecutive pair lands in exactly one chunk"""
+        for lo in range(0, max(len(self) - 1, 0), chunk_rows):
+            yield lo, min(lo + chunk_rows + 1, len(self))
+
+    def crossings(self, segments, segment_ids=None, chunk_rows=CHUNK_ROWS):
+        """Every step between consecutive points of a track that crosses a segment.
+
+        ``segments`` is (S, 4) x1, y1, x2, y2 in archive pixels (e.g.
+        ``line_manager.line_pixels(archive.width, archive.height)``);
+        ``segment_ids`` maps them to line IDs. Returns a structured array of
+        (track, line, frame, side) in track then frame order, where side is
+        +1 or -1 for the side of the line the track ended up on.
+        """
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        segment_ids = np.arange(len(segments)) if segment_ids is None else np.asarray(segment_ids)
+        a, b = segments[:, :2], segments[:, 2:]
+        out = []
+        for lo, hi in self._chunks(chunk_rows):
+            track = np.asarray(self.track[lo:hi])
+            same = track[1:] == track[:-1]
+            p = np.column_stack([self.x[lo:hi - 1], self.y[lo:hi - 1]]).astype(np.float64)[same]
+            q = np.column_stack([self.x[lo + 1:hi], self.y[lo + 1:hi]]).astype(np.float64)[same]
+            steps = np.flatnonzero(same) + lo + 1  # Row of the point after each step
+
+            # Proper intersection: p and q on opposite sides of the line, a and b on opposite sides of the step
+            side_p = _cross(b - a, p[:, None] - a)
+            side_q = _cross(b - a, q[:, None] - a)
+            side_a = _cross((q - p)[:, None], a - p[:, None])
+            side_b = _cross((q - p)[:, None], b - p[:, None])
+            hit = (side_p * side_q < 0) & (side_a * side_b < 0)
+            step, segment = np.nonzero(hit)
+            rows = steps[step]
+            part = np.empty(len(rows), dtype=CROSSING_DTYPE)
+            part["track"], part["frame"] = self.track[rows], self.frame[rows]
+            part["line"] = segment_ids[segment]
+            part["side"] = np.sign(side_q[step, segment])
+            out.append(part)
+        if not out:
+            return np.empty(0, dtype=CROSSING_DTYPE)
+        return np.concatenate(out)
+
+    def od_matrix(self, segments, segment_ids=None, lines=None):
+        """Counts of tracks by (first line crossed, last line crossed), as a (L, L) array over ``lines``"""
+        crossed = self.crossings(segments, segment_ids)
+        lines = np.unique(crossed["line"] if lines is None else lines)
+        matrix = np.zeros((len(lines), len(lines)), dtype=np.int64)
+        if not len(crossed):
+            return lines, matrix
+        first = np.flatnonzero(np.diff(crossed["track"], prepend=crossed["track"][0] - 1))
+        last = np.append(first[1:], len(crossed)) - 1
+        origin = np.searchsorted(lines, crossed["line"][first])
+        destination = np.searchsorted(lines, crossed["line"][last])
+        moved = first != last  # Tracks that crossed more than one line
+        np.add.at(matrix, (origin[moved], destination[moved]), 1)
+        return lines, matrix
+
+    def speeds(self, metres_per_pixel=None, chunk_rows=CHUNK_ROWS):
+        """Mean speed per track (``track_ids`` order): pixels/s, or km/h given a ground scale"""
+        distance = np.zeros(len(self.track_ids))
+        duration = np.zeros(len(self.track_ids))
+        for lo, hi in self._chunks(chunk_rows):
+            track = np.asarray(self.track[lo:hi])
+            same = track[1:] == track[:-1]
+            step = np.hypot(np.diff(self.x[lo:hi]), np.diff(self.y[lo:hi]))[same]
+            frames = np.diff(self.frame[lo:hi])[same]
+            owner = np.searchsorted(self.offsets, np.flatnonzero(same) + lo, side="right") - 1
+            distance += np.bincount(owner, weights=step, minlength=len(distance))
+            duration += np.bincount(owner, weights=frames, minlength=len(duration)) / self.fps
+        speed = np.divide(distance, duration, out=np.zeros_like(distance), where=duration > 0)
+        return speed * metres_per_pixel * 3.6 if metres_per_pixel else speed
+
+
+def _cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+def main():
+    from backend.config_store import ConfigStore, apply_lines
+    from backend.line_manager import LineManager
+
+    parser = argparse.ArgumentParser(description="Origin-destination matrix and speeds from a trajectory archive")
+    parser.add_argument("video")
+    parser.add_argument("--line", action="append",
+                        help="x1,y1,x2,y2 in video pixels; line IDs follow argument order "
+                             "(default: the lines saved in routes.json)")
+    parser.add_argument("--routes", default="routes.json")
+    parser.add_argument("--metres-per-pixel", type=float, default=None)
+    args = parser.parse_args()
+
+    path = archive_path(args.video)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        parser.error(f"No trajectory archive for {os.path.basename(args.video)}; count it once first")
+    archive = TrajectoryArchive(path)
+    line_manager = LineManager()
+    line_manager.set_reference_size(archive.width, archive.height)
+    if args.line:
+        for spec in args.line:
+            x1, y1, x2, y2 = map(float, spec.split(","))
+            line_manager.add_line((x1, y1), (x2, y2))
+    else:
+        apply_lines(line_manager, (ConfigStore(args.routes).get(args.video) or {}).get("lines", []))
+    if not line_manager.lines:
+        parser.error("No lines given and none saved for this video")
+
+    lines, matrix = archive.od_matrix(line_manager.line_pixels(archive.width, archive.height),
+                                      line_manager.geometry.segment_ids, lines=line_manager.geometry.ids)
+    print(f"{len(archive)} points, {len(archive.track_ids)} tracks")
+    print("origin \\ destination " + " ".join(f"{line:>6}" for line in lines))
+    for line, row in zip(lines, matrix):
+        print(f"{line:>20} " + " ".join(f"{n:>6}" for n in row))
+    speed = archive.speeds(args.metres_per_pixel)
+    moving = speed[speed > 0]
+    if len(moving):
+        unit = "km/h" if args.metres_per_pixel else "px/s"
+        p50, p85 = np.percentile(moving, [50, 85])
+        print(f"speed ({unit}): median {p50:.1f}, 85th percentile {p85:.1f}")
+
+
+if __name__ == "__main__":
+    main()
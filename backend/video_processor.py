@@ -1,204 +1,217 @@
+import os
+os.environ.setdefault("YOLO_VERBOSE", "False")  # Silence ultralytics' per-frame console summary
+
+import asyncio
 import cv2
-import torch
-from PyQt5.QtCore import QThread, pyqtSignal, QMutex, QWaitCondition
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtGui import QImage
-from ultralytics import YOLO
-import os
-import pandas as pd
 import gc
-from datetime import datetime, timedelta
+from backend.logger import get_logger
+from backend.overlay import LineOverlay
+from backend.checkpoint import save_checkpoint, load_checkpoint, clear_checkpoint
+from backend.tracker import create_tracker
+from backend.motion_gate import MotionGate
+from backend.pipeline import (Pipeline, VideoSource, CountingStage, CallbackSink, RecorderSink,
+                              CheckpointSink, EventStoreSink, DetectionCacheSink, TrajectorySink)
+from backend.report_writer import save_report
+from backend.frame_ring import InferenceWorker
+from backend.letterbox import ModelInput
+from backend.detection_cache import cache_path
+from backend.trajectories import archive_path
+
+log = get_logger("video_processor")
+
+MODEL_PATH = "yolov12/new_best.pt"
+QUEUE_SIZE = 8  # Decoded frames buffered ahead of the counting stage
+
+
+def save_results(line_manager, file_path=None, formats=("xlsx",)):
+    """Write every counted event plus summary and interval tables (see backend.report_writer)"""
+    return save_report(line_manager, file_path, formats)
+
 
 class VideoProcessor(QThread):
+    """Runs a counting Pipeline (backend.pipeline) on its own thread and bridges it to Qt signals.
+
+    pause/resume/stop only post requests to the pipeline and return at once;
+    ``finished`` is emitted once the final checkpoint and report are written.
+
+    With ``resume`` a run continues from the video's last checkpoint. Counts
+    after a resume are approximate: the tracker starts over, and vehicles in
+    view at the checkpoint are matched back to their saved tracks by box
+    overlap (LineManager.restore_tracks), so a few may be counted differently
+    than in an uninterrupted run.
+    """
     frame_signal = pyqtSignal(QImage)
     recording_signal = pyqtSignal(bool)
     count_update = pyqtSignal(dict)
+    progress = pyqtSignal(int)  # Index of the frame last shown
 
-    def __init__(self, video_path, line_manager):
+    def __init__(self, video_path, line_manager, verbose=False, capture=None, first_frame=None,
+                 resume=False, checkpoint_interval=900, tracker="ultralytics", motion_gating=False,
+                 event_store=None, report_formats=("xlsx",), frame_interval=0.1, inference_process=False,
+                 cache_detections=True, archive_trajectories=True, imgsz=None, target_fps=None,
+                 detection_filter=None):
         super().__init__()
         self.line_manager = line_manager
         self.video_path = video_path
+        self.verbose = verbose  # Pass through to ultralytics' own per-frame output
         self.running = True
         self.paused = False
         self.recording = False
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        self.mutex = QMutex()
-        self.pause_condition = QWaitCondition()
-        self.cap = None  # Add video capture as instance variable
+        self.device = None  # Resolved in run() so torch is not imported on the GUI thread
+
+        self.source = VideoSource(video_path, capture=capture, first_frame=first_frame)
+        self.recorder = RecorderSink("output.avi", fps=20.0)
+        self.pipeline = None
+        self.resume_from_checkpoint = resume  # Continue from the last checkpoint of this video, if it matches
+        self.checkpoint_interval = checkpoint_interval  # Frames between checkpoints; 0 disables
+        self.tracker_name = tracker  # "ultralytics" (model.track) or a backend.tracker option
+        self.motion_gate = MotionGate() if motion_gating else None  # Skip inference on static frames
+        self.event_store = event_store  # Optional EventStore receiving every counted vehicle
+        self.report_formats = report_formats
+        self.frame_interval = frame_interval  # Display pacing in seconds per frame; 0 runs flat out
+        self.inference_process = inference_process  # Run the model in a child process fed via shared memory
+        self.cache_detections = cache_detections  # Keep this run's tracks for backend.detection_cache.recount
+        self.archive_trajectories = archive_trajectories  # Memory-mapped trajectories (backend.trajectories)
+        self.imgsz = imgsz  # Model input size: None (model default), pixels, or "auto"
+        self.target_fps = target_fps  # Frame rate "auto" sizes for; default the video's own
+        self.detection_filter = detection_filter  # backend.detection_filter.DetectionFilter, or None for all boxes
 
     def run(self):
-        print(f"Using device: {self.device.upper()}")
-        model = YOLO("yolov12/new_best.pt").to(self.device)
-        self.cap = cv2.VideoCapture(self.video_path)
-        
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.line_manager.set_video_info(fps, total_frames)
-        
-        # Initialize VideoWriter for recording
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out = None
-        first_frame = True
-
-        while self.cap.isOpened() and self.running:
-            self.mutex.lock()
+        # Heavy imports live here (usually already warmed by backend.preload)
+        import torch
+        from ultralytics import YOLO
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        log.info("Using device: %s", self.device.upper())
+        try:
+            self.source.open()
+        except Exception:
+            log.exception("Cannot open %s", self.video_path)
+            return
+
+        fps, total_frames = self.source.fps, self.source.total_frames
+        model = detector = model_input = stage = None
+        finished = False
+        # From here until the run ends GUI edits (LineManager.edit) wait for frame boundaries
+        self.line_manager.begin_run()
+        try:
+            if self.imgsz is not None:
+                model_input = ModelInput(self.imgsz, self.target_fps or fps, buffers=QUEUE_SIZE + 4,
+                                         device=self.device)
+            if self.inference_process:
+                frame_shape = (model_input.max_shape(self.source.width, self.source.height) if model_input
+                               else (self.source.height, self.source.width, 3))
+                detector = InferenceWorker(frame_shape, MODEL_PATH, self.device,
+                                           tracker=self.tracker_name, fps=fps, slots=QUEUE_SIZE + 2,
+                                           verbose=self.verbose, detection_filter=self.detection_filter)
+            else:
+                model = YOLO(MODEL_PATH).to(self.device)
+            self.line_manager.set_video_info(fps, total_frames)
+
+            frame_index = 0
+            if self.resume_from_checkpoint and self.line_manager.route_counts:
+                resume_at = load_checkpoint(self.video_path, self.line_manager)
+                if resume_at:
+                    self.source.seek(resume_at)
+                    frame_index = resume_at
+
+            stage = CountingStage(model, self.device, self.line_manager,
+                                  tracker=create_tracker(self.tracker_name, frame_rate=fps,
+                                                         detection_filter=self.detection_filter),
+                                  motion_gate=self.motion_gate, overlay=LineOverlay(), verbose=self.verbose,
+                                  detector=detector, model_input=model_input,
+                                  detection_filter=self.detection_filter)
+            stage.position = frame_index
+            sinks = [CallbackSink(self._emit), self.recorder,
+                     CheckpointSink(self.video_path, self.line_manager, self.checkpoint_interval)]
+            if self.cache_detections and self.motion_gate is None and os.path.isfile(self.video_path):
+                # Gated runs skip frames depending on where the lines were, so only ungated runs are cached
+                try:
+                    sinks.append(DetectionCacheSink(cache_path(self.video_path, MODEL_PATH, self.tracker_name),
+                                                    fps))
+                except OSError as e:
+                    log.warning("Not caching detections: %s", e)
+            if self.archive_trajectories and os.path.isfile(self.video_path):
+                sinks.append(TrajectorySink(archive_path(self.video_path), fps, self.video_path))
+            if self.event_store is not None:
+                # Events after the resume point were recorded by the interrupted run and will be counted again
+                sinks.append(EventStoreSink(self.event_store, self.video_path, self.line_manager,
+                                            after=frame_index / fps if frame_index else None))
+
+            self.pipeline = Pipeline(self.source, stage, sinks, queue_size=QUEUE_SIZE,
+                                     frame_interval=self.frame_interval)
+            if not self.running:
+                self.pipeline.cancel()
             if self.paused:
-                self.pause_condition.wait(self.mutex)
-            self.mutex.unlock()
-
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-
-            # Perform object detection
-            results = model.track(frame, persist=True, device=self.device)
-            annotated_frame = results[0].plot() if hasattr(results[0], "plot") else frame
-
-            # Process lines and counting
-            if self.line_manager and results[0].boxes.id is not None:
-                # Set reference size on first frame
-                if first_frame:
-                    h, w = annotated_frame.shape[:2]
-                    self.line_manager.set_reference_size(w, h)
-                    first_frame = False
-
-                # Draw all stored lines
-                for line_id, line_data in self.line_manager.lines.items():
-                    start = line_data['start']
-                    end = line_data['end']
-                    # Convert coordinates to video resolution
-                    start_x = int(start.x() * (w / self.line_manager.reference_width))
-                    start_y = int(start.y() * (h / self.line_manager.reference_height))
-                    end_x = int(end.x() * (w / self.line_manager.reference_width))
-                    end_y = int(end.y() * (h / self.line_manager.reference_height))
-                    
-                    cv2.line(annotated_frame, 
-                             (start_x, start_y),
-                             (end_x, end_y),
-                             (0, 255, 0), 2)
-                    mid_x = (start_x + end_x) // 2
-                    mid_y = (start_y + end_y) // 2
-                    cv2.putText(annotated_frame, f"Line {line_id}", 
-                                (mid_x - 20, mid_y - 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-
-                # Check for line crossings
-                detections = []
-                for box, cls, track_id in zip(results[0].boxes.xyxy, 
-                                                results[0].boxes.cls,
-                                                results[0].boxes.id):
-                    detections.append({
-                        'id': track_id.item() if track_id is not None else None,
-                        'cls': cls.item(),
-                        'box': box.tolist()
-                    })
-                print("Detected IDs:", [d["id"] for d in detections])
-                
-                self.line_manager.check_line_crossing(detections, annotated_frame.shape)
-                print("Updated counts:", self.line_manager.route_counts, "###########")
-                self.count_update.emit(self.line_manager.route_counts.copy())
-
-            # Recording logic
-            if self.recording:
-                if out is None:
-                    h, w, _ = annotated_frame.shape
-                    out = cv2.VideoWriter('output.avi', fourcc, 20.0, (w, h))
-                out.write(annotated_frame)
-
-            # Convert to QImage
-            rgb_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_frame.shape
-            q_img = QImage(rgb_frame.data, w, h, ch * w, QImage.Format_RGB888)
-            self.frame_signal.emit(q_img)
-            cv2.waitKey(100)
-
-        # Cleanup resources
-        if self.cap:
-            self.cap.release()
-        if out:
-            out.release()
-        
-        # Save results to Excel before finishing
-        self.save_results()
+                self.pipeline.pause()
+            try:
+                finished = asyncio.run(self.pipeline.run())
+            except Exception:
+                # E.g. the inference process died; keep what was counted so far (checkpoint, report)
+                log.exception("Counting run of %s failed at frame %d", self.video_path, stage.position)
+                finished = False
+        except Exception:
+            log.exception("Could not start counting %s", self.video_path)
+            self.source.close()  # The pipeline closes it once it has run
+        finally:
+            if detector is not None:
+                detector.close()
+            self.line_manager.end_run()
+
+        if stage is not None:
+            frame_index = stage.position  # The source may have read ahead of what was counted
+            if self.motion_gate is not None:
+                log.info("Motion gate skipped inference on %d of %d frames", self.motion_gate.skipped, frame_index)
+
+            if finished:
+                clear_checkpoint(self.video_path)
+            elif frame_index and self.checkpoint_interval:
+                save_checkpoint(self.video_path, self.line_manager, frame_index)
+
+            # Save results to Excel before finishing
+            self.save_results()
+
+        del model, stage
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        gc.collect()
+
+    def _emit(self, result):
+        """Pipeline display sink: runs on this thread, Qt queues the signals to the GUI"""
+        if result.counts is not None:
+            self.count_update.emit(result.counts)
+        rgb_frame = cv2.cvtColor(result.frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_frame.shape
+        q_img = QImage(rgb_frame.data, w, h, ch * w, QImage.Format_RGB888)
+        self.frame_signal.emit(q_img.copy())
+        self.progress.emit(result.index)
 
     def save_results(self):
         """Save results with timestamps"""
-        rows = []
-        for (origin, destination), data in self.line_manager.route_counts.items():
-            # Find the route info to get the start time
-            route_info = next(
-                (r for r in self.line_manager.routes 
-                if r["origin"] == origin and r["destination"] == destination),
-                None
-            )
-            
-            start_time_str = route_info["start_time"] if route_info else "00:00:00 AM"
-            
-            # Convert string time to datetime
-            try:
-                start_time = datetime.strptime(start_time_str, "%I:%M:%S %p")
-            except ValueError:
-                start_time = datetime.strptime("00:00:00 AM", "%I:%M:%S %p")
-            
-            for cls_id, count in data["counts"].items():
-                if count > 0:
-                    class_name = self.line_manager.class_names.get(cls_id, f"Class_{cls_id}")
-                    # Calculate actual times for each detection
-                    for i, sec in enumerate(data.get("times", [])[:count]):
-                        detection_time = start_time + timedelta(seconds=sec)
-                        time_str = detection_time.strftime("%I:%M:%S %p").lstrip("0")
-                        
-                        rows.append({
-                            "Origin Line": origin,
-                            "Destination Line": destination,
-                            "Direction": data["direction"],
-                            "Vehicle Type": class_name,
-                            "Detection Time": time_str,
-                            "Frame Number": int(sec * self.line_manager.fps)
-                        })
-        
-        if rows:
-            df = pd.DataFrame(rows)
-        else:
-            df = pd.DataFrame(columns=[
-                "Origin Line", "Destination Line", "Direction", 
-                "Vehicle Type", "Detection Time", "Frame Number"
-            ])
-        
-        downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-        file_path = os.path.join(downloads_path, "vehicle_results.xlsx")
-        df.to_excel(file_path, index=False)
-        print(f"Results saved to {file_path}")
+        save_results(self.line_manager, formats=self.report_formats)
 
     def pause(self):
-        self.mutex.lock()
         self.paused = True
-        self.mutex.unlock()
+        if self.pipeline is not None:
+            self.pipeline.pause()
 
     def resume(self):
-        self.mutex.lock()
         self.paused = False
-        self.pause_condition.wakeAll()
-        self.mutex.unlock()
+        if self.pipeline is not None:
+            self.pipeline.resume()
 
     def stop(self):
+        """Ask the pipeline to stop; returns immediately (connect to ``finished`` to know when it has)"""
         self.running = False
-        # self.cleanup()
-        self.resume()
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-        torch.cuda.empty_cache()
-        gc.collect() 
-        self.wait()
+        if self.pipeline is not None:
+            self.pipeline.cancel()
 
     def start_recording(self):
-        self.mutex.lock()
-        self.recording = True
+        self.recording = self.recorder.enabled = True
         self.recording_signal.emit(True)
-        self.mutex.unlock()
 
     def stop_recording(self):
-        self.mutex.lock()
-        self.recording = False
+        self.recording = self.recorder.enabled = False
         self.recording_signal.emit(False)
-        self.mutex.unlock()
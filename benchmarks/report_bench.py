@@ -0,0 +1,90 @@
+"""Compare the old pandas/openpyxl Excel export with backend.report_writer.
+
+Run from the repository root:
+
+    python benchmarks/report_bench.py [--events 200000]
+
+Builds a LineManager with synthetic events spread over a day and times both
+paths writing to a temporary directory. Peak Python heap use is measured with
+tracemalloc in a separate pass so it does not distort the timings.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.line_manager import LineManager  # noqa: E402
+from backend.report_writer import save_report  # noqa: E402
+
+
+def build_line_manager(events, routes=8):
+    line_manager = LineManager()
+    line_manager.load_routes([
+        {"origin": i, "destination": i + 1, "direction": f"D{i}", "start_time": "06:00:00 AM"}
+        for i in range(0, routes * 2, 2)
+    ])
+    rng = random.Random(0)
+    keys = list(line_manager.route_counts)
+    for t in sorted(rng.uniform(0, 12 * 3600) for _ in range(events)):
+        key, cls = rng.choice(keys), rng.randrange(7)
+        data = line_manager.route_counts[key]
+        data["counts"][cls] += 1
+        data.setdefault("times", []).append(t)
+        data.setdefault("classes", []).append(cls)
+    line_manager.rebuild_bins()
+    return line_manager
+
+
+def legacy_save(line_manager, file_path):
+    """The pre-report_writer export: list of dicts -> DataFrame -> openpyxl"""
+    import pandas as pd
+
+    rows = []
+    start_time = datetime.strptime("06:00:00 AM", "%I:%M:%S %p")
+    for (origin, destination), data in line_manager.route_counts.items():
+        for sec, cls_id in zip(data.get("times", []), data.get("classes", [])):
+            detection_time = start_time + timedelta(seconds=sec)
+            rows.append({
+                "Origin Line": origin,
+                "Destination Line": destination,
+                "Direction": data["direction"],
+                "Vehicle Type": line_manager.class_names.get(cls_id),
+                "Detection Time": detection_time.strftime("%I:%M:%S %p").lstrip("0"),
+                "Frame Number": int(sec * line_manager.fps)
+            })
+    pd.DataFrame(rows).to_excel(file_path, index=False)
+
+
+def measure(label, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.2f} s   peak {peak / 2**20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+
+    line_manager = build_line_manager(args.events)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.events} events")
+        measure("pandas + openpyxl", lambda: legacy_save(line_manager, os.path.join(tmp, "legacy.xlsx")))
+        for fmt in ("xlsx", "csv"):
+            measure(f"report_writer {fmt}",
+                    lambda: save_report(line_manager, os.path.join(tmp, "new.xlsx"), formats=(fmt,)))
+
+
+if __name__ == "__main__":
+    main()
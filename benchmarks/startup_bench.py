@@ -0,0 +1,57 @@
+"""Measure time from a cold interpreter to a shown main window.
+
+Run from the repository root:
+
+    python benchmarks/startup_bench.py [--runs 5]
+
+Each run is a fresh subprocess using the offscreen Qt platform, so the numbers
+include module imports. The script also reports which heavy modules were
+already imported when the window appeared - ideally none of them.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+from frontend.video_display import YOLOApp
+t_import = time.perf_counter()
+window = YOLOApp()
+window.show()
+app.processEvents()
+t_shown = time.perf_counter()
+heavy = [m for m in ("torch", "ultralytics", "pandas", "openpyxl") if m in sys.modules]
+print(json.dumps({"import": t_import - t0, "shown": t_shown - t0, "heavy": heavy}))
+"""
+
+
+def run_once():
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    imports = [s["import"] for s in samples]
+    shown = [s["shown"] for s in samples]
+    print(f"import frontend.video_display: median {statistics.median(imports) * 1000:.0f} ms")
+    print(f"window shown:                  median {statistics.median(shown) * 1000:.0f} ms")
+    print(f"heavy modules loaded at show:  {samples[-1]['heavy'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
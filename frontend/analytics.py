@@ -4,7 +4,6 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtGui import QFont, QPainter
 from PyQt5.QtCore import Qt, QTimer
-import pyqtgraph as pg
 import random
 
 
@@ -37,15 +36,21 @@ class Dashboard(QWidget):
         graph_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(graph_label)
 
-        self.plot = pg.PlotWidget()
-        self.plot.setYRange(0, 100)
-        self.data = [random.randint(10, 40) for _ in range(50)]
-        self.curve = self.plot.plot(self.data, pen='c')
-        layout.addWidget(self.plot)
-
+        # pyqtgraph is slow to import; build the plot once the window is on screen
+        self.plot_layout = QVBoxLayout()
+        layout.addLayout(self.plot_layout)
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_plot)
-        self.timer.start(500)
+        QTimer.singleShot(0, self.init_plot)
+
+        # Vehicles per interval, read from the event store
+        interval_label = QLabel("Vehicles per 15 min")
+        interval_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(interval_label)
+        self.interval_layout = QVBoxLayout()
+        layout.addLayout(self.interval_layout)
+        self.interval_plot = None
+        self.pending_intervals = None
 
         # System Usage Details
         details_label = QLabel("Details")
@@ -97,6 +102,40 @@ class Dashboard(QWidget):
             label.setStyleSheet(f"color: {color}")
         return label
 
+    def init_plot(self):
+        import pyqtgraph as pg
+
+        self.plot = pg.PlotWidget()
+        self.plot.setYRange(0, 100)
+        self.data = [random.randint(10, 40) for _ in range(50)]
+        self.curve = self.plot.plot(self.data, pen='c')
+        self.plot_layout.addWidget(self.plot)
+        self.timer.start(500)
+
+        self.interval_plot = pg.PlotWidget()
+        self.interval_plot.setLabel('bottom', "Hour of day")
+        self.interval_layout.addWidget(self.interval_plot)
+        if self.pending_intervals is not None:
+            self.show_intervals(self.pending_intervals)
+
+    def show_intervals(self, histogram, bin_seconds=900):
+        """Draw {bin_start_seconds: count} as a bar chart over hour of day"""
+        if self.interval_plot is None:
+            self.pending_intervals = histogram
+            return
+        import pyqtgraph as pg
+
+        self.pending_intervals = None
+        self.interval_plot.clear()
+        if not histogram:
+            return
+        starts = sorted(histogram)
+        bars = pg.BarGraphItem(
+            x=[s / 3600 for s in starts], height=[histogram[s] for s in starts],
+            width=bin_seconds / 3600 * 0.9, brush='c'
+        )
+        self.interval_plot.addItem(bars)
+
     def update_plot(self):
         self.data = self.data[1:] + [random.randint(10, 80)]
         self.curve.setData(self.data)
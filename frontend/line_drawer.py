@@ -1,22 +1,41 @@
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QPixmap, QPainter, QPen, QImage
+from PyQt5.QtGui import QPixmap, QPainter, QPen, QImage, QPolygon, QColor
 from PyQt5.QtCore import Qt, QPoint, pyqtSignal
 
 class LineDrawer(QLabel):
+    """Video frame that records drawn gates and zones in original video coordinates.
+
+    Modes: "line" drags a straight line; "polyline" and "zone" add a vertex
+    per left click and finish on double-click or right-click.
+    """
+    MODES = ("line", "polyline", "zone")
+
     line_drawn = pyqtSignal(QPoint, QPoint)
+    polyline_drawn = pyqtSignal(list)
+    zone_drawn = pyqtSignal(list)
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.mode = "line"
         self.lines = []
+        self.zones = []
         self.current_line = []
+        self.hover = None
         self.original_size = QPoint(1, 1)
         self.display_size = QPoint(1, 1)
         self.offset = QPoint(0, 0)
 
-    def load_frame(self, q_img):
-        """Store original dimensions and calculate display parameters"""
+    def load_frame(self, q_img, source_size=None):
+        """Store original dimensions and calculate display parameters.
+
+        ``source_size`` is the (width, height) of the video when ``q_img`` is a
+        downscaled preview, so drawn lines still map to original coordinates.
+        """
         # Original video dimensions
-        self.original_size = QPoint(q_img.width(), q_img.height())
+        if source_size is not None:
+            self.original_size = QPoint(*source_size)
+        else:
+            self.original_size = QPoint(q_img.width(), q_img.height())
         
         # Calculate display size with aspect ratio preservation
         self.display_size = self.calculate_display_size(q_img)
@@ -53,23 +72,63 @@ class LineDrawer(QLabel):
         dy = (self.height() - self.display_size.y()) // 2
         return QPoint(dx, dy)
 
+    def set_mode(self, mode):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown drawing mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.current_line = []
+        self.hover = None
+        self.update()
+
     def mousePressEvent(self, event):
+        if self.mode != "line":
+            if event.button() == Qt.LeftButton:
+                self.current_line.append(self.adjust_position(event.pos()))
+                self.setMouseTracking(True)
+            elif event.button() == Qt.RightButton:
+                self.finish_shape()
+            self.update()
+            return
+
         if event.button() == Qt.LeftButton:
             # Adjust for letterboxing and scale to original coordinates
             adjusted_pos = self.adjust_position(event.pos())
             self.current_line = [adjusted_pos]
 
+    def mouseDoubleClickEvent(self, event):
+        if self.mode != "line" and event.button() == Qt.LeftButton:
+            # The press before the double-click already added this vertex
+            self.finish_shape()
+
+    def finish_shape(self):
+        """Emit the polyline or zone being drawn, if it has enough vertices"""
+        points, self.current_line, self.hover = self.current_line, [], None
+        self.setMouseTracking(False)
+        if self.mode == "polyline" and len(points) >= 2:
+            self.lines.append(points)
+            self.polyline_drawn.emit(points)
+        elif self.mode == "zone" and len(points) >= 3:
+            self.zones.append(points)
+            self.zone_drawn.emit(points)
+        self.update()
+
     def mouseMoveEvent(self, event):
+        if self.mode != "line":
+            if self.current_line:
+                self.hover = self.adjust_position(event.pos())
+                self.update()
+            return
+
         if self.current_line:
             adjusted_pos = self.adjust_position(event.pos())
             self.current_line.append(adjusted_pos)
             self.update()
 
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and self.current_line:
+        if self.mode == "line" and event.button() == Qt.LeftButton and self.current_line:
             adjusted_pos = self.adjust_position(event.pos())
             self.current_line.append(adjusted_pos)
-            self.lines.append(self.current_line)
+            self.lines.append([self.current_line[0], self.current_line[-1]])
             self.line_drawn.emit(self.current_line[0], self.current_line[-1])
             self.current_line = []
             self.update()
@@ -118,9 +177,17 @@ class LineDrawer(QLabel):
         for line in self.lines:
             if len(line) >= 2:
                 # Convert back to display coordinates for drawing
-                start = self.scale_to_display(line[0])
-                end = self.scale_to_display(line[-1])
-                painter.drawLine(start, end)
+                painter.drawPolyline(QPolygon([self.scale_to_display(p) for p in line]))
+
+        painter.setPen(QPen(QColor(0, 128, 255), 2, Qt.SolidLine))
+        for zone in self.zones:
+            painter.drawPolygon(QPolygon([self.scale_to_display(p) for p in zone]))
+
+        # Polyline or zone in progress, with a rubber band to the cursor
+        if self.mode != "line" and self.current_line:
+            painter.setPen(QPen(Qt.yellow, 2, Qt.DashLine))
+            points = self.current_line + ([self.hover] if self.hover is not None else [])
+            painter.drawPolyline(QPolygon([self.scale_to_display(p) for p in points]))
 
     def scale_to_display(self, point):
         """Convert original coordinates back to display coordinates"""
@@ -132,8 +199,17 @@ class LineDrawer(QLabel):
             int(point.y() * scale_y) + self.offset.y()
         )
         
+    def set_lines(self, lines, zones=()):
+        """Show previously saved lines (point lists) and zones given in original coordinates"""
+        self.lines = [list(points) for points in lines]
+        self.zones = [list(points) for points in zones]
+        self.current_line = []
+        self.update()
+
     def clear_lines(self):
-        """Clear all stored lines"""
+        """Clear all stored lines and zones"""
         self.lines = []
+        self.zones = []
         self.current_line = []
+        self.hover = None
         self.update() 
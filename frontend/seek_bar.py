@@ -0,0 +1,168 @@
+import threading
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QSlider, QLabel, QHBoxLayout
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from backend.logger import get_logger
+
+log = get_logger("seek_bar")
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class SeekBar(QWidget):
+    """Timeline slider over a video's frames (1-based, as the pipeline counts them)"""
+    scrubbed = pyqtSignal(int)  # Dragging: show something close, fast
+    seeked = pyqtSignal(int)    # Released or clicked: show exactly this frame
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.fps = 30
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setTracking(True)
+        self.time_label = QLabel("--:-- / --:--")
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.slider)
+        layout.addWidget(self.time_label)
+        self.slider.valueChanged.connect(self._value_changed)
+        self.slider.sliderReleased.connect(lambda: self.seeked.emit(self.slider.value()))
+        self.set_video(0, 30)
+
+    def set_video(self, total_frames, fps):
+        self.fps = fps or 30
+        self.slider.blockSignals(True)
+        self.slider.setRange(1, max(total_frames, 1))
+        self.slider.setValue(1)
+        self.slider.setPageStep(max(int(self.fps * 10), 1))  # Click beside the handle: 10 seconds
+        self.slider.blockSignals(False)
+        self.setEnabled(total_frames > 0)
+        self._update_label()
+
+    def set_position(self, frame_index):
+        """Follow playback without emitting seek signals"""
+        self.slider.blockSignals(True)
+        self.slider.setValue(frame_index)
+        self.slider.blockSignals(False)
+        self._update_label()
+
+    def _value_changed(self, value):
+        self._update_label()
+        if self.slider.isSliderDown():
+            self.scrubbed.emit(value)
+        else:
+            self.seeked.emit(value)  # Keyboard, page clicks
+
+    def _update_label(self):
+        self.time_label.setText(f"{format_time(self.slider.value() / self.fps)} / "
+                                f"{format_time(self.slider.maximum() / self.fps)}")
+
+
+class PreviewWorker(QThread):
+    """Decodes seek-bar previews off the GUI thread; only the newest request is served.
+
+    Also looks up the video's cached detections (backend.detection_cache) and,
+    on request, replays them into a CountTimeline for counts-to-date or
+    recounts the video from them (events and report included).
+    """
+    preview_ready = pyqtSignal(int, object, object)  # frame index, BGR frame, (N, 7) tracks or None
+    timeline_ready = pyqtSignal(object)               # backend.scrubbing.CountTimeline
+    recounted = pyqtSignal(object)                    # The recounted LineManager, or None without a cache
+
+    def __init__(self, video_path, model_path, tracker):
+        super().__init__()
+        self.video_path = video_path
+        self.model_path = model_path
+        self.tracker = tracker
+        self.cache = None
+        self._condition = threading.Condition()
+        self._frame_request = None   # (frame index, exact)
+        self._timeline_request = None  # LineManager to replay the cache into
+        self._recount_request = None   # (LineManager, EventStore or None)
+        self._running = True
+
+    def request_frame(self, frame_index, exact):
+        with self._condition:
+            self._frame_request = (frame_index, exact)
+            self._condition.notify()
+
+    def request_timeline(self, line_manager):
+        """Replay the cache into ``line_manager`` (a copy the worker may own) and emit its timeline"""
+        with self._condition:
+            self._timeline_request = line_manager
+            self._condition.notify()
+
+    def request_recount(self, line_manager, event_store=None):
+        """Recount the video into ``line_manager`` (a copy the worker may own) and emit ``recounted``"""
+        with self._condition:
+            self._recount_request = (line_manager, event_store)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def run(self):
+        from backend.detection_cache import find_cache
+        from backend.scrubbing import FrameSeeker, CountTimeline
+
+        seeker = FrameSeeker(self.video_path)
+        self.cache = find_cache(self.video_path, self.model_path, self.tracker)
+        try:
+            while True:
+                with self._condition:
+                    while (self._running and self._frame_request is None and self._timeline_request is None
+                           and self._recount_request is None):
+                        self._condition.wait()
+                    if not self._running:
+                        return
+                    frame_request, self._frame_request = self._frame_request, None
+                    line_manager, self._timeline_request = self._timeline_request, None
+                    recount_request, self._recount_request = self._recount_request, None
+
+                if frame_request is not None:
+                    frame_index, exact = frame_request
+                    if not exact:
+                        frame_index = seeker.snap(frame_index)
+                    frame = seeker.frame(frame_index)
+                    if frame is not None:
+                        self.preview_ready.emit(frame_index, frame, self._tracks(frame_index))
+                if line_manager is not None and self.cache is not None:
+                    self.cache.replay(line_manager, self._stopped)
+                    if self._running:
+                        self.timeline_ready.emit(CountTimeline(line_manager))
+                if recount_request is not None:
+                    line_manager = self._recount(*recount_request)
+                    if self._running:
+                        self.recounted.emit(line_manager)
+        finally:
+            seeker.close()
+
+    def _stopped(self):
+        """Polled by long replays so stop() does not wait for them"""
+        return not self._running
+
+    def _recount(self, line_manager, event_store):
+        from backend.detection_cache import recount
+        from backend.video_processor import save_results
+
+        if self.cache is None or not recount(self.video_path, line_manager, self.model_path, self.tracker,
+                                             event_store, self.cache, self._stopped):
+            return None
+        if self._running:
+            try:
+                save_results(line_manager)
+            except Exception:
+                log.exception("Could not save the recounted results")  # The counts are still shown
+        return line_manager
+
+    def _tracks(self, frame_index):
+        """Cached tracks of the last inferred frame at or before ``frame_index``"""
+        if self.cache is None or not len(self.cache):
+            return None
+        i = np.searchsorted(self.cache.frames, frame_index, side="right") - 1
+        return self.cache.tracks(i) if i >= 0 else None
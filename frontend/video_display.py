@@ -1,17 +1,32 @@
 import sys
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QFileDialog, 
-    QHBoxLayout, QStyle, QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem, QFrame, QGridLayout
+    QHBoxLayout, QStyle, QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem, QFrame, QGridLayout,
+    QComboBox, QCheckBox, QMessageBox
 )
 from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import Qt, QPoint
-from backend.video_processor import VideoProcessor
+from PyQt5.QtCore import Qt, QPoint, QTimer
+from backend.video_processor import VideoProcessor, MODEL_PATH
+from backend.checkpoint import checkpoint_frame
 from backend.line_manager import LineManager
 from frontend.line_drawer import LineDrawer
+from frontend.seek_bar import SeekBar, PreviewWorker
 import cv2
-import json
 import os
 from frontend.analytics import Dashboard
+from backend.logger import get_logger
+from backend.media_probe import MediaProbe
+from backend.tracker import TRACKERS
+from backend.letterbox import IMGSZ_LADDER
+from backend.detection_filter import DetectionFilter
+from backend.event_store import EventStore
+from backend.paths import video_slug
+from backend.config_store import ConfigStore, lines_to_config, apply_lines, zones_to_config, apply_zones
+from backend.scrubbing import CountTimeline
+from backend.overlay import draw_boxes
+from backend.tracker import TRACK_ID, CLS
+
+log = get_logger("gui")
 
 class YOLOApp(QWidget):
     """Main PyQt5 GUI Application with structured 3-column layout"""
@@ -19,7 +34,19 @@ class YOLOApp(QWidget):
         super().__init__()
         self.video_path = None
         self.processor = None
-        self.line_manager = LineManager()
+        self.preview = None  # PreviewWorker decoding seek-bar frames for the loaded video
+        self.timeline = None  # CountTimeline for counts-to-date while scrubbing
+        self.timeline_requested = False
+        self.recounting = None  # Layout copy the preview worker is recounting into
+        self.inference = {}  # routes.json "inference" settings of the loaded video (input size, detection filter)
+        self.stopping = set()  # Processors finishing their final checkpoint/report in the background
+        self.line_manager = LineManager()  # Counting state; a run owns it and applies edits between frames
+        self.layout_state = LineManager()  # The GUI's own lines, zones and routes, current even while edits are queued
+        self.media_probe = MediaProbe()
+        self.event_store = EventStore()
+        self.config_store = ConfigStore("routes.json")
+        self.interval_timer = QTimer(self)
+        self.interval_timer.timeout.connect(self.refresh_intervals)
         self.class_names = {
             0: "Passenger Car", 1: "Motorbike", 2: "Van",
             3: "Truck", 4: "Large Truck", 5: "Bus", 6: "Minibus"
@@ -38,16 +65,19 @@ class YOLOApp(QWidget):
         self.video_label.setAlignment(Qt.AlignCenter)
         self.video_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         
+        self.seek_bar = SeekBar()
+
         # Button Layout
         button_layout = self.create_button_layout()
         
         # Add components to column 1 with stretch factors
         col1.addWidget(self.video_label, 70)  # 70% of column height
+        col1.addWidget(self.seek_bar)
         col1.addLayout(button_layout, 10)     # 10% height for buttons
         col1.addWidget(self.create_route_table(), 20)  # 20% height for route table
         
         # Column 2: Placeholder
-        col2 = Dashboard()
+        col2 = self.dashboard = Dashboard()
         
         # Column 3: Vehicle Counts
         col3 = QVBoxLayout()
@@ -73,6 +103,18 @@ class YOLOApp(QWidget):
         self.stop_button = QPushButton()
         self.record_button = QPushButton()
         self.draw_line_button = QPushButton("Draw Line")
+        self.draw_mode_combo = QComboBox()
+        self.draw_mode_combo.addItems(["Line", "Polyline", "Zone"])
+        self.draw_mode_combo.setToolTip("Polyline/Zone: click to add points, double-click to finish")
+        self.tracker_combo = QComboBox()
+        self.tracker_combo.addItems(TRACKERS)
+        self.tracker_combo.setToolTip("Tracker")
+        self.motion_gate_check = QCheckBox("Skip static frames")
+        self.inference_process_check = QCheckBox("Separate inference process")
+        self.imgsz_combo = QComboBox()
+        self.imgsz_combo.addItems(["Native", "Auto"] + [str(size) for size in IMGSZ_LADDER])
+        self.imgsz_combo.setToolTip("Model input size (saved per camera with the routes); "
+                                    "Auto picks the largest size that keeps up with the video")
         
         # Set icons
         icons = self.style().standardIcon
@@ -90,6 +132,12 @@ class YOLOApp(QWidget):
         for btn in buttons:
             btn.setFixedSize(40, 40) if btn != self.draw_line_button else None
             layout.addWidget(btn)
+            if btn == self.draw_line_button:
+                layout.addWidget(self.draw_mode_combo)
+        layout.addWidget(self.tracker_combo)
+        layout.addWidget(self.motion_gate_check)
+        layout.addWidget(self.inference_process_check)
+        layout.addWidget(self.imgsz_combo)
         
         return layout
 
@@ -113,6 +161,10 @@ class YOLOApp(QWidget):
         self.record_button.clicked.connect(self.toggle_recording)
         self.draw_line_button.clicked.connect(self.start_drawing)
         self.video_label.line_drawn.connect(self.store_line)
+        self.video_label.polyline_drawn.connect(self.store_polyline)
+        self.video_label.zone_drawn.connect(self.store_zone)
+        self.seek_bar.scrubbed.connect(lambda index: self.preview_frame(index, exact=False))
+        self.seek_bar.seeked.connect(lambda index: self.preview_frame(index, exact=True))
     ################################################################
         
     def update_counts(self, route_counts):
@@ -252,11 +304,26 @@ class YOLOApp(QWidget):
     def start_drawing(self):
         """Enables line drawing mode."""
         self.video_label.setCursor(Qt.CrossCursor)
+        self.video_label.set_mode(self.draw_mode_combo.currentText().lower())
+
+    def edit_layout(self, method, *args):
+        """Apply a LineManager edit to the GUI's layout now and to the counting state (queued during a run)"""
+        getattr(self.layout_state, method)(*args)
+        self.line_manager.edit(getattr(self.line_manager, method), *args)
+        self.invalidate_timeline()
 
     def store_line(self, start, end):
         """Directly use the already-scaled coordinates from LineDrawer"""
-        self.line_manager.add_line(start, end)
-        print(f"Line added at original coordinates: {start.x()},{start.y()} to {end.x()},{end.y()}")
+        self.edit_layout("add_line", start, end)
+        log.info("Line added at original coordinates: %s,%s to %s,%s", start.x(), start.y(), end.x(), end.y())
+
+    def store_polyline(self, points):
+        self.edit_layout("add_polyline", points)
+        log.info("Polyline gate added with %d points", len(points))
+
+    def store_zone(self, points):
+        self.edit_layout("add_zone", points)
+        log.info("Zone added with %d points", len(points))
 
     def load_video(self):
         """Loads the first frame from the video."""
@@ -266,63 +333,189 @@ class YOLOApp(QWidget):
         if file_path:
             # Full reset for new video
             self.line_manager.reset()
+            self.layout_state.reset()
             self.video_label.clear()
             self.video_label.clear_lines()
             self.route_table.setRowCount(0)
             self.update_counts({})  # Clear direction counts
             
             self.video_path = file_path
-            cap = cv2.VideoCapture(self.video_path)
-            ret, frame = cap.read()
-            cap.release()
+            info = self.media_probe.probe(self.video_path)
 
-            if ret:
-                # Convert and display first frame
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if info is not None:
+                # Convert and display the cached (downscaled) first frame
+                frame_rgb = cv2.cvtColor(info.preview, cv2.COLOR_BGR2RGB)
                 h, w, ch = frame_rgb.shape
                 q_img = QImage(frame_rgb.data, w, h, ch * w, QImage.Format_RGB888)
                 
                 # Force frame update
-                self.video_label.load_frame(q_img)
+                self.video_label.load_frame(q_img, source_size=(info.width, info.height))
+                self.line_manager.set_reference_size(info.width, info.height)
+                self.layout_state.set_reference_size(info.width, info.height)
                 self.video_label.repaint()
+                self.seek_bar.set_video(info.frame_count, info.fps)
+                self.start_preview()
                 
-                # Load existing routes if available
-                video_name = os.path.basename(file_path)
-                if os.path.exists("routes.json"):
-                    with open("routes.json", "r") as f:
-                        data = json.load(f)
-                        if video_name in data:
-                            self.load_routes_to_table(data[video_name])
+                # Load existing lines and routes if available
+                try:
+                    entry = self.config_store.get(file_path)
+                except (OSError, ValueError) as e:
+                    log.error("Could not read routes.json: %s", e)
+                    entry = None
+                if entry:
+                    for line_manager in (self.line_manager, self.layout_state):
+                        apply_lines(line_manager, entry["lines"])
+                        apply_zones(line_manager, entry["zones"])
+                    lines, zones = (
+                        [[QPoint(round(x * info.width), round(y * info.height)) for x, y in shape['points']]
+                         for shape in shapes.values()]
+                        for shapes in (self.layout_state.lines, self.layout_state.zones)
+                    )
+                    self.video_label.set_lines(lines, zones)
+                    self.load_routes_to_table(entry["routes"])
+                self.inference = (entry or {}).get("inference", {})
+                self.set_imgsz(self.inference.get("imgsz"))
 
     def start_detection(self):
         """Starts or resumes the video processing."""
         if self.video_path:
             if self.processor is None:
-                self.processor = VideoProcessor(self.video_path, self.line_manager)
+                resume = self.ask_resume()
+                capture, first_frame = self.media_probe.take_capture(self.video_path)
+                self.processor = VideoProcessor(self.video_path, self.line_manager,
+                                                capture=capture, first_frame=first_frame, resume=resume,
+                                                tracker=self.tracker_combo.currentText(),
+                                                motion_gating=self.motion_gate_check.isChecked(),
+                                                inference_process=self.inference_process_check.isChecked(),
+                                                imgsz=self.imgsz(),
+                                                detection_filter=DetectionFilter.from_config(self.inference),
+                                                event_store=self.event_store)
                 self.processor.frame_signal.connect(self.update_frame)
                 self.processor.count_update.connect(self.update_counts)
+                self.processor.progress.connect(self.seek_bar.set_position)
+                self.processor.finished.connect(self.processing_finished)
+                self.seek_bar.setEnabled(False)  # Counting runs front to back; the bar shows progress
                 self.processor.start()
+                self.interval_timer.start(5000)
             elif self.processor.isRunning() and self.processor.paused:
                 self.processor.resume()
 
+    def ask_resume(self):
+        """Whether to continue from an interrupted run's checkpoint; asks only when there is one"""
+        frame_index = checkpoint_frame(self.video_path)
+        if not frame_index:
+            return False
+        answer = QMessageBox.question(
+            self, "Resume counting",
+            f"An earlier run of this video stopped at frame {frame_index}. Resume from there?\n\n"
+            "Counts after a resume are approximate: vehicles in view at that frame are matched "
+            "back to their tracks by position. Choose No to count the whole video again.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        return answer == QMessageBox.Yes
+
     def pause_video(self):
         """Pauses the video processing."""
         if self.processor and self.processor.isRunning():
             self.processor.pause()
 
+    def refresh_intervals(self):
+        """Redraw the dashboard's 15-minute histogram for the current video"""
+        if self.video_path:
+            self.dashboard.show_intervals(self.event_store.histogram(900, video=video_slug(self.video_path)))
+
     def stop_video(self):
         """Enhanced to clear routes"""
+        self.interval_timer.stop()
         if self.processor:
-            self.processor.stop()
-            self.processor = None
+            self.retire_processor()
             
         self.video_label.clear()
         self.video_label.setText("Video Stopped - Load New Video")
         self.video_path = None
+        self.stop_preview()
+        self.seek_bar.set_video(0, 30)
         self.route_table.setRowCount(0)  # Clear route table
         self.line_manager.reset()
+        self.layout_state.reset()
         self.update_counts({}) 
 
+    def retire_processor(self):
+        """Stop the processor without waiting for it.
+
+        It keeps the LineManager it was counting with to write its final
+        checkpoint and report; the GUI carries on with a fresh one.
+        """
+        processor, self.processor = self.processor, None
+        processor.frame_signal.disconnect(self.update_frame)
+        processor.count_update.disconnect(self.update_counts)
+        processor.progress.disconnect(self.seek_bar.set_position)
+        processor.finished.disconnect(self.processing_finished)
+        self.stopping.add(processor)
+        processor.finished.connect(lambda: self.stopping.discard(processor))
+        processor.stop()
+        if processor.isFinished():
+            self.stopping.discard(processor)
+        self.line_manager = LineManager()
+        self.invalidate_timeline()
+
+    def processing_finished(self):
+        """A run reached the end of the video: its counts and fresh detection cache back the seek bar"""
+        self.seek_bar.setEnabled(True)
+        self.timeline = CountTimeline(self.line_manager)
+        self.start_preview()  # Picks up the detection cache the run just wrote
+
+    def start_preview(self):
+        self.stop_preview()
+        self.preview = PreviewWorker(self.video_path, MODEL_PATH, self.tracker_combo.currentText())
+        self.preview.preview_ready.connect(self.show_preview)
+        self.preview.timeline_ready.connect(self.set_timeline)
+        self.preview.recounted.connect(self.recount_finished)
+        self.preview.start()
+
+    def stop_preview(self):
+        if self.preview is not None:
+            self.preview.stop()
+            self.preview.wait()
+            self.preview = None
+
+    def preview_frame(self, frame_index, exact):
+        """Seek bar moved: show that frame with its cached detections and the counts up to it"""
+        if self.preview is None or (self.processor is not None and self.processor.isRunning()):
+            return
+        self.preview.request_frame(frame_index, exact)
+        if self.timeline is None and not self.timeline_requested and self.line_manager.snapshot.routes:
+            self.timeline_requested = True
+            self.preview.request_timeline(self.layout_copy())
+
+    def show_preview(self, frame_index, frame, tracks):
+        if self.processor is not None and self.processor.isRunning():
+            return  # Stale preview
+        if tracks is not None:
+            draw_boxes(frame, tracks[:, :4], tracks[:, CLS], tracks[:, TRACK_ID], self.class_names)
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = frame_rgb.shape
+        self.video_label.load_frame(QImage(frame_rgb.data, w, h, ch * w, QImage.Format_RGB888).copy())
+        if self.timeline is not None:
+            self.update_counts(self.timeline.counts_at(frame_index))
+
+    def set_timeline(self, timeline):
+        self.timeline = timeline
+        self.update_counts(timeline.counts_at(self.seek_bar.slider.value()))
+
+    def invalidate_timeline(self):
+        """Lines or routes changed: counts-to-date must be replayed again (and a pending recount is stale)"""
+        self.timeline = None
+        self.timeline_requested = False
+        self.recounting = None
+
+    def layout_copy(self):
+        """Fresh LineManager with the GUI's lines, zones and routes, for replaying off the GUI thread"""
+        copy = LineManager()
+        apply_lines(copy, lines_to_config(self.layout_state))
+        apply_zones(copy, zones_to_config(self.layout_state))
+        copy.load_routes(self.layout_state.routes)
+        return copy
+
     def toggle_recording(self):
         """Toggles video recording on/off."""
         if self.processor and self.processor.isRunning():
@@ -346,8 +539,13 @@ class YOLOApp(QWidget):
 
     def closeEvent(self, event):
         """Ensures the video processing stops when the app closes."""
-        if self.processor and self.processor.isRunning():
-            self.processor.stop()
+        if self.processor:
+            self.retire_processor()
+        for processor in list(self.stopping):
+            processor.wait()  # The app is closing: let results and checkpoints finish writing
+        self.stop_preview()
+        self.media_probe.release()
+        self.event_store.close()
         event.accept()
 
     def create_route_table(self):
@@ -366,14 +564,18 @@ class YOLOApp(QWidget):
         add_btn = QPushButton("Add Route")
         del_btn = QPushButton("Delete Route")
         save_btn = QPushButton("Save Routes")
+        recount_btn = QPushButton("Recount")
+        recount_btn.setToolTip("Count again with the current lines and routes, using the detections of the last full run")
         
         add_btn.clicked.connect(lambda: self.route_table.insertRow(self.route_table.rowCount()))
         del_btn.clicked.connect(lambda: self.route_table.removeRow(self.route_table.currentRow()))
         save_btn.clicked.connect(self.save_routes)
+        recount_btn.clicked.connect(self.recount)
         
         control_layout.addWidget(add_btn)
         control_layout.addWidget(del_btn)
         control_layout.addWidget(save_btn)
+        control_layout.addWidget(recount_btn)
         
         layout.addWidget(QLabel("<b>Route Configuration</b>"))
         layout.addWidget(self.route_table)
@@ -382,6 +584,17 @@ class YOLOApp(QWidget):
         route_group.setLayout(layout)
         return route_group
     
+    def imgsz(self):
+        """Selected model input size: None (native), "auto" or pixels"""
+        text = self.imgsz_combo.currentText()
+        return None if text == "Native" else "auto" if text == "Auto" else int(text)
+
+    def set_imgsz(self, imgsz):
+        text = "Native" if imgsz is None else "Auto" if imgsz == "auto" else str(imgsz)
+        if self.imgsz_combo.findText(text) < 0:
+            self.imgsz_combo.addItem(text)  # A size set in routes.json by hand
+        self.imgsz_combo.setCurrentText(text)
+
     def save_routes(self):
         """Save routes with direction-based counting"""
         try:
@@ -410,25 +623,43 @@ class YOLOApp(QWidget):
                     break
 
             if valid and routes:
-                # Update line manager with verification
-                self.line_manager.load_routes(routes)
-                
-                # Save to JSON
-                video_name = os.path.basename(self.video_path)
-                data = {}
-                if os.path.exists("routes.json"):
-                    with open("routes.json", "r") as f:
-                        data = json.load(f)
+                # Applied between frames if a run is counting with this line manager
+                self.edit_layout("load_routes", routes)
                 
-                data[video_name] = routes
-                with open("routes.json", "w") as f:
-                    json.dump(data, f, indent=4)
+                # Save routes and normalized line/zone geometry (from the GUI's layout, never the run's state)
+                self.config_store.save(self.video_path, routes=routes,
+                                       lines=lines_to_config(self.layout_state),
+                                       zones=zones_to_config(self.layout_state),
+                                       inference={"imgsz": self.imgsz()})
                     
-                # Refresh UI counts
-                self.update_counts(self.line_manager.route_counts)
+                # Refresh UI counts (during a run, count_update brings the new routes)
+                self.update_counts(self.line_manager.snapshot.routes)
                 
         except Exception as e:
-            print(f"Route Error: {str(e)}")
+            log.error("Route Error: %s", e)
+
+    def recount(self):
+        """Re-count the loaded video from cached detections instead of running the model (on the preview worker)"""
+        if (not self.video_path or self.processor is not None or self.preview is None
+                or not self.line_manager.snapshot.routes):
+            return
+        self.recounting = self.layout_copy()
+        self.preview.request_recount(self.recounting, self.event_store)
+
+    def recount_finished(self, line_manager):
+        """The preview worker recounted a layout copy; it becomes the GUI's counting state unless that moved on"""
+        if line_manager is None:
+            self.recounting = None
+            log.info("No cached detections for %s with this tracker; play it through once first",
+                     os.path.basename(self.video_path))
+            return
+        if line_manager is not self.recounting or self.processor is not None:
+            return  # Layout edited, video closed or a run started meanwhile
+        self.recounting = None
+        self.line_manager = line_manager
+        self.update_counts(line_manager.snapshot.routes)
+        self.refresh_intervals()
+        self.timeline = CountTimeline(line_manager)
 
     def load_routes_to_table(self, routes):
         """Load routes from JSON into table"""
@@ -441,9 +672,11 @@ class YOLOApp(QWidget):
                 self.route_table.setItem(row, 0, QTableWidgetItem(f"Line {route['origin']}"))
                 self.route_table.setItem(row, 1, QTableWidgetItem(f"Line {route['destination']}"))
                 self.route_table.setItem(row, 2, QTableWidgetItem(route['direction']))
+                if route.get('start_time'):
+                    self.route_table.setItem(row, 3, QTableWidgetItem(route['start_time']))
                 
         except Exception as e:
-            print(f"Error loading routes: {str(e)}")
+            log.error("Error loading routes: %s", e)
             
     def load_frame(self, q_img):
         """Store original dimensions and calculate display parameters"""
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Checkpoints, caches and archives go to a throwaway home, never ~/.abacus
+os.environ.setdefault("ABACUS_HOME", tempfile.mkdtemp(prefix="abacus-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
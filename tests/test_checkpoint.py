@@ -0,0 +1,59 @@
+from backend.checkpoint import checkpoint_frame, clear_checkpoint, load_checkpoint, save_checkpoint
+from test_line_manager import LINES, SHAPE, build, state, traffic
+
+RESUME_AT = 120
+
+
+def video(tmp_path):
+    path = tmp_path / "13.mp4"
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def totals(line_manager):
+    return {key: dict(data["counts"]) for key, data in line_manager.route_counts.items()}
+
+
+def test_resumed_run_counts_like_an_uninterrupted_one(tmp_path):
+    video_path = video(tmp_path)
+    frames = list(traffic(3))
+    uninterrupted = build(LINES)
+    for frame, tracks in frames:
+        uninterrupted.count_tracks(tracks, SHAPE, frame)
+
+    interrupted = build(LINES)
+    for frame, tracks in frames[:RESUME_AT]:
+        interrupted.count_tracks(tracks, SHAPE, frame)
+    save_checkpoint(video_path, interrupted, RESUME_AT)
+    assert checkpoint_frame(video_path) == RESUME_AT
+
+    resumed = build(LINES)
+    assert load_checkpoint(video_path, resumed) == RESUME_AT
+    assert state(resumed) == state(interrupted)
+    for frame, tracks in frames[RESUME_AT:]:
+        # The tracker starts over after a resume, handing out new IDs
+        tracks = tracks.copy()
+        tracks[tracks[:, 4] >= 0, 4] += 1000
+        resumed.count_tracks(tracks, SHAPE, frame)
+    assert sum(sum(counts.values()) for counts in totals(resumed).values()) > 0
+    assert totals(resumed) == totals(uninterrupted)
+
+
+def test_checkpoint_of_another_layout_or_file_is_ignored(tmp_path):
+    video_path = video(tmp_path)
+    line_manager = build(LINES)
+    for frame, tracks in list(traffic(3))[:RESUME_AT]:
+        line_manager.count_tracks(tracks, SHAPE, frame)
+    save_checkpoint(video_path, line_manager, RESUME_AT)
+
+    other_lines = build(LINES[:2])
+    assert load_checkpoint(video_path, other_lines) is None
+    assert all(sum(data["counts"].values()) == 0 for data in other_lines.route_counts.values())
+
+    with open(video_path, "ab") as f:
+        f.write(b"edited")
+    assert checkpoint_frame(video_path) is None
+    assert load_checkpoint(video_path, build(LINES)) is None
+
+    clear_checkpoint(video_path)
+    assert checkpoint_frame(video_path) is None
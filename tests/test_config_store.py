@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import pytest
+from backend.config_store import CONFIG_VERSION, ConfigError, ConfigStore
+
+ROUTE = {"origin": 0, "destination": 1, "direction": "N - S", "start_time": "07:00:00 AM"}
+LINES = [{"id": 0, "start": [0.1, 0.5], "end": [0.4, 0.5]}, {"id": 1, "start": [0.6, 0.2], "end": [0.6, 0.8]}]
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_version_1_file_reads_as_version_2(tmp_path):
+    path = tmp_path / "routes.json"
+    write(path, {"13.mp4": [ROUTE], "14.mp4": []})
+    store = ConfigStore(str(path))
+
+    entry = store.get("/videos/cam-a/13.mp4")
+    assert entry["routes"] == [ROUTE]
+    assert entry["lines"] == [] and entry["zones"] == [] and entry["inference"] == {}
+    assert store.get("/videos/cam-a/14.mp4")["routes"] == []
+    assert store.get("/videos/cam-a/15.mp4") is None
+
+
+def test_saving_upgrades_a_version_1_file(tmp_path):
+    path = tmp_path / "routes.json"
+    write(path, {"13.mp4": [ROUTE]})
+    store = ConfigStore(str(path))
+    camera_a, camera_b = str(tmp_path / "a" / "13.mp4"), str(tmp_path / "b" / "13.mp4")
+
+    store.save(camera_a, lines=LINES)
+
+    with open(path) as f:
+        data = json.load(f)
+    assert data["version"] == CONFIG_VERSION
+    # The saved video keeps its version 1 routes under its own path; the shared entry stays for the others
+    assert data["videos"][os.path.abspath(camera_a)] == {"lines": LINES, "zones": [], "routes": [ROUTE]}
+    assert data["videos"]["13.mp4"]["routes"] == [ROUTE]
+    assert store.get(camera_a)["lines"] == LINES
+    assert store.get(camera_b)["lines"] == [] and store.get(camera_b)["routes"] == [ROUTE]
+
+
+def test_same_named_videos_keep_separate_entries(tmp_path):
+    store = ConfigStore(str(tmp_path / "routes.json"))
+    camera_a, camera_b = str(tmp_path / "a" / "13.mp4"), str(tmp_path / "b" / "13.mp4")
+    store.save(camera_a, routes=[ROUTE], lines=LINES)
+    store.save(camera_b, routes=[])
+    assert store.get(camera_a)["routes"] == [ROUTE]
+    assert store.get(camera_b)["routes"] == []
+
+
+def test_camera_defaults_apply_to_videos_without_their_own(tmp_path):
+    path = tmp_path / "routes.json"
+    video = str(tmp_path / "13.mp4")
+    write(path, {"version": 2,
+                 "cameras": {"north": {"lines": LINES, "routes": [ROUTE], "inference": {"imgsz": 640}}},
+                 "videos": {os.path.abspath(video): {"camera": "north"}}})
+    entry = ConfigStore(str(path)).get(video)
+    assert entry["lines"] == LINES and entry["routes"] == [ROUTE] and entry["inference"] == {"imgsz": 640}
+
+
+def test_invalid_entries_are_rejected(tmp_path):
+    path = tmp_path / "routes.json"
+    write(path, {"version": 2, "videos": {"13.mp4": {"lines": [{"id": 0, "start": [0.1, 2.0], "end": [0, 0]}]}}})
+    with pytest.raises(ConfigError):
+        ConfigStore(str(path)).load()
+    write(path, {"version": 3, "videos": {}})
+    with pytest.raises(ConfigError):
+        ConfigStore(str(path)).load()
+    with pytest.raises(ConfigError):
+        ConfigStore(str(tmp_path / "other.json")).save("13.mp4", routes=[{"origin": 0}])
+
+
+def test_concurrent_saves_keep_every_entry(tmp_path):
+    store = ConfigStore(str(tmp_path / "routes.json"))
+    threads = [threading.Thread(target=store.save, args=(str(tmp_path / f"{i}.mp4"),), kwargs={"routes": [ROUTE]})
+               for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.load()["videos"]) == 16
+
+
+def test_parsed_file_is_shared_until_it_changes(tmp_path):
+    path = tmp_path / "routes.json"
+    write(path, {"13.mp4": [ROUTE]})
+    first = ConfigStore(str(path)).load()
+    assert ConfigStore(str(path)).load() is first  # Another store of the same file skips the parse
+
+    store = ConfigStore(str(path))
+    store.save(str(tmp_path / "13.mp4"), routes=[])
+    assert store.load() is not first and store.get(str(tmp_path / "13.mp4"))["routes"] == []
+    write(path, {"version": 2, "videos": {"14.mp4": {"routes": [ROUTE]}}})
+    os.utime(path, ns=(0, 1))  # A rewrite within the clock's resolution still changes mtime here
+    assert ConfigStore(str(path)).get("14.mp4")["routes"] == [ROUTE]
+    assert not os.path.exists(os.path.join(os.environ["ABACUS_HOME"], "config_cache"))
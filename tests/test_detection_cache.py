@@ -0,0 +1,89 @@
+import asyncio
+import numpy as np
+import backend.tracker
+from backend.detection_cache import DetectionCache, recount
+from backend.event_store import EventStore
+from backend.paths import video_slug
+from backend.pipeline import CountingStage, DetectionCacheSink, EventStoreSink, Pipeline
+from test_line_manager import LINES, SHAPE, ZONES, build, state, traffic
+
+
+class ArraySource:
+    """Frames carrying their index in the first pixel; ``track_frame`` below looks the tracks up by it"""
+    uri = "synthetic"
+    fps = 30
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.total_frames = len(frames)
+        self.position = 0
+
+    def read(self):
+        if self.position >= len(self.frames):
+            return None
+        self.position += 1
+        frame = np.zeros(SHAPE, np.uint8)
+        frame[0, 0, :2] = divmod(self.position, 256)
+        return frame
+
+    def close(self):
+        pass
+
+
+def live_run(monkeypatch, tmp_path, frames, line_manager, sinks=()):
+    by_index = dict(frames)
+
+    def track_frame(model, tracker, frame, *args, **kwargs):
+        return by_index[256 * int(frame[0, 0, 0]) + int(frame[0, 0, 1])]
+
+    monkeypatch.setattr(backend.tracker, "track_frame", track_frame)
+    path = str(tmp_path / "detections.npz")
+    stage = CountingStage(None, "cpu", line_manager)
+    assert asyncio.run(Pipeline(ArraySource(frames), stage, [DetectionCacheSink(path, 30), *sinks]).run())
+    return DetectionCache.load(path)
+
+
+def test_replay_counts_like_the_live_run(monkeypatch, tmp_path):
+    frames = list(traffic(seed=3))
+    live = build(LINES, ZONES)
+    live_events, replay_events = [], []
+    live.event_listeners.append(lambda *event: live_events.append(event))
+    cache = live_run(monkeypatch, tmp_path, frames, live)
+    assert len(cache) == len(frames)
+
+    replayed = build(LINES, ZONES)
+    replayed.event_listeners.append(lambda *event: replay_events.append(event))
+    cache.replay(replayed)
+    assert state(replayed) == state(live)
+    assert replay_events == live_events and live_events
+    assert replayed.snapshot.routes == live.snapshot.routes
+
+    # Replaying into the same manager again starts from zero
+    cache.replay(replayed)
+    assert state(replayed) == state(live)
+
+
+def test_replay_with_new_lines_matches_a_live_run_with_them(monkeypatch, tmp_path):
+    frames = list(traffic(seed=4))
+    cache = live_run(monkeypatch, tmp_path, frames, build(LINES))
+    moved = [((500, 0), (520, 720)), ((1000, 0), (1000, 720)), ((0, 200), (1280, 220))]
+    live = build(moved, ZONES)
+    for frame, tracks in frames:
+        live.count_tracks(tracks, SHAPE, frame)
+    replayed = build(moved, ZONES)
+    cache.replay(replayed)
+    assert state(replayed) == state(live)
+
+
+def test_recount_records_events_like_the_live_run(monkeypatch, tmp_path):
+    video = str(tmp_path / "13.mp4")
+    store = EventStore(str(tmp_path / "events.sqlite3"))
+    frames = list(traffic(seed=5))
+    live = build(LINES)
+    cache = live_run(monkeypatch, tmp_path, frames, live, [EventStoreSink(store, video, live)])
+    live_counts = store.interval_counts(60, video=video_slug(video))
+    assert live_counts
+
+    assert recount(video, build(LINES), "model.pt", "iou", store, cache=cache)
+    assert store.interval_counts(60, video=video_slug(video)) == live_counts  # Replaced, not added to
+    store.close()
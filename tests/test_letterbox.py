@@ -0,0 +1,70 @@
+import numpy as np
+from backend.letterbox import IMGSZ_LADDER, Letterbox, ModelInput, SizeLadder, remembered_size, unletterbox
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+
+def latency(frame, letterbox):
+    """Simulated inference: 1 ms per 10k input pixels (a 640 input takes 25 ms, 480 takes 14 ms)"""
+    return frame.shape[0] * frame.shape[1] / 10_000_000
+
+
+def counting(infer):
+    calls = []
+
+    def counted(frame, letterbox):
+        calls.append(frame.shape[:2])
+        return infer(frame, letterbox)
+    return counted, calls
+
+
+def test_ladder_settles_on_the_largest_size_within_budget():
+    ladder = SizeLadder(60)  # 16.7 ms per frame
+    per_rung = ladder.warmup + ladder.window
+    seconds = {1280: 0.09, 960: 0.05, 640: 0.023, 480: 0.013, 320: 0.006}
+    changes = [ladder.record(seconds[ladder.imgsz]) for _ in range(4 * per_rung)]
+    assert ladder.settled and ladder.imgsz == 480
+    assert sum(changes) == 3
+    # Warm-up samples are not timed: a slow first call does not push the size down
+    ladder = SizeLadder(60)
+    for i in range(per_rung):
+        ladder.record(1.0 if i < ladder.warmup else 0.01)
+    assert ladder.settled and ladder.imgsz == 1280
+
+
+def test_auto_input_is_timed_once_per_resolution_device_and_frame_rate():
+    infer, calls = counting(latency)
+    model_input = ModelInput("auto", 60, buffers=2, device="test-gpu")
+    model_input.calibrate(FRAME, infer)
+    assert model_input.imgsz == 480
+    assert len(calls) == 4 * (model_input.ladder.warmup + model_input.ladder.window)
+    assert remembered_size(model_input.size_key(1280, 720)) == 480
+
+    calls.clear()
+    again = ModelInput("auto", 60, buffers=2, device="test-gpu")
+    again.calibrate(FRAME, infer)
+    assert again.imgsz == 480 and calls == []
+    assert again.prepare(FRAME)[0].shape[:2] == (288, 480)
+
+    # Another frame rate or device is timed again
+    for model_input in (ModelInput("auto", 20, buffers=2, device="test-gpu"), ModelInput("auto", 60, buffers=2)):
+        calls.clear()
+        model_input.calibrate(FRAME, infer)
+        assert calls
+
+
+def test_fixed_size_is_never_timed():
+    infer, calls = counting(latency)
+    model_input = ModelInput(640, 60, buffers=2, device="test-gpu")
+    model_input.calibrate(FRAME, infer)
+    assert calls == [] and model_input.prepare(FRAME)[0].shape[:2] == (384, 640)
+
+
+def test_unletterbox_maps_canvas_boxes_back_to_the_frame():
+    for imgsz in IMGSZ_LADDER:
+        letterbox = Letterbox(imgsz, 1280, 720, buffers=1)
+        params = letterbox.params
+        boxes = np.array([[100, 50, 300, 200], [0, 0, 1280, 720]], dtype=np.float32)
+        canvas = boxes * params.scale + [params.left, params.top, params.left, params.top]
+        assert np.allclose(unletterbox(canvas, params), boxes, atol=1e-3)
+        assert letterbox.shape[0] % 32 == 0 and letterbox.shape[1] % 32 == 0
@@ -0,0 +1,134 @@
+import numpy as np
+from backend.line_manager import LineManager
+from test_spatial_index import brute_force_crossings
+
+WIDTH, HEIGHT = 1280, 720
+SHAPE = (HEIGHT, WIDTH, 3)
+
+
+def build(lines, zones=()):
+    line_manager = LineManager()
+    line_manager.set_reference_size(WIDTH, HEIGHT)
+    for start, end in lines:
+        line_manager.add_line(start, end)
+    for points in zones:
+        line_manager.add_zone(points)
+    ids = range(len(lines))
+    line_manager.load_routes([{"origin": o, "destination": d, "direction": f"{o}-{d}"}
+                              for o in ids for d in ids if o != d])
+    return line_manager
+
+
+def traffic(seed, frames=240, vehicles=40):
+    """(N, 7) arrays of vehicles driving through the frame; every fifth box is untracked"""
+    rng = np.random.default_rng(seed)
+    # Mostly entering at the left or right edge, so many pass both vertical lines and some the horizontal one
+    rightwards = rng.random(vehicles) < 0.5
+    start = np.column_stack([np.where(rightwards, rng.uniform(0, 250, vehicles), rng.uniform(1030, WIDTH, vehicles)),
+                             rng.uniform(0, HEIGHT, vehicles)])
+    velocity = np.column_stack([np.where(rightwards, 1, -1) * rng.uniform(5, 12, vehicles),
+                                rng.uniform(-4, 4, vehicles)])
+    first = rng.integers(1, 100, vehicles)
+    last = first + rng.integers(60, 140, vehicles)
+    classes = rng.integers(0, 7, vehicles)
+    for frame in range(1, frames + 1):
+        alive = np.flatnonzero((first <= frame) & (frame <= last))
+        centers = start[alive] + velocity[alive] * (frame - first[alive])[:, None]
+        tracks = np.column_stack([centers - [20, 15], centers + [20, 15], alive + 1,
+                                  np.full(len(alive), 0.9), classes[alive]]).astype(np.float32)
+        tracks[::5, 4] = -1
+        yield frame, tracks
+
+
+def as_dicts(tracks):
+    return [{"id": None if row[4] < 0 else int(row[4]), "cls": int(row[6]), "box": row[:4].tolist()}
+            for row in tracks]
+
+
+def reference_counts(line_manager, frames):
+    """Route counts and event times from a plain per-track loop over every segment"""
+    segments = line_manager.geometry.pixels(WIDTH, HEIGHT)
+    segment_ids = line_manager.geometry.segment_ids
+    crossed, counted, classes = {}, set(), {}
+    counts = {key: {cls: 0 for cls in range(7)} for key in line_manager.route_counts}
+    times = {key: [] for key in line_manager.route_counts}
+    for frame, tracks in frames:
+        tracks = tracks[tracks[:, 4] >= 0]
+        ids = tracks[:, 4].astype(int).tolist()
+        crossed = {track_id: crossed.get(track_id, []) for track_id in ids}  # Lost tracks start over
+        counted &= set(ids)
+        for track_id, cls in zip(ids, tracks[:, 6].astype(int).tolist()):
+            classes.setdefault(track_id, cls)
+        centers = (tracks[:, :2] + tracks[:, 2:4]) / 2
+        for row, segment in brute_force_crossings(segments, centers):
+            track_id = ids[row]
+            line_id = int(segment_ids[segment])
+            if track_id not in counted and line_id not in crossed[track_id]:
+                crossed[track_id].append(line_id)
+        for track_id, lines in crossed.items():
+            key = tuple(lines[:2])
+            if track_id in counted or len(lines) < 2 or key not in counts:
+                continue
+            counts[key][classes[track_id]] += 1
+            times[key].append(frame / line_manager.fps)
+            counted.add(track_id)
+    return counts, times
+
+
+def state(line_manager):
+    routes = {key: (dict(data["counts"]), data.get("times", []), data.get("classes", []))
+              for key, data in line_manager.route_counts.items()}
+    zones = {zone_id: (dict(zone["entries"]), zone["peak"], zone["dwell_times"], dict(zone["inside"]))
+             for zone_id, zone in line_manager.zones.items()}
+    return routes, zones
+
+
+LINES = [((300, 0), (320, HEIGHT)), ((900, 0), (880, HEIGHT)), ((0, 360), (WIDTH, 380))]
+ZONES = [[(400, 200), (800, 200), (800, 500), (400, 500)]]
+
+
+def test_vehicle_crossing_two_lines_counts_once():
+    line_manager = build(LINES[:2])
+    for frame in range(1, 121):
+        x = 200 + 7 * frame  # Left to right through both vertical lines
+        line_manager.count_tracks(np.array([[x - 20, 200, x + 20, 230, 5, 0.9, 3]]), SHAPE, frame)
+    assert line_manager.route_counts[(0, 1)]["counts"][3] == 1
+    assert sum(line_manager.route_counts[(1, 0)]["counts"].values()) == 0
+    # Counted on reaching line 1 (x = 880..900): frame 98 at 30 fps
+    assert line_manager.route_counts[(0, 1)]["times"] == [98 / 30]
+
+
+def test_count_tracks_matches_brute_force_reference():
+    for seed in range(5):
+        line_manager = build(LINES)
+        for frame, tracks in traffic(seed):
+            line_manager.count_tracks(tracks, SHAPE, frame)
+        counts, times = reference_counts(build(LINES), traffic(seed))
+        assert {key: dict(data["counts"]) for key, data in line_manager.route_counts.items()} == counts
+        assert {key: data.get("times", []) for key, data in line_manager.route_counts.items()} == times
+        assert sum(sum(c.values()) for c in counts.values()), "the traffic should produce counts"
+
+
+def test_count_tracks_matches_check_line_crossing():
+    for seed in range(3):
+        arrays, dicts = build(LINES, ZONES), build(LINES, ZONES)
+        events = {id(arrays): [], id(dicts): []}
+        for line_manager in (arrays, dicts):
+            line_manager.event_listeners.append(lambda *event, key=id(line_manager): events[key].append(event))
+        for frame, tracks in traffic(seed):
+            arrays.count_tracks(tracks, SHAPE, frame)
+            dicts.check_line_crossing(as_dicts(tracks), SHAPE, frame)
+        assert state(arrays) == state(dicts)
+        assert events[id(arrays)] == events[id(dicts)] and events[id(arrays)]
+        assert sum(arrays.zones[0]["entries"].values()), "the traffic should pass through the zone"
+
+
+def test_reset_leaves_routes_loaded_from_the_same_list():
+    # The GUI loads one routes list into its own layout and the counting LineManager
+    routes = [{"origin": 0, "destination": 1, "direction": "E"}]
+    layout, counting = LineManager(), LineManager()
+    layout.load_routes(routes)
+    counting.load_routes(routes)
+    layout.reset()
+    counting.reset_counts()
+    assert routes and counting.routes == routes and list(counting.route_counts) == [(0, 1)]
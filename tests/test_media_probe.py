@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+from backend.media_probe import MediaProbe
+
+
+def write_video(path, frames=5, size=(320, 240)):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 25, size)
+    for i in range(frames):
+        writer.write(np.full((size[1], size[0], 3), 40 * i, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def test_probe_hands_over_its_capture_once(tmp_path):
+    video = write_video(tmp_path / "a.avi")
+    probe = MediaProbe(preview_width=160)
+    info = probe.probe(video)
+    assert (info.width, info.height, info.frame_count) == (320, 240, 5)
+    assert info.preview.shape == (120, 160, 3)
+    cap, first_frame = probe.take_capture(video)
+    assert first_frame is not None and first_frame.shape == (240, 320, 3)
+    cap.release()
+    # Cached now: no capture is kept, the processor opens a fresh one
+    assert probe.probe(video) is info
+    cap, first_frame = probe.take_capture(video)
+    assert first_frame is None and cap.isOpened()
+    cap.release()
+
+
+def test_cache_hit_releases_the_capture_of_another_video(tmp_path):
+    first, second = write_video(tmp_path / "a.avi"), write_video(tmp_path / "b.avi")
+    probe = MediaProbe()
+    probe.probe(second)
+    probe.take_capture(second)[0].release()
+    probe.probe(first)
+    kept = probe._open[1]
+    assert kept.isOpened()
+
+    probe.probe(second)  # Cache hit
+    assert probe._open is None and not kept.isOpened()
+    # Probing the same video again keeps its capture for take_capture
+    third = write_video(tmp_path / "c.avi")
+    probe.probe(third)
+    probe.probe(third)
+    cap, first_frame = probe.take_capture(third)
+    assert first_frame is not None and cap.isOpened()
+    cap.release()
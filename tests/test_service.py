@@ -0,0 +1,84 @@
+import json
+import os
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import backend.service as service
+from backend.detection_cache import DetectionRecorder, cache_path
+from backend.service import CANCELLED, DONE, JobManager, create_app
+
+LINES = [{"id": 0, "start": [0.24, 0.0], "end": [0.26, 1.0]}, {"id": 1, "start": [0.74, 0.0], "end": [0.76, 1.0]}]
+ROUTES = [{"origin": 0, "destination": 1, "direction": "E"}, {"origin": 1, "destination": 0, "direction": "W"}]
+
+
+@pytest.fixture
+def counted_video(tmp_path):
+    """A video, weights and routes.json, with the video's detections already cached: one car driving east"""
+    video, model = tmp_path / "13.mp4", tmp_path / "model.pt"
+    video.write_bytes(b"frames")
+    model.write_bytes(b"weights")
+    config = tmp_path / "routes.json"
+    with open(config, "w") as f:
+        json.dump({"version": 2, "videos": {str(video): {"lines": LINES, "routes": ROUTES}}}, f)
+    recorder = DetectionRecorder()
+    for frame in range(1, 301):
+        x = 4 * frame
+        recorder.append(frame, np.array([[x, 100, x + 30, 130, 3, 0.9, 2]], dtype=np.float32), (240, 1280, 3))
+    recorder.build(30).save(cache_path(str(video), str(model), "iou"))
+    return str(video), JobManager(model_path=str(model), config=str(config))
+
+
+def wait(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} still {job['status']}")
+
+
+def test_cached_video_is_recounted_without_the_model(counted_video):
+    video, manager = counted_video
+    with TestClient(create_app(manager)) as client:
+        response = client.post("/jobs", json={"video": video, "tracker": "iou", "formats": ["csv"],
+                                              "output": "east.xlsx"})
+        assert response.status_code == 202
+        job = wait(client, response.json()["id"])
+    assert job["status"] == DONE and job["metrics"] == {"recounted": True}
+    totals = {route["direction"]: route["total"] for route in job["routes"]}
+    assert totals == {"E": 1, "W": 0}
+    assert job["reports"] and all(os.path.isfile(path) for path in job["reports"])
+    assert manager._models == {}  # Never loaded
+
+
+def test_jobs_that_cannot_run_are_rejected(counted_video, tmp_path):
+    video, manager = counted_video
+    with TestClient(create_app(manager)) as client:
+        for body in ({"video": str(tmp_path / "missing.mp4")},
+                     {"video": video, "routes": [{"origin": 0, "destination": 7, "direction": "X"}]},
+                     {"video": video, "output": "../outside.xlsx"},
+                     {"video": video, "formats": ["pdf"]}):
+            response = client.post("/jobs", json=body)
+            assert response.status_code == 422, body
+        assert client.get("/jobs").json() == []
+
+
+def test_cancel_stops_a_recount(counted_video, monkeypatch):
+    video, manager = counted_video
+    replayed = []
+
+    def cancelled_midway(*args, stop=None, **kwargs):
+        job_id, = manager.jobs
+        manager.cancel(job_id)  # DELETE /jobs/{id} arriving while the replay runs
+        replayed.append(stop())
+        return recount(*args, stop=stop, **kwargs)
+
+    recount = service.recount
+    monkeypatch.setattr(service, "recount", cancelled_midway)
+    with TestClient(create_app(manager)) as client:
+        response = client.post("/jobs", json={"video": video, "tracker": "iou", "formats": ["csv"]})
+        job = wait(client, response.json()["id"])
+    assert replayed == [True]
+    assert job["status"] == CANCELLED and job["reports"] == []
@@ -0,0 +1,101 @@
+import numpy as np
+import backend.sharded as sharded
+import backend.tracker
+from backend.sharded import build_line_manager, line_specs, merge_route_counts, plan_segments
+from test_line_manager import LINES, SHAPE, build, traffic
+
+BLOCK = 200  # Frames between the starts of successive traffic blocks; each block lasts 240 frames
+
+
+def long_traffic(blocks=5):
+    """Frame index -> (N, 7) tracks: blocks of traffic() overlapping in time, with distinct track IDs"""
+    frames = {}
+    for block in range(blocks):
+        for frame, tracks in traffic(block, frames=240):
+            tracks = tracks.copy()
+            tracks[tracks[:, 4] >= 0, 4] += 1000 * block
+            index = block * BLOCK + frame
+            frames[index] = np.concatenate([frames.get(index, np.empty((0, 7), np.float32)), tracks])
+    return frames
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in whose frames carry their 1-based index in pixel (0, 0)"""
+    def __init__(self, total):
+        self.total = total
+        self.position = 0
+
+    def get(self, prop):
+        return {sharded.cv2.CAP_PROP_FPS: 30, sharded.cv2.CAP_PROP_FRAME_COUNT: self.total}[prop]
+
+    def set(self, prop, value):
+        self.position = int(value)
+
+    def read(self):
+        if self.position >= self.total:
+            return False, None
+        self.position += 1
+        pixel = np.array([self.position // 256, self.position % 256, 0], dtype=np.uint8)
+        return True, np.lib.stride_tricks.as_strided(pixel, shape=SHAPE, strides=(0, 0, 1))
+
+    def release(self):
+        pass
+
+
+def test_segments_cover_the_video_once_with_warm_up():
+    segments = plan_segments(1040, 4, 150)
+    assert [(start, end) for _, start, end in segments] == [(0, 260), (260, 520), (520, 780), (780, 1040)]
+    assert [warmup for warmup, _, _ in segments] == [0, 110, 370, 630]
+    assert plan_segments(100, 8, 30, min_segment_frames=60) == [(0, 0, 100)]
+
+
+def test_merge_sums_counts_and_orders_events():
+    line_manager = build(LINES[:2])
+    first = {(0, 1): {"direction": "0-1", "counts": {2: 1, 3: 0}, "times": [5.0], "classes": [2]}}
+    second = {(0, 1): {"direction": "0-1", "counts": {2: 1, 3: 1}, "times": [1.0, 9.0], "classes": [3, 2]},
+              (1, 0): {"direction": "1-0", "counts": {5: 2}, "times": [2.0, 3.0], "classes": [5, 5]}}
+    merged = merge_route_counts(line_manager, [first, second])
+    assert merged[(0, 1)]["counts"] == {0: 0, 1: 0, 2: 2, 3: 1, 4: 0, 5: 0, 6: 0}
+    assert merged[(0, 1)]["times"] == [1.0, 5.0, 9.0] and merged[(0, 1)]["classes"] == [3, 2, 2]
+    assert merged[(1, 0)]["counts"][5] == 2
+
+
+def test_sharded_counts_match_one_uninterrupted_run(monkeypatch):
+    frames = long_traffic()
+    total = max(frames)
+    empty = np.empty((0, 7), np.float32)
+
+    def track_frame(model, tracker, frame, device, verbose=False, letterbox=None, detection_filter=None):
+        return frames.get(int(frame[0, 0, 0]) * 256 + int(frame[0, 0, 1]), empty)
+
+    monkeypatch.setattr(backend.tracker, "track_frame", track_frame)
+    monkeypatch.setattr(sharded.cv2, "VideoCapture", lambda path: FakeCapture(total))
+    monkeypatch.setitem(sharded._worker, "model", None)
+    monkeypatch.setitem(sharded._worker, "device", "cpu")
+
+    uninterrupted = build(LINES)
+    uninterrupted.set_video_info(30, total)
+    for index in range(1, total + 1):
+        uninterrupted.count_tracks(frames.get(index, empty), SHAPE, index)
+
+    line_manager = build(LINES)
+    line_manager.set_video_info(30, total)
+    lines = line_specs(line_manager)
+    # An overlap longer than any vehicle's transit: every vehicle is counted once, in one segment
+    segment_counts = [sharded._process_segment("video", lines, line_manager.routes, segment, "iou")[1]
+                      for segment in plan_segments(total, 4, 150)]
+    merged = merge_route_counts(line_manager, segment_counts)
+    assert sum(sum(data["counts"].values()) for data in merged.values()) > 20
+    for key, data in uninterrupted.route_counts.items():
+        assert merged[key]["counts"] == data["counts"], key
+        # Events at the same instant may come from different segments in either order
+        assert (list(zip(merged[key]["times"], merged[key]["classes"]))
+                == sorted(zip(data.get("times", []), data.get("classes", [])))), key
+
+    # Without warm-up the vehicles cut by a segment boundary are lost
+    cold = build_line_manager(lines, line_manager.routes)
+    cold_counts = merge_route_counts(cold, [
+        sharded._process_segment("video", lines, line_manager.routes, (start, start, end), "iou")[1]
+        for _, start, end in plan_segments(total, 4, 150)])
+    assert (sum(sum(data["counts"].values()) for data in cold_counts.values())
+            < sum(sum(data["counts"].values()) for data in merged.values()))
@@ -0,0 +1,66 @@
+import numpy as np
+from backend.line_manager import LineManager, CROSSING_DISTANCE
+from backend.spatial_index import SegmentGrid, _point_segment_distance
+
+WIDTH, HEIGHT = 1280, 720
+
+
+def brute_force_crossings(segments, centers):
+    """Every (row, segment) a center is on, testing all pairs with LineManager's predicate"""
+    hits = []
+    for row, (cx, cy) in enumerate(centers):
+        for segment, (x1, y1, x2, y2) in enumerate(segments):
+            if not (min(x1, x2) <= cx <= max(x1, x2) and min(y1, y2) <= cy <= max(y1, y2)):
+                continue
+            length = np.hypot(x2 - x1, y2 - y1)
+            if length and abs((y2 - y1) * cx - (x2 - x1) * cy + x2 * y1 - y2 * x1) / length < CROSSING_DISTANCE:
+                hits.append((row, segment))
+    return hits
+
+
+def random_line_manager(rng, lines):
+    line_manager = LineManager()
+    line_manager.set_reference_size(WIDTH, HEIGHT)
+    for _ in range(lines):
+        points = rng.uniform(0, 1, (rng.integers(2, 5), 2)) * [WIDTH, HEIGHT]
+        line_manager.add_polyline([tuple(p) for p in points])
+    return line_manager
+
+
+def test_every_segment_near_a_point_is_in_its_cell():
+    rng = np.random.default_rng(0)
+    segments = rng.uniform(0, 1, (40, 4)) * [WIDTH, HEIGHT, WIDTH, HEIGHT]
+    grid = SegmentGrid(segments, WIDTH, HEIGHT, cell_size=64, margin=CROSSING_DISTANCE)
+    points = rng.uniform(0, 1, (5000, 2)) * [WIDTH, HEIGHT]
+    for index, (x1, y1, x2, y2) in enumerate(segments):
+        near = _point_segment_distance(points, x1, y1, x2, y2) <= CROSSING_DISTANCE
+        for cell in grid.cells(points[near]):
+            assert index in grid.candidates(cell)
+
+
+def test_grid_crossings_match_brute_force():
+    rng = np.random.default_rng(1)
+    for trial in range(20):
+        line_manager = random_line_manager(rng, rng.integers(1, 12))
+        segments = line_manager.geometry.pixels(WIDTH, HEIGHT)
+        # Points on and next to the segments, plus uniform ones and some off the frame
+        t = rng.uniform(0, 1, (600, 1))
+        picks = segments[rng.integers(0, len(segments), 600)]
+        on_lines = picks[:, :2] + t * (picks[:, 2:] - picks[:, :2]) + rng.normal(0, 10, (600, 2))
+        anywhere = rng.uniform(-0.1, 1.1, (400, 2)) * [WIDTH, HEIGHT]
+        centers = np.concatenate([on_lines, anywhere])
+
+        grid_hits = list(line_manager._crossings(centers, WIDTH, HEIGHT))
+        assert grid_hits == brute_force_crossings(segments, centers), f"trial {trial}"
+        assert grid_hits, "the test points should hit some segments"
+
+
+def test_grid_follows_resolution_and_line_changes():
+    rng = np.random.default_rng(2)
+    line_manager = random_line_manager(rng, 4)
+    centers = rng.uniform(0, 1, (2000, 2)) * [640, 360]
+    assert list(line_manager._crossings(centers, 640, 360)) == brute_force_crossings(
+        line_manager.geometry.pixels(640, 360), centers)
+    line_manager.add_line((0, 100), (WIDTH, 100))
+    assert list(line_manager._crossings(centers, 640, 360)) == brute_force_crossings(
+        line_manager.geometry.pixels(640, 360), centers)
@@ -0,0 +1,71 @@
+import numpy as np
+from backend.trajectories import CROSSING_DTYPE, TrajectoryArchive, TrajectoryWriter
+
+
+def write_archive(path, frames):
+    writer = TrajectoryWriter(str(path))
+    for frame_index, tracks in frames:
+        writer.append(frame_index, np.asarray(tracks, dtype=np.float32))
+    writer.close(30, 1280, 720)
+    return TrajectoryArchive(str(path))
+
+
+def box(track_id, x, y, cls=2):
+    return [x - 10, y - 10, x + 10, y + 10, track_id, 0.9, cls]
+
+
+def test_rows_group_each_track_in_frame_order(tmp_path):
+    # Tracks interleaved and out of ID order, one untracked box, track 9 gone for a while
+    frames = [
+        (1, [box(9, 100, 100), box(3, 500, 300), box(-1, 0, 0)]),
+        (2, [box(3, 510, 300), box(9, 110, 100), box(12, 50, 50, cls=5)]),
+        (3, [box(12, 60, 50, cls=5), box(3, 520, 300)]),
+        (7, [box(9, 150, 100)]),
+    ]
+    archive = write_archive(tmp_path / "archive", frames)
+
+    assert len(archive) == 8
+    assert archive.track_ids.tolist() == [3, 9, 12]
+    assert archive.rows(3) == (0, 3) and archive.rows(9) == (3, 6) and archive.rows(12) == (6, 8)
+    assert archive.rows(4) is None and archive.rows(-1) is None and archive.rows(99) is None
+    for track_id in (3, 9, 12):
+        lo, hi = archive.rows(track_id)
+        assert (np.asarray(archive.track[lo:hi]) == track_id).all()
+    frames_9, centers_9 = archive.points(9)
+    assert frames_9.tolist() == [1, 2, 7]
+    assert centers_9.tolist() == [[100, 100], [110, 100], [150, 100]]
+    assert archive.cls[archive.rows(12)[0]] == 5
+    assert archive.w[0] == 20 and archive.h[0] == 20
+
+
+def test_crossings_find_each_step_over_a_segment(tmp_path):
+    # Track 1 goes right across x = 200 and back; track 2 stops short of it; track 3 crosses below its end
+    frames = []
+    for frame_index, x in enumerate([150, 190, 210, 250, 205, 195], start=1):
+        frames.append((frame_index, [box(1, x, 100), box(2, 100 + frame_index, 100), box(3, x, 500)]))
+    archive = write_archive(tmp_path / "archive", frames)
+
+    crossings = archive.crossings([[200, 0, 200, 400]], segment_ids=[7])
+    assert crossings.dtype == np.dtype(CROSSING_DTYPE)
+    # Side is the sign of the cross product with the segment's direction: right of a downward segment is -1
+    assert crossings.tolist() == [(1, 7, 3, -1), (1, 7, 6, 1)]
+
+    # The same answer when every chunk boundary falls inside a track
+    for chunk_rows in (1, 2, 5):
+        assert archive.crossings([[200, 0, 200, 400]], [7], chunk_rows=chunk_rows).tolist() == crossings.tolist()
+
+
+def test_steps_between_tracks_are_not_crossings(tmp_path):
+    # Track 1 ends left of the line and track 2 starts right of it: consecutive rows, different tracks
+    archive = write_archive(tmp_path / "archive", [(1, [box(1, 100, 100), box(2, 300, 100)]),
+                                                   (2, [box(1, 110, 100), box(2, 310, 100)])])
+    assert len(archive.crossings([[200, 0, 200, 400]])) == 0
+
+
+def test_od_matrix_counts_first_and_last_line(tmp_path):
+    frames = [(f, [box(1, 50 + 40 * f, 100), box(2, 650 - 40 * f, 300)]) for f in range(1, 15)]
+    archive = write_archive(tmp_path / "archive", frames)
+    segments = [[200, 0, 200, 400], [400, 0, 400, 400]]
+    lines, matrix = archive.od_matrix(segments, segment_ids=[0, 1])
+    assert lines.tolist() == [0, 1]
+    assert matrix.tolist() == [[0, 1], [1, 0]]